@@ -1,13 +1,21 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 from flask_migrate import Migrate
 import os
+import atexit
 from config.settings import Config
+from config.database import ReplicaRoutingMixin
+
+class RoutingSession(ReplicaRoutingMixin, Session):
+    """
+    Flask-SQLAlchemy session whose reads can be routed to a replica
+    """
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 bcrypt = Bcrypt()
 migrate = Migrate()
@@ -18,14 +26,25 @@ def create_app(config_class=Config):
                 static_folder='../static')
     app.config.from_object(config_class)
     
+    # One pooled, tuned engine for the Flask app and the FastAPI routes
+    from config.database import engine_options, configure_engine, configure_replicas
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    
     # Initialize Flask extensions
     db.init_app(app)
+    with app.app_context():
+        configure_engine(db.engine)
+    configure_replicas(app.config.get('DATABASE_REPLICA_URLS', []))
     bcrypt.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message_category = 'info'
     migrate.init_app(app, db)
     
+    # Read-only views read from replicas; clients that just wrote read from the primary
+    from app.utils.replicas import init_read_routing
+    init_read_routing(app)
+    
     # Register blueprints
     from app.controllers.auth_controller import auth_bp
     from app.controllers.payment_controller import payment_bp
@@ -35,6 +54,27 @@ def create_app(config_class=Config):
     app.register_blueprint(payment_bp)
     app.register_blueprint(admin_bp)
     
+    # Register CLI commands
+    from app.cli import register_commands
+    register_commands(app)
+    
+    # Restore velocity counters and save them again on shutdown
+    from app.services.velocity import velocity_store
+    velocity_store.load_snapshot()
+    atexit.register(velocity_store.save_snapshot)
+    
+    # Load the pre-trained fraud model once and keep it fresh in the background
+    from app.services.fraud_model import global_fraud_model
+    try:
+        global_fraud_model.load_latest()
+    except Exception as e:
+        print(f"Could not load fraud model: {e}")
+    global_fraud_model.start_retraining(app)
+    
+    # Start fraud scoring workers (if the pool is enabled) so early payments don't meet cold ones
+    from app.services.fraud_scoring_pool import fraud_scoring_pool
+    fraud_scoring_pool.warm()
+    
     # Create database tables
     with app.app_context():
         db.create_all()
@@ -43,6 +83,20 @@ def create_app(config_class=Config):
         from app.controllers.admin_controller import setup_admin
         setup_admin(app)
         
+        # Lease a worker id for reference numbers and hand it back on shutdown
+        from app.services.reference import reference_generator
+        reference_generator.start(app)
+        atexit.register(reference_generator.release)
+        
+        # Write single-commit payments interrupted by a crash
+        from app.services.payment_journal import payment_journal
+        try:
+            recovered = payment_journal.recover()
+            if recovered:
+                print(f"Recovered {recovered} journaled payments as pending")
+        except Exception as e:
+            print(f"Payment journal recovery error: {e}")
+        
         # Initialize demo data if needed
         from app.utils.init_data import create_initial_data
         create_initial_data()
@@ -0,0 +1,270 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('rebuild-feature-store')
+@click.option('--batch-size', default=5000, show_default=True, help='Transactions read per page.')
+@with_appcontext
+def rebuild_feature_store_command(batch_size):
+    """Rebuild per-user fraud features from the transactions table."""
+    from app.services.feature_store import FeatureStore
+
+    result = FeatureStore.rebuild(batch_size=batch_size)
+    click.echo(f"Rebuilt {result['profiles']} feature profiles from {result['transactions']} transactions")
+
+
+@click.command('backtest')
+@click.option('--source', default='db', show_default=True, help="'db' for the transactions table, or a path to an NDJSON file.")
+@click.option('--workers', default=1, show_default=True, help='Processes to partition users across.')
+@click.option('--thresholds', default=None, help='Comma separated thresholds to evaluate. Defaults to FRAUD_DETECTION_THRESHOLD.')
+@click.option('--anomaly-weight', type=float, default=None, help='Anomaly share of the anomaly/rule blend. Defaults to FRAUD_ANOMALY_WEIGHT.')
+@click.option('--since', type=click.DateTime(), default=None, help='Only replay transactions at or after this time.')
+@click.option('--until', type=click.DateTime(), default=None, help='Only replay transactions before this time.')
+@click.option('--limit', type=int, default=None, help='Stop after this many transactions.')
+@click.option('--global-model', 'use_global_model', is_flag=True, help='Score with the latest global model artifact.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the report as JSON.')
+@with_appcontext
+def backtest_command(source, workers, thresholds, anomaly_weight, since, until, limit, use_global_model, as_json):
+    """Replay historical transactions through the fraud scorer."""
+    import json
+    from app.services.backtest import run_backtest, stream_database, stream_ndjson, load_active_rules
+
+    if source == 'db':
+        events = stream_database(since=since, until=until, limit=limit)
+    else:
+        events = stream_ndjson(source, limit=limit)
+
+    try:
+        rules = load_active_rules()
+    except Exception as e:
+        click.echo(f"Could not load fraud rules, replaying without them: {e}", err=True)
+        rules = []
+
+    threshold_values = [float(t) for t in thresholds.split(',')] if thresholds else None
+    report = run_backtest(events, rules=rules, thresholds=threshold_values,
+                          anomaly_weight=anomaly_weight, workers=workers, use_global_model=use_global_model)
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    click.echo(f"Transactions: {report['transactions']} in {report['elapsed_seconds']:.2f}s "
+               f"({report['throughput_tps']:,.0f} tx/s)")
+    click.echo(f"Latency: p50={report['latency_ms']['p50']:.3f}ms p99={report['latency_ms']['p99']:.3f}ms")
+    for m in report['metrics']:
+        click.echo(f"Threshold {m['threshold']:g}: TP={m['true_positives']} FP={m['false_positives']} "
+                   f"TN={m['true_negatives']} FN={m['false_negatives']} precision={m['precision']:.3f} "
+                   f"recall={m['recall']:.3f} f1={m['f1']:.3f}")
+
+
+@click.command('train-fraud-model')
+@click.option('--max-samples', type=int, default=None, help='Reservoir sample size. Defaults to FRAUD_MODEL_MAX_TRAINING_SAMPLES.')
+@with_appcontext
+def train_fraud_model_command(max_samples):
+    """Train the global fraud model and publish it as the latest artifact."""
+    from flask import current_app
+    from app.services.fraud_model import global_fraud_model
+
+    version = global_fraud_model.retrain(current_app._get_current_object(), max_samples=max_samples)
+    info = global_fraud_model.info()
+    click.echo(f"Trained fraud model {version} on {info['sampled_rows']} of {info['training_rows']} transactions")
+
+
+@click.command('recover-payments')
+@with_appcontext
+def recover_payments_command():
+    """Write payments left in the journals of exited processes as 'pending'."""
+    from app.services.payment_journal import payment_journal
+
+    recovered = payment_journal.recover()
+    click.echo(f"Recovered {recovered} payments from {payment_journal.directory}")
+
+
+@click.command('reconcile-refunds')
+@click.option('--older-than', type=int, default=None, help='Only refunds pending this many seconds. Defaults to REFUND_RECONCILE_AFTER_SECONDS.')
+@with_appcontext
+def reconcile_refunds_command(older_than):
+    """Settle refunds left pending by an acquirer timeout or error."""
+    from app.services.payment_gateway import PaymentGateway
+
+    report = PaymentGateway.reconcile_pending_refunds(older_than)
+    click.echo(f"Checked {report['checked']} pending refunds: {report['completed']} completed, "
+               f"{report['failed']} failed, {report['pending']} still pending")
+
+
+@click.command('reconcile-payments')
+@click.option('--older-than', type=int, default=None, help='Only payments pending this many seconds. Defaults to PAYMENT_RECONCILE_AFTER_SECONDS.')
+@with_appcontext
+def reconcile_payments_command(older_than):
+    """Confirm or void payments left pending by an acquirer timeout or error."""
+    from app.services.payment_gateway import PaymentGateway
+
+    report = PaymentGateway.reconcile_pending_payments(older_than)
+    click.echo(f"Checked {report['checked']} pending payments: {report['completed']} completed, "
+               f"{report['failed']} failed, {report['pending']} still pending")
+
+
+@click.command('purge-idempotency-keys')
+@with_appcontext
+def purge_idempotency_keys_command():
+    """Delete idempotency keys past their TTL."""
+    from app.services.idempotency import idempotency_store
+
+    deleted = idempotency_store.purge_expired()
+    click.echo(f"Deleted {deleted} expired idempotency keys")
+
+
+@click.command('settle')
+@click.option('--window-start', type=click.DateTime(), default=None, help='Start of the window to settle. Defaults to the last closed window.')
+@click.option('--chunk-size', type=int, default=None, help='Rows per commit. Defaults to SETTLEMENT_CHUNK_SIZE.')
+@click.option('--limit', type=int, default=None, help='Stop after about this many rows; run again to resume.')
+@with_appcontext
+def settle_command(window_start, chunk_size, limit):
+    """Settle completed payments and refunds into merchant payout batches."""
+    from app.services.settlement import SettlementEngine
+
+    report = SettlementEngine(chunk_size=chunk_size).settle(window_start, limit=limit)
+    click.echo(f"Window {report['window_start']} - {report['window_end']}: {report['status']}"
+               f"{' (resumed)' if report['resumed'] else ''}")
+    click.echo(f"Settled {report['rows']} rows into {report['batches']} batches in {report['elapsed_seconds']:.2f}s "
+               f"({report['rows_per_second']:,.0f} rows/s)")
+
+
+@click.command('backfill-refund-ledger')
+@click.option('--batch-size', default=5000, show_default=True, help='Refunds linked per commit.')
+@with_appcontext
+def backfill_refund_ledger_command(batch_size):
+    """Link refunds made before the refund ledger to their payments and rebuild refunded totals."""
+    from app import db
+    from app.models.transaction import Transaction
+
+    prefix = 'Refund for transaction '
+    linked = 0
+    last_id = ''
+    while True:
+        # Older refunds only name their payment's reference in the description
+        refunds = (Transaction.query
+                   .filter(Transaction.transaction_type == 'refund',
+                           Transaction.original_transaction_id.is_(None),
+                           Transaction.id > last_id)
+                   .order_by(Transaction.id).limit(batch_size).all())
+        if not refunds:
+            break
+        references = {r.id: (r.description or '')[len(prefix):].split(':', 1)[0].strip() for r in refunds}
+        payment_ids = dict(db.session.query(Transaction.reference_number, Transaction.id)
+                           .filter(Transaction.reference_number.in_(set(references.values()))).all())
+        for refund in refunds:
+            refund.original_transaction_id = payment_ids.get(references[refund.id])
+            linked += refund.original_transaction_id is not None
+        last_id = refunds[-1].id
+        db.session.commit()
+
+    refunds = Transaction.__table__.alias('refunds')
+    payments = Transaction.__table__
+    totals = db.select(db.func.coalesce(db.func.sum(refunds.c.amount), 0.0)).where(
+        refunds.c.original_transaction_id == payments.c.id,
+        refunds.c.transaction_type == 'refund',
+        refunds.c.status.in_(('pending', 'completed'))
+    ).scalar_subquery()
+    db.session.execute(payments.update().where(payments.c.transaction_type == 'payment').values(refunded_total=totals))
+    db.session.commit()
+    click.echo(f"Linked {linked} refunds and rebuilt refunded totals")
+
+
+@click.command('reconcile-stats')
+@click.option('--fix', is_flag=True, help='Correct drifting counters from the transactions table.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the report as JSON.')
+@with_appcontext
+def reconcile_stats_command(fix, as_json):
+    """Compare the dashboard counters with the transactions table."""
+    import json
+    from app.services.transaction_stats import transaction_stats
+
+    report = transaction_stats.reconcile(fix=fix)
+    if as_json:
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    for entry in report['drift']:
+        click.echo(f"{entry['granularity']} {entry['bucket_start']} {entry['status']}: "
+                   f"counted {entry['actual']}, table has {entry['expected']}")
+    click.echo(f"{report['drifted']} of {report['counters']} counters drifted"
+               + (", rebuilt" if report['fixed'] else ""))
+
+
+@click.command('archive-transactions')
+@click.option('--older-than-days', type=int, default=None, help='Archive transactions older than this. Defaults to ARCHIVE_AFTER_DAYS.')
+@click.option('--batch-size', type=int, default=None, help='Rows per file and commit. Defaults to ARCHIVE_BATCH_SIZE.')
+@click.option('--limit', type=int, default=None, help='Stop after archiving this many transactions.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the report as JSON.')
+@with_appcontext
+def archive_transactions_command(older_than_days, batch_size, limit, as_json):
+    """Move old, final transactions from the transactions table to monthly Parquet files."""
+    import json
+    from app.services.archive import transaction_archive
+
+    report = transaction_archive.archive(older_than_days=older_than_days, batch_size=batch_size, limit=limit)
+    if as_json:
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    before, after = report['before'], report['after']
+    click.echo(f"Archived {report['archived']} transactions created before {report['cutoff']} into "
+               f"{report['files']} files in {report['elapsed_seconds']:.2f}s"
+               + (f"; {report['changed']} changed meanwhile and stay in the table" if report['changed'] else ""))
+    click.echo(f"transactions table: {before['transactions_rows']} -> {after['transactions_rows']} rows")
+    if before['transactions_bytes'] and after['transactions_bytes'] is not None:
+        saved = 1 - after['transactions_bytes'] / before['transactions_bytes']
+        click.echo(f"transactions table and indexes: {before['transactions_bytes']:,} -> "
+                   f"{after['transactions_bytes']:,} bytes ({saved:.0%} smaller)")
+    click.echo(f"archive: {after['archive_bytes']:,} bytes of files, {after['index_rows']} indexed transactions"
+               + (f" ({after['index_bytes']:,} bytes)" if after['index_bytes'] is not None else ""))
+    latency = report['read_latency_ms']
+    if latency:
+        click.echo(f"archive reads by reference: p50={latency['p50']:.2f}ms p99={latency['p99']:.2f}ms "
+                   f"over {latency['samples']} lookups")
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(['transactions', 'payments']))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the output with gzip.')
+@click.option('--merchant-id', default=None)
+@click.option('--user-id', default=None)
+@click.option('--status', default=None)
+@click.option('--start', type=click.DateTime(), default=None, help='Created on or after this time.')
+@click.option('--end', type=click.DateTime(), default=None, help='Created before this time.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), default='-',
+              help='File to write to. Defaults to stdout.')
+@with_appcontext
+def export_command(kind, fmt, compress, merchant_id, user_id, status, start, end, output):
+    """Export every matching transaction or payment as CSV or NDJSON, streamed from the database."""
+    import time
+    from app.services.export import export_service
+
+    started = time.perf_counter()
+    written = 0
+    with click.open_file(output, 'wb') as f:
+        for chunk in export_service.export(kind, fmt, compress, user_id=user_id, merchant_id=merchant_id,
+                                           start=start, end=end, status=status):
+            f.write(chunk)
+            written += len(chunk)
+    click.echo(f"Exported {kind} ({written:,} bytes) in {time.perf_counter() - started:.2f}s", err=True)
+
+
+def register_commands(app):
+    """
+    Register the maintenance commands on the Flask CLI
+    """
+    app.cli.add_command(rebuild_feature_store_command)
+    app.cli.add_command(backtest_command)
+    app.cli.add_command(train_fraud_model_command)
+    app.cli.add_command(recover_payments_command)
+    app.cli.add_command(reconcile_refunds_command)
+    app.cli.add_command(reconcile_payments_command)
+    app.cli.add_command(purge_idempotency_keys_command)
+    app.cli.add_command(settle_command)
+    app.cli.add_command(backfill_refund_ledger_command)
+    app.cli.add_command(reconcile_stats_command)
+    app.cli.add_command(archive_transactions_command)
+    app.cli.add_command(export_command)
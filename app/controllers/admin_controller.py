@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any
 from app.models.user import User
 from app.models.merchant import Merchant
 from app.models.transaction import Transaction
+from app.services.export import export_service
 from app.services.security import check_admin_permissions
+from app.services.transaction_stats import transaction_stats
 from app.utils.logging import log_activity
-from config.database import get_db
+from app.utils.pagination import keyset_page, keyset_stream, ndjson_lines
+from config.database import pool_stats, replica_engines
+from config.dependencies import get_db, get_read_db
+from config.settings import Config
 from datetime import datetime, timedelta
 
 router = APIRouter(
@@ -17,7 +23,7 @@ router = APIRouter(
 )
 
 @router.get("/dashboard", response_model=Dict[str, Any])
-async def get_dashboard_data(db: Session = Depends(get_db)):
+async def get_dashboard_data(db: Session = Depends(get_read_db)):
     """
     Get admin dashboard data
     """
@@ -25,17 +31,15 @@ async def get_dashboard_data(db: Session = Depends(get_db)):
     one_day_ago = now - timedelta(days=1)
     one_week_ago = now - timedelta(days=7)
     
-    # Get transaction statistics
-    total_transactions = db.query(Transaction).count()
-    transactions_today = db.query(Transaction).filter(Transaction.created_at >= one_day_ago).count()
-    transactions_week = db.query(Transaction).filter(Transaction.created_at >= one_week_ago).count()
+    # Get transaction statistics from the maintained counters
+    by_status = transaction_stats.by_status(session=db)
+    total_transactions = sum(by_status.values())
+    transactions_today = transaction_stats.count(since=one_day_ago, session=db)
+    transactions_week = transaction_stats.count(since=one_week_ago, session=db)
     
     # Get fraud statistics
-    flagged_transactions = db.query(Transaction).filter(Transaction.status == "flagged_for_fraud").count()
-    flagged_today = db.query(Transaction).filter(
-        Transaction.status == "flagged_for_fraud",
-        Transaction.created_at >= one_day_ago
-    ).count()
+    flagged_transactions = by_status.get("flagged_for_fraud", 0)
+    flagged_today = transaction_stats.count(status="flagged_for_fraud", since=one_day_ago, session=db)
     
     # Get user statistics
     total_users = db.query(User).count()
@@ -49,7 +53,8 @@ async def get_dashboard_data(db: Session = Depends(get_db)):
         "transactions": {
             "total": total_transactions,
             "today": transactions_today,
-            "week": transactions_week
+            "week": transactions_week,
+            "by_status": by_status
         },
         "fraud": {
             "total_flagged": flagged_transactions,
@@ -70,7 +75,7 @@ async def get_dashboard_data(db: Session = Depends(get_db)):
 async def get_all_users(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Get all users with pagination
@@ -82,7 +87,7 @@ async def get_all_users(
 async def get_all_merchants(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Get all merchants with pagination
@@ -92,20 +97,34 @@ async def get_all_merchants(
 
 @router.get("/transactions", response_model=List[Dict[str, Any]])
 async def get_all_transactions(
-    skip: int = 0,
+    response: Response,
+    cursor: str = None,
     limit: int = 100,
     status: str = None,
-    db: Session = Depends(get_db)
+    stream: bool = False,
+    db: Session = Depends(get_read_db)
 ):
     """
-    Get all transactions with filters and pagination
+    Get transactions newest first, one page at a time.
+    Pass a page's X-Next-Cursor header as `cursor` to get the next one;
+    with `stream` every matching transaction is sent as NDJSON instead.
     """
     query = db.query(Transaction)
     
     if status:
         query = query.filter(Transaction.status == status)
     
-    transactions = query.offset(skip).limit(limit).all()
+    try:
+        if stream:
+            pages = keyset_stream(query, Transaction, cursor, Config.TRANSACTION_STREAM_BATCH_SIZE)
+            return StreamingResponse(ndjson_lines(pages), media_type="application/x-ndjson")
+        transactions, next_cursor = keyset_page(query, Transaction, cursor,
+                                                max(1, min(limit, Config.TRANSACTION_PAGE_MAX)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return [transaction.to_dict() for transaction in transactions]
 
 @router.put("/users/{user_id}", response_model=Dict[str, Any])
@@ -184,4 +203,40 @@ async def get_system_logs(
         }
     ]
     
-    return logs
\ No newline at end of file
+    return logs
+
+@router.get("/export/{kind}")
+async def export_rows(
+    kind: str,
+    format: str = "csv",
+    gzip: bool = False,
+    merchant_id: str = None,
+    user_id: str = None,
+    status: str = None,
+    start: datetime = None,
+    end: datetime = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Export every matching transaction or payment (`kind`) as CSV or NDJSON,
+    optionally gzipped, streamed from a server-side cursor
+    """
+    try:
+        chunks = export_service.export(kind, format, gzip, user_id=user_id, merchant_id=merchant_id,
+                                       start=start, end=end, status=status, bind=db.get_bind())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = export_service.filename(kind, format, gzip)
+    return StreamingResponse(chunks, media_type=export_service.media_type(format, gzip),
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@router.get("/db/pool", response_model=Dict[str, Any])
+async def get_db_pool_stats():
+    """
+    Get connection pool gauges and checkout wait times, for the primary and each replica
+    """
+    stats = pool_stats()
+    stats["replicas"] = [dict(pool_stats(engine), url=engine.url.render_as_string(hide_password=True))
+                         for engine in replica_engines()]
+    return stats
@@ -1,12 +1,15 @@
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any
 from app.models.transaction import Transaction
 from app.services.fraud_detection import FraudDetectionService
+from app.services.state_machine import transaction_states, TransitionError, TransitionConflictError, IllegalTransitionError
 from app.utils.logging import log_activity
-from config.database import get_db
-from datetime import datetime
+from app.utils.pagination import keyset_page, keyset_stream, ndjson_lines
+from config.dependencies import get_db, get_read_db
+from config.settings import Config
 
 router = APIRouter(
     prefix="/fraud",
@@ -32,11 +35,12 @@ async def check_transaction(
     if result["is_fraud"]:
         # Update transaction status if it exists in the database
         if "id" in transaction_data:
-            transaction = db.query(Transaction).filter(Transaction.id == transaction_data["id"]).first()
-            if transaction:
-                transaction.status = "flagged_for_fraud"
-                transaction.updated_at = datetime.utcnow()
+            try:
+                transaction_states.transition(transaction_data["id"], "flagged_for_fraud", session=db)
                 db.commit()
+            except TransitionError:
+                # Unknown, or already past the point where it can be flagged
+                db.rollback()
         
         log_activity("fraud_detected", f"Fraud detected in transaction: {transaction_data.get('id', 'new')}")
     
@@ -44,40 +48,93 @@ async def check_transaction(
 
 @router.get("/flagged", response_model=List[Dict[str, Any]])
 async def get_flagged_transactions(
-    db: Session = Depends(get_db)
+    response: Response,
+    cursor: str = None,
+    limit: int = 100,
+    stream: bool = False,
+    db: Session = Depends(get_read_db)
 ):
     """
-    Get all transactions flagged for fraud
+    Get transactions flagged for fraud newest first, one page at a time.
+    Pass a page's X-Next-Cursor header as `cursor` to get the next one;
+    with `stream` every flagged transaction is sent as NDJSON instead.
     """
-    transactions = db.query(Transaction).filter(Transaction.status == "flagged_for_fraud").all()
+    query = db.query(Transaction).filter(Transaction.status == "flagged_for_fraud")
+    
+    try:
+        if stream:
+            pages = keyset_stream(query, Transaction, cursor, Config.TRANSACTION_STREAM_BATCH_SIZE)
+            return StreamingResponse(ndjson_lines(pages), media_type="application/x-ndjson")
+        transactions, next_cursor = keyset_page(query, Transaction, cursor,
+                                                max(1, min(limit, Config.TRANSACTION_PAGE_MAX)))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return [transaction.to_dict() for transaction in transactions]
 
 @router.post("/{transaction_id}/review", response_model=Dict[str, Any])
 async def review_transaction(
-    transaction_id: int,
+    transaction_id: str,
     review_data: Dict[str, Any],
     db: Session = Depends(get_db)
 ):
     """
-    Review a flagged transaction and update its status
+    Review a flagged transaction and update its status.
+    Pass the `version` the reviewer saw to reject the change if the
+    transaction moved on since; a 409 means reload and review again.
     """
-    transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
-    if not transaction:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Transaction with ID {transaction_id} not found"
-        )
+    new_status = review_data.get("status")
+    if not new_status:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="status is required")
     
-    # Update transaction status based on review
-    new_status = review_data.get("status", "flagged_for_fraud")
-    transaction.status = new_status
-    transaction.updated_at = datetime.utcnow()
-    db.commit()
+    try:
+        transaction_states.transition(transaction_id, new_status, expected_version=review_data.get("version"), session=db)
+        db.commit()
+    except TransitionConflictError as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail={"message": str(e), "retryable": True})
+    except IllegalTransitionError as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={"message": str(e), "retryable": False})
+    except TransitionError as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     
     log_activity("fraud_review", f"Transaction {transaction_id} reviewed. New status: {new_status}")
     
+    transaction = db.get(Transaction, transaction_id)
     return {"message": "Transaction updated successfully", "transaction": transaction.to_dict()}
 
+@router.get("/model", response_model=Dict[str, Any])
+async def get_global_model_info():
+    """
+    Get the version and training metadata of the global fraud model
+    """
+    return fraud_service.get_global_model_info()
+
+@router.get("/model-cache", response_model=Dict[str, Any])
+async def get_model_cache_stats():
+    """
+    Get anomaly model cache hit rate and refit counters
+    """
+    return fraud_service.get_model_cache_stats()
+
+@router.get("/scoring-pool", response_model=Dict[str, Any])
+async def get_scoring_pool_stats():
+    """
+    Get fraud scoring pool size, queue depth and timeout counters
+    """
+    return fraud_service.get_scoring_pool_stats()
+
+@router.get("/velocity", response_model=Dict[str, Any])
+async def get_velocity_stats():
+    """
+    Get velocity counter key counts and evictions
+    """
+    return fraud_service.get_velocity_stats()
+
 @router.get("/rules", response_model=List[Dict[str, Any]])
 async def get_fraud_rules():
     """
@@ -91,6 +148,11 @@ async def add_fraud_rule(rule_data: Dict[str, Any]):
     Add a new fraud detection rule
     """
     result = fraud_service.add_rule(rule_data)
+    if not result["success"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=result["message"]
+        )
     log_activity("fraud_rule_added", f"New fraud rule added: {rule_data.get('name')}")
     return result
 
@@ -100,5 +162,10 @@ async def delete_fraud_rule(rule_id: str):
     Delete a fraud detection rule
     """
     result = fraud_service.delete_rule(rule_id)
+    if not result["success"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=result["message"]
+        )
     log_activity("fraud_rule_deleted", f"Fraud rule deleted: {rule_id}")
     return result
\ No newline at end of file
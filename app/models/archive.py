@@ -0,0 +1,39 @@
+from app import db
+from datetime import datetime
+
+
+class ArchiveFile(db.Model):
+    """
+    A Parquet file of archived transactions, all created in one month
+    (see app.services.archive)
+    """
+    __tablename__ = 'archive_files'
+
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(100), unique=True, nullable=False)  # relative to ARCHIVE_DIR, month=YYYY-MM/part-<id>.parquet
+    month = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    row_count = db.Column(db.Integer, nullable=False)
+    min_created_at = db.Column(db.DateTime, nullable=False)
+    max_created_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"ArchiveFile('{self.path}', {self.row_count} rows)"
+
+
+class ArchivedTransaction(db.Model):
+    """
+    Which archive file and row group an archived transaction is in, by id
+    and by reference number. The row itself is only in the file.
+    """
+    __tablename__ = 'archived_transactions'
+
+    id = db.Column(db.String(36), primary_key=True)
+    reference_number = db.Column(db.String(20), unique=True, nullable=False)
+    file_id = db.Column(db.Integer, db.ForeignKey('archive_files.id'), nullable=False)
+    row_group = db.Column(db.SmallInteger, nullable=False)
+
+    file = db.relationship('ArchiveFile', lazy='joined')
+
+    def __repr__(self):
+        return f"ArchivedTransaction('{self.reference_number}', file {self.file_id})"
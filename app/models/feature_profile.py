@@ -0,0 +1,88 @@
+from app import db
+from datetime import datetime
+
+class UserFeatureProfile(db.Model):
+    __tablename__ = 'user_feature_profiles'
+
+    # Number of recent [amount, hour, day_of_week] rows kept for the anomaly model
+    RECENT_LIMIT = 20
+
+    # Everything record() maintains (copied by FeatureStore.rebuild() and preview_profile())
+    FEATURE_COLUMNS = ('transaction_count', 'amount_mean', 'amount_m2', 'hour_histogram', 'weekday_histogram',
+                       'recent_features', 'first_seen_at', 'last_seen_at')
+
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), primary_key=True)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Running amount statistics (Welford's algorithm)
+    amount_mean = db.Column(db.Float, nullable=False, default=0.0)
+    amount_m2 = db.Column(db.Float, nullable=False, default=0.0)
+
+    # Histograms of transaction hour (24 buckets) and weekday (7 buckets)
+    hour_histogram = db.Column(db.JSON, nullable=False, default=lambda: [0] * 24)
+    weekday_histogram = db.Column(db.JSON, nullable=False, default=lambda: [0] * 7)
+
+    # Most recent feature rows, newest first
+    recent_features = db.Column(db.JSON, nullable=False, default=list)
+
+    first_seen_at = db.Column(db.DateTime, nullable=True)
+    last_seen_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.transaction_count = 0
+        self.amount_mean = 0.0
+        self.amount_m2 = 0.0
+        self.hour_histogram = [0] * 24
+        self.weekday_histogram = [0] * 7
+        self.recent_features = []
+
+    def record(self, amount, created_at):
+        """Fold one transaction into the profile in constant time"""
+        self.transaction_count += 1
+        delta = amount - self.amount_mean
+        self.amount_mean += delta / self.transaction_count
+        self.amount_m2 += delta * (amount - self.amount_mean)
+
+        # JSON columns only detect reassignment, so build new lists
+        hour_histogram = list(self.hour_histogram)
+        hour_histogram[created_at.hour] += 1
+        self.hour_histogram = hour_histogram
+
+        weekday_histogram = list(self.weekday_histogram)
+        weekday_histogram[created_at.weekday()] += 1
+        self.weekday_histogram = weekday_histogram
+
+        row = [amount, created_at.hour, created_at.weekday()]
+        self.recent_features = [row] + list(self.recent_features)[:self.RECENT_LIMIT - 1]
+
+        if self.first_seen_at is None or created_at < self.first_seen_at:
+            self.first_seen_at = created_at
+        if self.last_seen_at is None or created_at > self.last_seen_at:
+            self.last_seen_at = created_at
+
+    @property
+    def amount_variance(self):
+        if self.transaction_count < 2:
+            return 0.0
+        return self.amount_m2 / (self.transaction_count - 1)
+
+    def training_rows(self):
+        """Return the recent feature rows used to fit the anomaly model"""
+        return [list(row) for row in self.recent_features]
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'transaction_count': self.transaction_count,
+            'amount_mean': self.amount_mean,
+            'amount_variance': self.amount_variance,
+            'hour_histogram': self.hour_histogram,
+            'weekday_histogram': self.weekday_histogram,
+            'first_seen_at': self.first_seen_at.isoformat() if self.first_seen_at else None,
+            'last_seen_at': self.last_seen_at.isoformat() if self.last_seen_at else None
+        }
+
+    def __repr__(self):
+        return f"UserFeatureProfile('{self.user_id}', {self.transaction_count} transactions)"
@@ -0,0 +1,38 @@
+from app import db
+from datetime import datetime
+import uuid
+
+class FraudRule(db.Model):
+    __tablename__ = 'fraud_rules'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+
+    # Predicate: <field> <operator> <value>, e.g. amount gt 1000
+    field = db.Column(db.String(30), nullable=False)
+    operator = db.Column(db.String(10), nullable=False)  # gt, gte, lt, lte, eq, ne, in, not_in
+    value = db.Column(db.JSON, nullable=False)
+
+    # Points added to the rule-based fraud score when the predicate matches
+    score = db.Column(db.Float, nullable=False)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'field': self.field,
+            'operator': self.operator,
+            'value': self.value,
+            'score': self.score,
+            'is_active': self.is_active,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    def __repr__(self):
+        return f"FraudRule('{self.name}', '{self.field} {self.operator} {self.value}')"
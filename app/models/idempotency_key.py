@@ -0,0 +1,22 @@
+from app import db
+from datetime import datetime
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+
+    # Operation the key belongs to, e.g. payment:<user id> or refund
+    scope = db.Column(db.String(100), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+
+    # SHA-256 of the request, so a key reused with other parameters is rejected
+    request_hash = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, completed
+    response = db.Column(db.JSON, nullable=True)
+
+    # An in-progress claim older than this belongs to a process that died
+    locked_until = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"IdempotencyKey('{self.scope}', '{self.key}', '{self.status}')"
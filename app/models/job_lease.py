@@ -0,0 +1,19 @@
+from app import db
+from datetime import datetime
+
+class JobLease(db.Model):
+    __tablename__ = 'job_leases'
+
+    # Name of the background job only one process may run at a time
+    name = db.Column(db.String(64), primary_key=True)
+
+    # Random token of the process holding the lease
+    owner = db.Column(db.String(32), nullable=False)
+    hostname = db.Column(db.String(255), nullable=True)
+    pid = db.Column(db.Integer, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"JobLease('{self.name}', '{self.hostname}:{self.pid}', expires {self.expires_at})"
@@ -1,5 +1,5 @@
 from datetime import datetime
-from config.database import db
+from app import db
 from app.utils.encryption import encrypt_data, decrypt_data
 import uuid
 
@@ -7,10 +7,11 @@ class Payment(db.Model):
     __tablename__ = 'payments'
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    transaction_id = db.Column(db.String(36), db.ForeignKey('transactions.id'), nullable=False)
+    transaction_id = db.Column(db.String(36), db.ForeignKey('transactions.id'), nullable=False, index=True)
     amount = db.Column(db.Float, nullable=False)
     currency = db.Column(db.String(3), nullable=False, default='USD')
     status = db.Column(db.String(20), nullable=False, default='pending')  # pending, completed, failed, refunded
+    version = db.Column(db.Integer, nullable=False, default=1)  # bumped by every status transition
     payment_method = db.Column(db.String(50), nullable=False)
     card_number_encrypted = db.Column(db.Text, nullable=True)
     card_expiry_encrypted = db.Column(db.Text, nullable=True)
@@ -55,9 +56,9 @@ class Payment(db.Model):
         return None
     
     def update_status(self, new_status):
-        """Update payment status and last_updated timestamp"""
-        self.status = new_status
-        self.last_updated = datetime.utcnow()
+        """Move the payment to a new status; raises TransitionError if another writer got there first or the move is illegal"""
+        from app.services.state_machine import payment_states
+        payment_states.apply(self, new_status, last_updated=datetime.utcnow())
         
     def process_refund(self, refund_amount=None, notes=None):
         """Process a refund for this payment"""
@@ -73,12 +74,14 @@ class Payment(db.Model):
             return False, "Refund amount cannot exceed original payment amount"
         
         # Generate a refund ID and update status
-        self.refund_id = str(uuid.uuid4())
-        self.status = 'refunded'
-        self.last_updated = datetime.utcnow()
-        
+        from app.services.state_machine import payment_states, TransitionError
+        values = {'refund_id': str(uuid.uuid4()), 'last_updated': datetime.utcnow()}
         if notes:
-            self.notes = notes
+            values['notes'] = notes
+        try:
+            payment_states.apply(self, 'refunded', **values)
+        except TransitionError as e:
+            return False, str(e)
             
         return True, {"refund_id": self.refund_id, "amount": refund_amount}
     
@@ -0,0 +1,73 @@
+from app import db
+from datetime import datetime
+import uuid
+
+class SettlementBatch(db.Model):
+    __tablename__ = 'settlement_batches'
+    __table_args__ = (
+        db.UniqueConstraint('merchant_id', 'currency', 'window_start', name='uq_settlement_batch_window'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    run_id = db.Column(db.String(36), db.ForeignKey('settlement_runs.id'), nullable=False, index=True)
+    merchant_id = db.Column(db.String(36), db.ForeignKey('merchants.id'), nullable=False)
+    currency = db.Column(db.String(3), nullable=False)
+    window_start = db.Column(db.DateTime, nullable=False)
+    window_end = db.Column(db.DateTime, nullable=False)
+
+    # Totals in minor units (cents), so sums are exact
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+    payment_total = db.Column(db.BigInteger, nullable=False, default=0)
+    refund_count = db.Column(db.Integer, nullable=False, default=0)
+    refund_total = db.Column(db.BigInteger, nullable=False, default=0)
+
+    status = db.Column(db.String(20), nullable=False, default='open')  # open, closed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    closed_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def net_amount(self):
+        return (self.payment_total - self.refund_total) / 100
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'merchant_id': self.merchant_id,
+            'currency': self.currency,
+            'window_start': self.window_start.isoformat(),
+            'window_end': self.window_end.isoformat(),
+            'payment_count': self.payment_count,
+            'payment_total': self.payment_total / 100,
+            'refund_count': self.refund_count,
+            'refund_total': self.refund_total / 100,
+            'net_amount': self.net_amount,
+            'status': self.status
+        }
+
+    def __repr__(self):
+        return f"SettlementBatch('{self.merchant_id}', {self.window_start}, {self.net_amount} {self.currency})"
+
+
+class SettlementRun(db.Model):
+    __tablename__ = 'settlement_runs'
+    __table_args__ = (
+        db.UniqueConstraint('window_start', 'window_end', name='uq_settlement_run_window'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    window_start = db.Column(db.DateTime, nullable=False)
+    window_end = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='running')  # running, completed
+
+    # Sort key (created_at, id) of the last committed row, to resume from
+    checkpoint_created_at = db.Column(db.DateTime, nullable=True)
+    checkpoint_transaction_id = db.Column(db.String(36), nullable=True)
+
+    rows_processed = db.Column(db.BigInteger, nullable=False, default=0)
+    batches_created = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"SettlementRun({self.window_start} - {self.window_end}, '{self.status}', {self.rows_processed} rows)"
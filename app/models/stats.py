@@ -0,0 +1,23 @@
+from app import db
+from datetime import datetime
+
+# bucket_start of the all-time counters
+ALL_TIME = datetime(1970, 1, 1)
+
+
+class TransactionCounter(db.Model):
+    """
+    Number of transactions created in a bucket that are now in a status.
+    A counter is split over a few shards so concurrent writers rarely
+    update the same row; its value is the sum over shards.
+    """
+    __tablename__ = 'transaction_counters'
+
+    granularity = db.Column(db.String(5), primary_key=True)  # hour, day, all
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, default=0)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"TransactionCounter({self.granularity} {self.bucket_start}, '{self.status}', {self.count})"
@@ -1,9 +1,19 @@
 from app import db
+from app.models.settlement import SettlementBatch  # noqa: F401 - table for the settlement_batch_id foreign key
 from datetime import datetime
 import uuid
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # A user's or merchant's history, newest first (dashboards, fraud history, profile rebuilds)
+        db.Index('ix_transactions_user_id_created_at', 'user_id', 'created_at', 'id'),
+        db.Index('ix_transactions_merchant_id_created_at', 'merchant_id', 'created_at'),
+        # Status queues and counts (flagged for review, admin filters), paged by (created_at, id)
+        db.Index('ix_transactions_status_created_at_id', 'status', 'created_at', 'id'),
+        # Time ranges and global ordering (admin counts, settlement, backtests)
+        db.Index('ix_transactions_created_at', 'created_at', 'id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
@@ -11,7 +21,8 @@ class Transaction(db.Model):
     amount = db.Column(db.Float, nullable=False)
     currency = db.Column(db.String(3), nullable=False, default='USD')
     card_id = db.Column(db.String(36), db.ForeignKey('cards.id'), nullable=False)
-    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, completed, failed, disputed
+    status = db.Column(db.String(20), nullable=False, default='pending')  # see app.services.state_machine
+    version = db.Column(db.Integer, nullable=False, default=1)  # bumped by every status transition
     transaction_type = db.Column(db.String(20), nullable=False, default='payment')  # payment, refund, chargeback
     description = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -24,6 +35,58 @@ class Transaction(db.Model):
     # Reference number for tracking
     reference_number = db.Column(db.String(20), unique=True, nullable=False)
     
+    # Set once the transaction is included in a merchant payout
+    settlement_batch_id = db.Column(db.String(36), db.ForeignKey('settlement_batches.id'), nullable=True, index=True)
+    
+    # Refund ledger: a refund points at its payment, and the payment keeps the
+    # running total of its pending and completed refunds
+    original_transaction_id = db.Column(db.String(36), db.ForeignKey('transactions.id'), nullable=True, index=True)
+    refunded_total = db.Column(db.Float, nullable=False, default=0.0)
+    
+    # Relationship to the payment a refund belongs to
+    original_transaction = db.relationship('Transaction', remote_side=[id], backref=db.backref('refunds', lazy='dynamic'))
+    
+    @classmethod
+    def history_query(cls, user_id=None):
+        """
+        Transactions newest first, for one user or for everyone, with each
+        row's merchant loaded in the same query
+        """
+        query = cls.query.options(db.joinedload(cls.merchant))
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        return query.order_by(cls.created_at.desc(), cls.id.desc())
+    
+    @property
+    def merchant_name(self):
+        return self.merchant.business_name if self.merchant else 'Unknown'
+    
+    @property
+    def refundable_amount(self):
+        return round(self.amount - (self.refunded_total or 0.0), 2)
+    
+    def to_dict(self):
+        """Convert transaction object to dictionary"""
+        return {
+            'id': self.id,
+            'reference_number': self.reference_number,
+            'user_id': self.user_id,
+            'merchant_id': self.merchant_id,
+            'card_id': self.card_id,
+            'amount': self.amount,
+            'currency': self.currency,
+            'status': self.status,
+            'version': self.version,
+            'transaction_type': self.transaction_type,
+            'description': self.description,
+            'fraud_score': self.fraud_score,
+            'is_fraudulent': self.is_fraudulent,
+            'refunded_total': self.refunded_total,
+            'original_transaction_id': self.original_transaction_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
     def __repr__(self):
         return f"Transaction('{self.reference_number}', '{self.amount}', '{self.status}')"
 
@@ -32,7 +95,7 @@ class Dispute(db.Model):
     __tablename__ = 'disputes'
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    transaction_id = db.Column(db.String(36), db.ForeignKey('transactions.id'), nullable=False)
+    transaction_id = db.Column(db.String(36), db.ForeignKey('transactions.id'), nullable=False, index=True)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
     reason = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=False)
@@ -0,0 +1,22 @@
+from app import db
+from datetime import datetime
+
+class WorkerLease(db.Model):
+    __tablename__ = 'worker_leases'
+
+    # Worker id embedded in generated reference numbers (0-1023)
+    worker_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    # Random token of the process holding the lease
+    owner = db.Column(db.String(32), nullable=False)
+    hostname = db.Column(db.String(255), nullable=True)
+    pid = db.Column(db.Integer, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    # Highest timestamp issued under this id, so a new holder never reissues one
+    last_timestamp_ms = db.Column(db.BigInteger, nullable=False, default=0)
+
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"WorkerLease({self.worker_id}, '{self.hostname}:{self.pid}', expires {self.expires_at})"
@@ -0,0 +1,465 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from app.services.circuit_breaker import CircuitBreaker
+from config.settings import Config
+
+
+class AcquirerClient:
+    """
+    Interface to the card acquirer. Implementations are async so one
+    worker can keep many authorizations in flight.
+
+    authorize(), refund() and void() return a dict with at least `approved`
+    and `status`: 'approved', 'declined', 'timeout', 'error' or
+    'unavailable' (refused without calling the acquirer). void() cancels
+    the authorization under the request's reference, whether or not the
+    acquirer ever received it; an approved void means it will not be
+    charged.
+    """
+
+    async def authorize(self, request):
+        raise NotImplementedError
+
+    async def refund(self, request):
+        raise NotImplementedError
+
+    async def void(self, request):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def is_available(self):
+        return True
+
+    def stats(self):
+        return {}
+
+
+class SimulatedAcquirerClient(AcquirerClient):
+    """
+    In-process stand-in with a fixed approval rate and no network
+    """
+
+    def __init__(self, success_rate=90, refund_success_rate=95):
+        self.success_rate = success_rate
+        self.refund_success_rate = refund_success_rate
+
+    async def authorize(self, request):
+        approved = random.randint(1, 100) <= self.success_rate
+        return {'approved': approved, 'status': 'approved' if approved else 'declined'}
+
+    async def refund(self, request):
+        approved = random.randint(1, 100) <= self.refund_success_rate
+        return {'approved': approved, 'status': 'approved' if approved else 'declined'}
+
+    async def void(self, request):
+        return {'approved': True, 'status': 'approved'}
+
+    def stats(self):
+        return {'backend': 'simulated', 'success_rate': self.success_rate}
+
+
+class HttpAcquirerClient(AcquirerClient):
+    """
+    JSON-over-HTTP/1.1 acquirer client with its own keep-alive pool.
+
+    At most `max_connections` calls are in flight, one per connection;
+    further calls queue for a free connection before their timeout starts.
+    Each call is bounded by `timeout_ms` end to end, and a call that times
+    out closes its connection rather than returning it to the pool. Calls
+    are not retried, as /authorize and /refund are not safe to resend.
+    """
+
+    def __init__(self, base_url=None, max_connections=None, timeout_ms=None, connect_timeout_ms=None):
+        self.base_url = base_url or Config.ACQUIRER_URL
+        self.max_connections = max_connections or Config.ACQUIRER_MAX_CONNECTIONS
+        self.timeout_ms = timeout_ms or Config.ACQUIRER_TIMEOUT_MS
+        self.connect_timeout_ms = connect_timeout_ms or Config.ACQUIRER_CONNECT_TIMEOUT_MS
+
+        url = urlsplit(self.base_url)
+        self._ssl = url.scheme == 'https'
+        self._host = url.hostname
+        self._port = url.port or (443 if self._ssl else 80)
+        self._path_prefix = url.path.rstrip('/')
+
+        # Created on first use so they bind to the loop that runs the calls
+        self._slots = None
+        self._idle = []
+
+        self.in_flight = 0
+        self.requests = 0
+        self.connections_opened = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    async def authorize(self, request):
+        return await self._call('/authorize', request)
+
+    async def refund(self, request):
+        return await self._call('/refund', request)
+
+    async def void(self, request):
+        return await self._call('/void', request)
+
+    async def _call(self, path, request):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+
+        body = json.dumps(request).encode('utf-8')
+        async with self._slots:
+            self.in_flight += 1
+            self.requests += 1
+            try:
+                status, payload = await asyncio.wait_for(self._send(path, body), self.timeout_ms / 1000)
+                if status != 200:
+                    self.errors += 1
+                    return {'approved': False, 'status': 'error', 'message': f'Acquirer returned HTTP {status}'}
+                payload.setdefault('status', 'approved' if payload.get('approved') else 'declined')
+                return payload
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                return {'approved': False, 'status': 'timeout'}
+            except Exception as e:
+                self.errors += 1
+                return {'approved': False, 'status': 'error', 'message': str(e)}
+            finally:
+                self.in_flight -= 1
+
+    async def _send(self, path, body):
+        # A request is never sent twice: once any of it may have been written
+        # the acquirer may have acted on it, so a failure is returned as an
+        # error. Idle connections the server has already closed are dropped
+        # here instead, before anything is written to them.
+        while self._idle:
+            connection = self._idle.pop()
+            reader, writer = connection
+            if reader.at_eof() or writer.is_closing():
+                writer.close()
+                continue
+            return await self._round_trip(connection, path, body)
+
+        connection = await asyncio.wait_for(
+            asyncio.open_connection(self._host, self._port, ssl=self._ssl or None),
+            self.connect_timeout_ms / 1000
+        )
+        self.connections_opened += 1
+        return await self._round_trip(connection, path, body)
+
+    async def _round_trip(self, connection, path, body):
+        reader, writer = connection
+        try:
+            writer.write(
+                f"POST {self._path_prefix}{path} HTTP/1.1\r\nHost: {self._host}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionResetError('Connection closed by acquirer')
+            status = int(status_line.split(b' ', 2)[1])
+
+            length = 0
+            keep_alive = True
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.partition(b':')
+                name = name.strip().lower()
+                if name == b'content-length':
+                    length = int(value)
+                elif name == b'connection' and value.strip().lower() == b'close':
+                    keep_alive = False
+            payload = json.loads(await reader.readexactly(length)) if length else {}
+        except BaseException:
+            writer.close()
+            raise
+
+        if keep_alive:
+            self._idle.append(connection)
+        else:
+            writer.close()
+        return status, payload
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    def stats(self):
+        return {
+            'backend': 'http',
+            'base_url': self.base_url,
+            'max_connections': self.max_connections,
+            'timeout_ms': self.timeout_ms,
+            'in_flight': self.in_flight,
+            'idle_connections': len(self._idle),
+            'connections_opened': self.connections_opened,
+            'requests': self.requests,
+            'timeouts': self.timeouts,
+            'errors': self.errors
+        }
+
+
+class ResilientAcquirerClient(AcquirerClient):
+    """
+    Wraps another client with a circuit breaker and, optionally, hedged
+    authorizations.
+
+    While the breaker is open calls return status 'unavailable' at once
+    instead of waiting out the timeout. When hedging is on, an
+    authorization still running past the hedge_percentile latency of
+    recent calls is sent a second time and the first answer wins. That is
+    only safe if the acquirer deduplicates on the reference, so hedging
+    refuses to start unless `dedupes_reference` (ACQUIRER_DEDUPES_REFERENCE)
+    says it does, and refunds and voids are never hedged. Hedges are capped at
+    hedge_max_ratio of calls so a slow acquirer doesn't see double load.
+    """
+
+    def __init__(self, client, breaker=None, hedge=None, hedge_percentile=None, hedge_min_ms=None,
+                 hedge_max_ratio=None, dedupes_reference=None):
+        self.client = client
+        self.breaker = breaker
+        self.hedge = hedge if hedge is not None else Config.ACQUIRER_HEDGE_ENABLED
+        self.dedupes_reference = dedupes_reference if dedupes_reference is not None \
+            else Config.ACQUIRER_DEDUPES_REFERENCE
+        if self.hedge and not self.dedupes_reference:
+            raise ValueError("Hedged authorizations need an acquirer that deduplicates on the reference; "
+                             "set ACQUIRER_DEDUPES_REFERENCE once it does")
+        self.hedge_percentile = hedge_percentile or Config.ACQUIRER_HEDGE_PERCENTILE
+        self.hedge_min_ms = hedge_min_ms if hedge_min_ms is not None else Config.ACQUIRER_HEDGE_MIN_MS
+        self.hedge_max_ratio = hedge_max_ratio if hedge_max_ratio is not None else Config.ACQUIRER_HEDGE_MAX_RATIO
+
+        self._latencies = deque(maxlen=1000)
+        self._samples = 0
+        self._hedge_delay_ms = None
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    async def authorize(self, request):
+        return await self._guarded(self.client.authorize, request, hedge=self.hedge)
+
+    async def refund(self, request):
+        return await self._guarded(self.client.refund, request, hedge=False)
+
+    async def void(self, request):
+        return await self._guarded(self.client.void, request, hedge=False)
+
+    async def close(self):
+        await self.client.close()
+
+    def is_available(self):
+        return self.breaker is None or not self.breaker.is_open()
+
+    def stats(self):
+        stats = dict(self.client.stats(), hedging=self.hedge, hedge_delay_ms=self._hedge_delay_ms,
+                     hedges=self.hedges, hedge_wins=self.hedge_wins)
+        if self.breaker is not None:
+            stats['breaker'] = self.breaker.stats()
+        return stats
+
+    async def _guarded(self, call, request, hedge):
+        if self.breaker is not None and not self.breaker.allow():
+            return {'approved': False, 'status': 'unavailable', 'message': 'Acquirer circuit is open'}
+
+        self.calls += 1
+        started = time.monotonic()
+        try:
+            result = await (self._hedged(call, request) if hedge else call(request))
+        except BaseException:
+            if self.breaker is not None:
+                self.breaker.record(False, (time.monotonic() - started) * 1000)
+            raise
+
+        latency_ms = (time.monotonic() - started) * 1000
+        if self.breaker is not None:
+            self.breaker.record(result['status'] not in ('timeout', 'error'), latency_ms)
+        return result
+
+    async def _hedged(self, call, request):
+        started = time.monotonic()
+        primary = asyncio.ensure_future(call(request))
+        # No hedging until there are enough samples for a percentile
+        delay_ms = self._hedge_delay_ms
+        if delay_ms is None or self.hedges >= self.calls * self.hedge_max_ratio:
+            result = await primary
+            self._record_latency(started, result)
+            return result
+
+        done, _ = await asyncio.wait({primary}, timeout=delay_ms / 1000)
+        if done:
+            result = primary.result()
+            self._record_latency(started, result)
+            return result
+
+        self.hedges += 1
+        backup = asyncio.ensure_future(call(request))
+        done, pending = await asyncio.wait({primary, backup}, return_when=asyncio.FIRST_COMPLETED)
+        winner = done.pop() if primary not in done else primary
+        if winner.result()['status'] in ('timeout', 'error') and pending:
+            # The faster attempt failed; the other may still succeed
+            winner = pending.pop()
+            await winner
+        for attempt in pending:
+            attempt.cancel()
+        if winner is backup:
+            self.hedge_wins += 1
+        result = winner.result()
+        # Counted from the first attempt, so hedged calls still sit above the hedge delay
+        self._record_latency(started, result)
+        return result
+
+    def _record_latency(self, started, result):
+        if result['status'] in ('timeout', 'error'):
+            return
+        self._latencies.append((time.monotonic() - started) * 1000)
+        self._samples += 1
+        if self._samples % 100 == 0:
+            ordered = sorted(self._latencies)
+            index = min(int(len(ordered) * self.hedge_percentile / 100), len(ordered) - 1)
+            self._hedge_delay_ms = max(ordered[index], self.hedge_min_ms)
+
+
+def create_acquirer_client(backend=None):
+    """
+    Build the client named by ACQUIRER_BACKEND ('simulated' or 'http').
+    The http client is wrapped with a circuit breaker and hedging as configured.
+    """
+    backend = backend or Config.ACQUIRER_BACKEND
+    if backend == 'simulated':
+        return SimulatedAcquirerClient()
+    if backend != 'http':
+        raise ValueError(f"Unknown acquirer backend '{backend}'")
+
+    client = HttpAcquirerClient()
+    breaker = CircuitBreaker(client.base_url) if Config.ACQUIRER_BREAKER_ENABLED else None
+    return ResilientAcquirerClient(client, breaker=breaker)
+
+
+class AcquirerRunner:
+    """
+    Runs an AcquirerClient on one event loop in a background thread.
+
+    Request threads hand calls to the loop and block only on their own
+    result, so the loop multiplexes every in-flight authorization of the
+    worker over the client's connection pool.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The loop thread and pooled connections belong to the parent
+        self._client = None
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = create_acquirer_client()
+        return self._client
+
+    def set_client(self, client):
+        """
+        Swap in another client; the old one is closed on the loop
+        """
+        old, self._client = self._client, client
+        if old is not None and self._loop is not None:
+            asyncio.run_coroutine_threadsafe(old.close(), self._loop)
+
+    def authorize(self, request, timeout=None):
+        """
+        Authorize one payment, blocking the calling thread
+        """
+        return self.submit(self.client.authorize(request)).result(timeout)
+
+    def refund(self, request, timeout=None):
+        return self.submit(self.client.refund(request)).result(timeout)
+
+    def void(self, request, timeout=None):
+        return self.submit(self.client.void(request)).result(timeout)
+
+    def authorize_many(self, requests, timeout=None):
+        """
+        Authorize many payments concurrently; results are in request order
+        """
+        async def run():
+            return await asyncio.gather(*(self.client.authorize(request) for request in requests))
+
+        return self.submit(run()).result(timeout)
+
+    def submit(self, coroutine):
+        """
+        Schedule a coroutine on the loop and return a concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._get_loop())
+
+    def is_available(self):
+        """
+        False while the acquirer's circuit is open, so callers can refuse
+        a payment before writing anything
+        """
+        return self.client.is_available()
+
+    def stats(self):
+        return dict(self.client.stats(), loop_running=self._loop is not None)
+
+    def shutdown(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.close(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name='acquirer-loop', daemon=True)
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+            return self._loop
+
+
+def authorization_request(transaction):
+    """
+    Build the acquirer request body for a transaction
+    """
+    return {
+        'reference': transaction.reference_number,
+        'amount': transaction.amount,
+        'currency': transaction.currency,
+        'card_id': transaction.card_id,
+        'merchant_id': transaction.merchant_id,
+        'sent_at': time.time()
+    }
+
+
+# Create an instance of the runner
+acquirer = AcquirerRunner()
@@ -0,0 +1,261 @@
+"""
+Local stand-in for the card acquirer, for development and load tests.
+
+Speaks just enough HTTP/1.1 (keep-alive, Content-Length bodies) to serve
+POST /authorize, /refund and /void with JSON, after a delay drawn from a
+configurable latency distribution. A share of calls can be declined,
+fail with a 500, or stall past any sensible client timeout. POST /_control
+with any of those settings as JSON changes them on a running stub.
+
+Like the real acquirer, calls are deduplicated on `reference`: a repeat
+of an authorization or refund gets the first call's decision (after its
+own delay), so hedged authorizations can be exercised against it. A
+void always succeeds: it cancels the reference's authorization, and one
+that has not arrived yet is declined when it does.
+
+    python -m app.services.acquirer_stub --port 8099 --latency lognormal --latency-ms 80 --jitter 0.5
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import threading
+import urllib.request
+import uuid
+from collections import OrderedDict
+
+
+class StubAcquirer:
+    """
+    Asyncio acquirer stand-in
+
+    latency: 'fixed', 'uniform' (latency_ms +/- jitter * latency_ms),
+    'exponential' (mean latency_ms) or 'lognormal' (median latency_ms,
+    sigma jitter).
+    """
+
+    # Decisions remembered for deduplication, oldest dropped first
+    DEDUPE_SIZE = 100000
+
+    def __init__(self, host='127.0.0.1', port=8099, latency='lognormal', latency_ms=80.0, jitter=0.5,
+                 decline_rate=0.1, error_rate=0.0, stall_rate=0.0, stall_ms=30000.0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.decline_rate = decline_rate
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+        self._rng = random.Random(seed)
+        self._server = None
+        self._loop = None
+        self._decisions = OrderedDict()  # (path, reference) -> response body
+
+        self.requests = 0
+        self.duplicates = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def sample_delay_ms(self):
+        if self._rng.random() < self.stall_rate:
+            return self.stall_ms
+        if self.latency == 'fixed':
+            return self.latency_ms
+        if self.latency == 'uniform':
+            spread = self.latency_ms * self.jitter
+            return max(self._rng.uniform(self.latency_ms - spread, self.latency_ms + spread), 0)
+        if self.latency == 'exponential':
+            return self._rng.expovariate(1 / self.latency_ms) if self.latency_ms > 0 else 0
+        if self.latency == 'lognormal':
+            return self.latency_ms * self._rng.lognormvariate(0, self.jitter)
+        raise ValueError(f"Unknown latency distribution '{self.latency}'")
+
+    CONTROL_FIELDS = ('latency', 'latency_ms', 'jitter', 'decline_rate', 'error_rate', 'stall_rate', 'stall_ms')
+
+    async def handle(self, path, body):
+        """Return (HTTP status, JSON body) for one request"""
+        if path == '/_control':
+            # Change behaviour while running, e.g. to inject a slowdown
+            for field in self.CONTROL_FIELDS:
+                if field in body:
+                    setattr(self, field, body[field])
+            return 200, {field: getattr(self, field) for field in self.CONTROL_FIELDS}
+
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.sample_delay_ms() / 1000)
+
+            if path not in ('/authorize', '/refund', '/void'):
+                return 404, {'error': 'not found'}
+            if self._rng.random() < self.error_rate:
+                return 500, {'error': 'acquirer unavailable'}
+
+            if path == '/void':
+                return 200, self._void(body.get('reference'))
+            return 200, self._decide(path, body.get('reference'))
+        finally:
+            self.in_flight -= 1
+
+    def _decide(self, path, reference):
+        decision = self._decisions.get((path, reference)) if reference is not None else None
+        if decision is not None:
+            self.duplicates += 1
+            return decision
+
+        approved = self._rng.random() >= self.decline_rate
+        decision = {
+            'approved': approved,
+            'status': 'approved' if approved else 'declined',
+            'authorization_code': uuid.uuid4().hex[:8].upper() if approved else None,
+            'reference': reference
+        }
+        if reference is not None:
+            self._remember((path, reference), decision)
+        return decision
+
+    def _void(self, reference):
+        if reference is not None:
+            # Later authorizations under the reference get this decline
+            self._remember(('/authorize', reference), {'approved': False, 'status': 'declined',
+                                                       'authorization_code': None, 'reference': reference})
+        return {'approved': True, 'status': 'approved', 'reference': reference}
+
+    def _remember(self, key, decision):
+        self._decisions[key] = decision
+        self._decisions.move_to_end(key)
+        if len(self._decisions) > self.DEDUPE_SIZE:
+            self._decisions.popitem(last=False)
+
+    async def _serve_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                raw = await reader.readexactly(int(headers.get('content-length', 0)))
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    body = {}
+
+                status, payload = await self.handle(path, body)
+                data = json.dumps(payload).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode('latin-1') + data
+                )
+                await writer.drain()
+
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start_in_thread(self):
+        """
+        Serve from a daemon thread with its own loop; returns the base URL.
+        Pass port=0 to pick a free port.
+        """
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, name='acquirer-stub', daemon=True).start()
+        started.wait()
+        return self.url
+
+    def stats(self):
+        return {'requests': self.requests, 'duplicates': self.duplicates, 'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight}
+
+
+def control_stub(url, **settings):
+    """
+    Change a running stub's latency or failure settings; returns them all
+    """
+    request = urllib.request.Request(f"{url}/_control", data=json.dumps(settings).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def _serve_in_process(kwargs, ready):
+    stub = StubAcquirer(**kwargs)
+
+    async def serve():
+        await stub.start()
+        ready.put(stub.url)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def start_stub_process(**kwargs):
+    """
+    Run a StubAcquirer in a separate process so its event loop doesn't
+    compete with the caller's for the GIL. Returns (process, base URL).
+    """
+    context = multiprocessing.get_context('spawn')
+    ready = context.Queue()
+    process = context.Process(target=_serve_in_process, args=(dict(kwargs, port=kwargs.get('port', 0)), ready), daemon=True)
+    process.start()
+    return process, ready.get(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', default='lognormal', choices=['fixed', 'uniform', 'exponential', 'lognormal'])
+    parser.add_argument('--latency-ms', type=float, default=80.0)
+    parser.add_argument('--jitter', type=float, default=0.5)
+    parser.add_argument('--decline-rate', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--stall-rate', type=float, default=0.0)
+    parser.add_argument('--stall-ms', type=float, default=30000.0)
+    args = parser.parse_args()
+
+    stub = StubAcquirer(args.host, args.port, args.latency, args.latency_ms, args.jitter,
+                        args.decline_rate, args.error_rate, args.stall_rate, args.stall_ms)
+
+    async def serve():
+        await stub.start()
+        print(f"Stub acquirer listening on {stub.url}")
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+if __name__ == '__main__':
+    main()
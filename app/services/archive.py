@@ -0,0 +1,470 @@
+import os
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from app import db
+from app.models.archive import ArchiveFile, ArchivedTransaction
+from app.models.payment import Payment
+from app.models.transaction import Transaction, Dispute
+from app.services.merchant_cache import merchant_cache
+from app.services.settlement import SETTLED_TYPES
+from app.utils.pagination import decode_cursor, encode_cursor, keyset_page
+from config.settings import Config
+
+# Statuses a transaction is not expected to leave once it is ARCHIVE_AFTER_DAYS old
+ARCHIVE_STATUSES = ('completed', 'failed', 'refunded', 'blocked')
+
+# Rows per Parquet row group; a lookup by id or reference reads one
+ROW_GROUP_SIZE = 2000
+
+# One column per Transaction column
+SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('reference_number', pa.string()),
+    ('user_id', pa.string()),
+    ('merchant_id', pa.string()),
+    ('card_id', pa.string()),
+    ('amount', pa.float64()),
+    ('currency', pa.string()),
+    ('status', pa.string()),
+    ('version', pa.int64()),
+    ('transaction_type', pa.string()),
+    ('description', pa.string()),
+    ('created_at', pa.timestamp('us')),
+    ('updated_at', pa.timestamp('us')),
+    ('fraud_score', pa.float64()),
+    ('is_fraudulent', pa.bool_()),
+    ('settlement_batch_id', pa.string()),
+    ('original_transaction_id', pa.string()),
+    ('refunded_total', pa.float64()),
+])
+
+
+class ArchivedTransactionRecord:
+    """
+    A transaction read back from the archive. Read only; has the
+    attributes, merchant_name and to_dict() of a Transaction.
+    """
+    archived = True
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    @property
+    def merchant_name(self):
+        merchant = merchant_cache.get(self.merchant_id)
+        return merchant['name'] if merchant else 'Unknown'
+
+    def to_dict(self):
+        data = Transaction.to_dict(self)
+        data['archived'] = True
+        return data
+
+
+class TransactionArchive:
+    """
+    Old transactions moved out of the transactions table into Parquet
+    files, one directory per month of created_at (month=YYYY-MM), so the
+    hot table and its indexes only hold recent history.
+
+    A transaction is archived once it is older than ARCHIVE_AFTER_DAYS,
+    in a final status, settled if it settles, and no payment, dispute or
+    refund still in the table points at it. A payment is archived once
+    its refunds are. archived_transactions finds an archived transaction's
+    file and row group by id or reference number; history pages go through the files
+    of archive_files newest first, reading only the row groups of the
+    user asked for.
+
+    Each batch writes and syncs its files before the commit that deletes
+    its rows and records them, and moves them into place after it; rows
+    that changed since they were read stay in the table and out of the
+    files. A crash leaves at most unnamed files, which recover() names or
+    removes. Deleted rows free pages in the database; VACUUM (SQLite) or
+    VACUUM FULL / pg_repack (Postgres) returns them to the filesystem.
+    """
+
+    def __init__(self, directory=None, compression=None):
+        self.directory = directory or Config.ARCHIVE_DIR
+        self.compression = compression or Config.ARCHIVE_COMPRESSION
+
+    def archive(self, older_than_days=None, batch_size=None, limit=None, now=None, read_samples=20):
+        """
+        Archive transactions created more than `older_than_days` ago, at
+        most `limit` of them. Returns a report with the hot table's size
+        before and after, and the latency of reading archived
+        transactions back by reference number.
+        """
+        days = older_than_days if older_than_days is not None else Config.ARCHIVE_AFTER_DAYS
+        batch_size = batch_size or Config.ARCHIVE_BATCH_SIZE
+        cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+        t = Transaction.__table__
+
+        self.recover()
+        before = self.table_sizes()
+        started = time.perf_counter()
+        archived = changed = files = 0
+        last_key = None
+
+        while limit is None or archived < limit:
+            query = self._eligible(cutoff)
+            if last_key is not None:
+                query = query.where(db.tuple_(t.c.created_at, t.c.id) > last_key)
+            size = batch_size if limit is None else min(batch_size, limit - archived)
+            rows = db.session.execute(query.order_by(t.c.created_at, t.c.id).limit(size)).mappings().all()
+            if not rows:
+                break
+            last_key = (rows[-1]['created_at'], rows[-1]['id'])
+
+            moved, written = self._archive_batch(rows)
+            archived += moved
+            changed += len(rows) - moved
+            files += written
+
+        elapsed = time.perf_counter() - started
+        after = self.table_sizes()
+        return {
+            'cutoff': cutoff.isoformat(),
+            'archived': archived,
+            'changed': changed,
+            'files': files,
+            'elapsed_seconds': elapsed,
+            'before': before,
+            'after': after,
+            'read_latency_ms': self.sample_reads(read_samples)
+        }
+
+    def _eligible(self, cutoff):
+        t = Transaction.__table__
+        refunds = t.alias('refunds')
+        payments = Payment.__table__
+        disputes = Dispute.__table__
+        return db.select(*t.c).where(
+            t.c.created_at < cutoff,
+            t.c.status.in_(ARCHIVE_STATUSES),
+            db.or_(t.c.settlement_batch_id.isnot(None), t.c.status != 'completed',
+                   t.c.transaction_type.notin_(SETTLED_TYPES)),
+            ~db.exists().where(refunds.c.original_transaction_id == t.c.id),
+            ~db.exists().where(payments.c.transaction_id == t.c.id),
+            ~db.exists().where(disputes.c.transaction_id == t.c.id)
+        )
+
+    def _archive_batch(self, rows):
+        """
+        Move one batch; returns (transactions archived, files written)
+        """
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(row['created_at'].strftime('%Y-%m'), []).append(row)
+
+        written = []  # (ArchiveFile, rows)
+        row_groups = {}  # id -> row group in its file
+        try:
+            for month, month_rows in sorted(by_month.items()):
+                archive_file = ArchiveFile(path=f'month={month}/part-{uuid.uuid4().hex}.parquet', month=month)
+                row_groups.update(self._write(archive_file, month_rows))
+                written.append((archive_file, month_rows))
+
+            moved = self._delete_unchanged(rows)
+            if len(moved) < len(rows):
+                # Leave rows that changed out of the files; they stay in the table
+                kept = []
+                for archive_file, month_rows in written:
+                    month_rows = [row for row in month_rows if row['id'] in moved]
+                    if month_rows:
+                        row_groups.update(self._write(archive_file, month_rows))
+                        kept.append((archive_file, month_rows))
+                    else:
+                        self._remove(self._path(archive_file.path) + '.tmp')
+                written = kept
+
+            db.session.add_all([archive_file for archive_file, _ in written])
+            db.session.flush()
+            index = [{'id': row['id'], 'reference_number': row['reference_number'], 'file_id': archive_file.id,
+                      'row_group': row_groups[row['id']]}
+                     for archive_file, month_rows in written for row in month_rows]
+            if index:
+                db.session.execute(ArchivedTransaction.__table__.insert(), index)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for archive_file, _ in written:
+                self._remove(self._path(archive_file.path) + '.tmp')
+            raise
+
+        for archive_file, _ in written:
+            path = self._path(archive_file.path)
+            os.replace(path + '.tmp', path)
+        return len(moved), len(written)
+
+    def _write(self, archive_file, rows):
+        """
+        Write `rows` to the file's temporary path and sync it.
+        Returns the row group of each row by id.
+        """
+        path = self._path(archive_file.path) + '.tmp'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A user's rows sit together, so row group statistics skip most of a file when reading them
+        rows = sorted(rows, key=lambda row: (row['user_id'], row['created_at'], row['id']))
+        table = pa.Table.from_pylist([{name: row[name] for name in SCHEMA.names} for row in rows], schema=SCHEMA)
+        with open(path, 'wb') as f:
+            pq.write_table(table, f, compression=self.compression, row_group_size=ROW_GROUP_SIZE)
+            f.flush()
+            os.fsync(f.fileno())
+        archive_file.row_count = len(rows)
+        archive_file.min_created_at = min(row['created_at'] for row in rows)
+        archive_file.max_created_at = max(row['created_at'] for row in rows)
+        return {row['id']: position // ROW_GROUP_SIZE for position, row in enumerate(rows)}
+
+    def _delete_unchanged(self, rows, chunk_size=500):
+        """
+        Delete the rows whose version is still the one that was read;
+        returns their ids
+        """
+        t = Transaction.__table__
+        moved = set()
+        for offset in range(0, len(rows), chunk_size):
+            chunk = rows[offset:offset + chunk_size]
+            ids = [row['id'] for row in chunk]
+            result = db.session.execute(
+                t.delete().where(db.tuple_(t.c.id, t.c.version).in_([(row['id'], row['version']) for row in chunk]))
+            )
+            if result.rowcount == len(chunk):
+                moved.update(ids)
+            else:
+                remaining = set(db.session.execute(db.select(t.c.id).where(t.c.id.in_(ids))).scalars())
+                moved.update(set(ids) - remaining)
+        return moved
+
+    def recover(self):
+        """
+        Name files whose batch committed before a crash and remove the
+        others. Returns (named, removed).
+        """
+        named = removed = 0
+        if not os.path.isdir(self.directory):
+            return named, removed
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path[:-len('.tmp')], self.directory).replace(os.sep, '/')
+                if db.session.query(ArchiveFile.query.filter_by(path=relative).exists()).scalar():
+                    os.replace(path, path[:-len('.tmp')])
+                    named += 1
+                else:
+                    self._remove(path)
+                    removed += 1
+        return named, removed
+
+    def get(self, key):
+        """
+        An archived transaction by id or reference number, or None
+        """
+        entry = ArchivedTransaction.query.filter(
+            db.or_(ArchivedTransaction.id == key, ArchivedTransaction.reference_number == key)
+        ).first()
+        if entry is None:
+            return None
+        row_group = pq.ParquetFile(self._resolve(entry.file.path)).read_row_group(entry.row_group)
+        records = row_group.filter(pc.equal(row_group['id'], entry.id)).to_pylist()
+        return ArchivedTransactionRecord(**records[0]) if records else None
+
+    def history_page(self, user_id=None, cursor=None, limit=100):
+        """
+        One page of a user's transactions (everyone's if `user_id` is None)
+        newest first, from the transactions table and the archive together.
+        Archived rows are ArchivedTransactionRecords. Returns
+        (rows, next_cursor) like keyset_page().
+        """
+        hot, _ = keyset_page(Transaction.history_query(user_id), Transaction, cursor, limit + 1)
+        # Archive files only matter if they hold rows newer than the last hot row the page could use
+        newer_than = hot[limit].created_at if len(hot) > limit else None
+        archived = self._archived_page(user_id, decode_cursor(cursor) if cursor else None, newer_than, limit + 1)
+
+        page = sorted(hot + archived, key=lambda row: (row.created_at, row.id), reverse=True)[:limit + 1]
+        if len(page) > limit:
+            return page[:limit], encode_cursor(page[limit - 1].created_at, page[limit - 1].id)
+        return page, None
+
+    def _archived_page(self, user_id, before, newer_than, limit):
+        """
+        Up to `limit` archived transactions of `user_id` newest first, all
+        sorting before the (created_at, id) key `before` if given
+        """
+        files = ArchiveFile.query
+        if before is not None:
+            files = files.filter(ArchiveFile.min_created_at <= before[0])
+        if newer_than is not None:
+            files = files.filter(ArchiveFile.max_created_at >= newer_than)
+
+        rows = []
+        for archive_file in files.order_by(ArchiveFile.max_created_at.desc()):
+            if len(rows) >= limit and archive_file.max_created_at < rows[limit - 1].created_at:
+                break
+            filters = []
+            if user_id is not None:
+                filters.append(('user_id', '=', user_id))
+            if before is not None:
+                filters.append(('created_at', '<=', before[0]))
+            records = self._read(archive_file.path, filters or None)
+            if before is not None:
+                records = [r for r in records if (r.created_at, r.id) < before]
+            rows = sorted(rows + records, key=lambda row: (row.created_at, row.id), reverse=True)[:limit]
+        return rows
+
+    def history_pages(self, user_id=None, cursor=None, batch_size=1000):
+        """
+        Iterator over every page of history_page(), like keyset_stream().
+        A bad cursor raises ValueError here, before anything is streamed.
+        """
+        if cursor:
+            decode_cursor(cursor)
+        return self._history_pages(user_id, cursor, batch_size)
+
+    def _history_pages(self, user_id, cursor, batch_size):
+        while True:
+            rows, cursor = self.history_page(user_id, cursor, batch_size)
+            if rows:
+                yield rows
+            if cursor is None:
+                return
+
+    def export_paths(self, connection, start=None, end=None):
+        """
+        Paths of the archive files that may hold transactions created in
+        [start, end), oldest first, as seen by `connection`'s snapshot
+        """
+        f = ArchiveFile.__table__
+        query = db.select(f.c.path).order_by(f.c.min_created_at, f.c.id)
+        if start is not None:
+            query = query.where(f.c.max_created_at >= start)
+        if end is not None:
+            query = query.where(f.c.min_created_at < end)
+        return connection.execute(query).scalars().all()
+
+    def export_batches(self, paths, columns, batch_size, user_id=None, merchant_id=None,
+                       start=None, end=None, status=None):
+        """
+        Archived transactions in `paths` matching the filters, as lists of
+        tuples of `columns`, reading at most `batch_size` rows at a time
+        """
+        filtered = [name for name, value in (('user_id', user_id), ('merchant_id', merchant_id),
+                                             ('status', status)) if value is not None]
+        if start is not None or end is not None:
+            filtered.append('created_at')
+        read = list(columns) + [name for name in filtered if name not in columns]
+
+        for path in paths:
+            parquet = pq.ParquetFile(self._resolve(path))
+            for batch in parquet.iter_batches(batch_size=batch_size, columns=read):
+                mask = None
+                for name, value, op in (('user_id', user_id, pc.equal), ('merchant_id', merchant_id, pc.equal),
+                                        ('status', status, pc.equal), ('created_at', start, pc.greater_equal),
+                                        ('created_at', end, pc.less)):
+                    if value is not None:
+                        condition = op(batch[name], pa.scalar(value, batch.schema.field(name).type))
+                        mask = condition if mask is None else pc.and_(mask, condition)
+                if mask is not None:
+                    batch = batch.filter(mask)
+                if batch.num_rows:
+                    yield list(zip(*(batch[name].to_pylist() for name in columns)))
+
+    def _read(self, relative, filters=None):
+        table = pq.read_table(self._resolve(relative), filters=filters)
+        return [ArchivedTransactionRecord(**row) for row in table.to_pylist()]
+
+    def _resolve(self, relative):
+        path = self._path(relative)
+        if not os.path.exists(path) and os.path.exists(path + '.tmp'):
+            # Committed a moment ago and not yet moved into place
+            path += '.tmp'
+        return path
+
+    def hourly_counts(self):
+        """
+        Archived transactions per (hour, status), for rebuilding the dashboard counters
+        """
+        counts = Counter()
+        for (path,) in db.session.query(ArchiveFile.path):
+            table = pq.read_table(self._resolve(path), columns=['created_at', 'status'])
+            hours = pc.floor_temporal(table['created_at'], unit='hour')
+            grouped = pa.table({'hour': hours, 'status': table['status']}) \
+                .group_by(['hour', 'status']).aggregate([([], 'count_all')])
+            for row in grouped.to_pylist():
+                counts[(row['hour'], row['status'])] += row['count_all']
+        return counts
+
+    def table_sizes(self):
+        """
+        Rows and bytes (with indexes, where the database reports them) of
+        the transactions table and the archive index, and bytes of the
+        archive's files
+        """
+        return {
+            'transactions_rows': db.session.query(db.func.count(Transaction.id)).scalar(),
+            'transactions_bytes': self._table_bytes('transactions'),
+            'index_rows': db.session.query(db.func.count(ArchivedTransaction.id)).scalar(),
+            'index_bytes': self._table_bytes('archived_transactions'),
+            'archive_bytes': sum(os.path.getsize(os.path.join(root, name))
+                                 for root, _, names in os.walk(self.directory) for name in names)
+        }
+
+    def _table_bytes(self, table):
+        dialect = db.session.get_bind().dialect.name
+        try:
+            if dialect == 'postgresql':
+                return db.session.execute(db.text('SELECT pg_total_relation_size(:table)'), {'table': table}).scalar()
+            if dialect == 'sqlite':
+                # Needs SQLite built with the dbstat table
+                return db.session.execute(db.text(
+                    'SELECT SUM(pgsize) FROM dbstat WHERE name IN '
+                    '(SELECT name FROM sqlite_master WHERE tbl_name = :table)'
+                ), {'table': table}).scalar()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Table size error: {e}")
+        return None
+
+    def sample_reads(self, samples=20):
+        """
+        Latency of get() for randomly chosen archived transactions, in ms
+        """
+        count = db.session.query(db.func.count(ArchivedTransaction.id)).scalar()
+        if not count or not samples:
+            return None
+        latencies = []
+        for _ in range(samples):
+            key = db.session.query(ArchivedTransaction.reference_number) \
+                .offset(random.randrange(count)).limit(1).scalar()
+            started = time.perf_counter()
+            self.get(key)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        return {
+            'samples': len(latencies),
+            'p50': latencies[len(latencies) // 2],
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            'max': latencies[-1]
+        }
+
+    def _path(self, relative):
+        return os.path.join(self.directory, *relative.split('/'))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# Create an instance of the archive
+transaction_archive = TransactionArchive()
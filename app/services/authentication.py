@@ -10,7 +10,7 @@ from app.models.user import User
 from app.models.merchant import Merchant
 from app.utils.encryption import verify_password
 from app.utils.logging import log_activity
-from config.database import get_db
+from config.dependencies import get_db
 from config.settings import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -0,0 +1,291 @@
+import json
+import multiprocessing
+import time
+import zlib
+from array import array
+from datetime import datetime
+
+import numpy as np
+
+from config.settings import Config
+
+
+class ReplayTransaction:
+    """
+    Lightweight stand-in for a Transaction row during replay
+    """
+
+    def __init__(self, id, user_id, merchant_id, card_id, amount, created_at,
+                 currency='USD', transaction_type='payment', is_fraudulent=False):
+        self.id = id
+        self.user_id = user_id
+        self.merchant_id = merchant_id
+        self.card_id = card_id
+        self.amount = amount
+        self.created_at = created_at
+        self.currency = currency
+        self.transaction_type = transaction_type
+        self.is_fraudulent = bool(is_fraudulent)
+
+    @classmethod
+    def from_dict(cls, data):
+        created_at = data.get('created_at')
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00')).replace(tzinfo=None)
+        return cls(
+            id=data.get('id'),
+            user_id=data.get('user_id'),
+            merchant_id=data.get('merchant_id'),
+            card_id=data.get('card_id'),
+            amount=float(data['amount']),
+            created_at=created_at,
+            currency=data.get('currency', 'USD'),
+            transaction_type=data.get('transaction_type', 'payment'),
+            is_fraudulent=data.get('is_fraudulent', False)
+        )
+
+
+def stream_database(batch_size=5000, since=None, until=None, limit=None):
+    """
+    Yield payments from the transactions table in event-time order.
+    Reads keyset pages of (created_at, id), so only one page is held in memory.
+    Must run inside an app context.
+    """
+    from app import db
+    from app.models.transaction import Transaction
+    from config.database import route_reads
+
+    # History is read from a replica when there is one
+    route_reads(db.session())
+    columns = (Transaction.created_at, Transaction.id)
+    last_key = None
+    emitted = 0
+
+    while True:
+        query = db.session.query(
+            Transaction.id, Transaction.user_id, Transaction.merchant_id, Transaction.card_id,
+            Transaction.amount, Transaction.created_at, Transaction.currency, Transaction.is_fraudulent
+        ).filter(Transaction.transaction_type == 'payment')
+        if since is not None:
+            query = query.filter(Transaction.created_at >= since)
+        if until is not None:
+            query = query.filter(Transaction.created_at < until)
+        if last_key is not None:
+            query = query.filter(db.tuple_(*columns) > last_key)
+
+        page = query.order_by(*columns).limit(batch_size).all()
+        if not page:
+            return
+
+        for row in page:
+            yield ReplayTransaction(
+                id=row.id, user_id=row.user_id, merchant_id=row.merchant_id, card_id=row.card_id,
+                amount=row.amount, created_at=row.created_at, currency=row.currency,
+                is_fraudulent=row.is_fraudulent
+            )
+            emitted += 1
+            if limit is not None and emitted >= limit:
+                return
+
+        last_key = (page[-1].created_at, page[-1].id)
+
+
+def stream_ndjson(path, limit=None):
+    """
+    Yield transactions from an NDJSON file, one JSON object per line,
+    with at least user_id, amount and created_at. Rows must be in time order.
+    """
+    with open(path, 'r') as f:
+        emitted = 0
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            yield ReplayTransaction.from_dict(json.loads(line))
+            emitted += 1
+            if limit is not None and emitted >= limit:
+                return
+
+
+def load_active_rules():
+    """
+    Snapshot the active fraud rules so every partition scores with the same set
+    """
+    from app.models.fraud_rule import FraudRule
+
+    return [
+        {'id': r.id, 'field': r.field, 'operator': r.operator, 'value': r.value, 'score': r.score}
+        for r in FraudRule.query.filter_by(is_active=True).order_by(FraudRule.created_at).all()
+    ]
+
+
+class BacktestResult:
+    """
+    Latencies and confusion counts for one or more decision thresholds
+    """
+
+    def __init__(self, thresholds):
+        self.thresholds = list(thresholds)
+        self.confusion = {threshold: [0, 0, 0, 0] for threshold in self.thresholds}  # tp, fp, tn, fn
+        self.latencies = array('d')
+
+    def add(self, score, actual, latency):
+        self.latencies.append(latency)
+        for threshold, counts in self.confusion.items():
+            predicted = score >= threshold
+            if predicted and actual:
+                counts[0] += 1
+            elif predicted:
+                counts[1] += 1
+            elif not actual:
+                counts[2] += 1
+            else:
+                counts[3] += 1
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        for threshold, counts in other.confusion.items():
+            self.confusion[threshold] = [a + b for a, b in zip(self.confusion[threshold], counts)]
+
+    def report(self, elapsed):
+        total = len(self.latencies)
+        latencies_ms = np.frombuffer(self.latencies, dtype=float) * 1000 if total else np.zeros(1)
+
+        metrics = []
+        for threshold in self.thresholds:
+            tp, fp, tn, fn = self.confusion[threshold]
+            precision = tp / (tp + fp) if tp + fp else 0
+            recall = tp / (tp + fn) if tp + fn else 0
+            metrics.append({
+                'threshold': threshold,
+                'true_positives': tp,
+                'false_positives': fp,
+                'true_negatives': tn,
+                'false_negatives': fn,
+                'precision': precision,
+                'recall': recall,
+                'f1': (2 * precision * recall / (precision + recall)) if precision + recall else 0,
+                'accuracy': (tp + tn) / total if total else 0,
+                'false_positive_rate': fp / (fp + tn) if fp + tn else 0
+            })
+
+        return {
+            'transactions': total,
+            'elapsed_seconds': elapsed,
+            'throughput_tps': total / elapsed if elapsed > 0 else 0,
+            'latency_ms': {
+                'p50': float(np.percentile(latencies_ms, 50)),
+                'p99': float(np.percentile(latencies_ms, 99)),
+                'mean': float(latencies_ms.mean())
+            },
+            'metrics': metrics
+        }
+
+
+class ReplayState:
+    """
+    Scoring state for one partition of users: feature profiles, velocity
+    counters and anomaly models, all private to the replay
+    """
+
+    def __init__(self, rules, anomaly_weight=None, use_global_model=False):
+        from app.services.fraud_model import GlobalFraudModel
+        from app.services.fraud_model_cache import FraudModelCache
+        from app.services.fraud_rules import CompiledRuleSet
+        from app.services.velocity import VelocityStore
+
+        self.rules = CompiledRuleSet(rules)
+        self.velocity = VelocityStore()
+        self.model_cache = FraudModelCache(ttl_seconds=float('inf'), background=False)
+        self.anomaly_weight = anomaly_weight
+        self.profiles = {}
+
+        # Score with the published global model instead of per-user fits
+        self.global_model = None
+        if use_global_model:
+            self.global_model = GlobalFraudModel()
+            if not self.global_model.load_latest():
+                raise ValueError('No global fraud model artifact to replay with')
+
+    def replay(self, transaction, result):
+        from app.models.feature_profile import UserFeatureProfile
+        from app.services.fraud_detection import FraudDetectionService
+
+        # Mirror process_payment: features and velocity include the new transaction
+        profile = self.profiles.get(transaction.user_id)
+        if profile is None:
+            profile = self.profiles[transaction.user_id] = UserFeatureProfile(transaction.user_id)
+        profile.record(transaction.amount, transaction.created_at)
+        self.velocity.record(transaction, transaction.created_at)
+
+        start = time.perf_counter()
+        score = FraudDetectionService.score_transaction(
+            transaction, profile, transaction.created_at,
+            rules=self.rules, velocity=self.velocity, model_cache=self.model_cache,
+            anomaly_weight=self.anomaly_weight, global_model=self.global_model
+        )
+        result.add(score, transaction.is_fraudulent, time.perf_counter() - start)
+
+
+def _run_partition(rules, thresholds, anomaly_weight, use_global_model, inbox, outbox):
+    state = ReplayState(rules, anomaly_weight, use_global_model)
+    result = BacktestResult(thresholds)
+    while True:
+        chunk = inbox.get()
+        if chunk is None:
+            break
+        for transaction in chunk:
+            state.replay(transaction, result)
+    outbox.put(result)
+
+
+def run_backtest(events, rules=None, thresholds=None, anomaly_weight=None, workers=1, chunk_size=1000,
+                 use_global_model=False):
+    """
+    Replay events through the fraud scorer at their original timestamps.
+
+    With more than one worker, events are partitioned by user so each
+    process sees a user's full history in order. Merchant velocity is then
+    counted per partition, so use one worker for exact merchant signals.
+    """
+    thresholds = thresholds or [Config.FRAUD_DETECTION_THRESHOLD]
+    rules = rules or []
+    start = time.perf_counter()
+
+    if workers <= 1:
+        state = ReplayState(rules, anomaly_weight, use_global_model)
+        result = BacktestResult(thresholds)
+        for transaction in events:
+            state.replay(transaction, result)
+        return result.report(time.perf_counter() - start)
+
+    context = multiprocessing.get_context('spawn')
+    inboxes = [context.Queue(maxsize=16) for _ in range(workers)]
+    outbox = context.Queue()
+    processes = [
+        context.Process(target=_run_partition, args=(rules, thresholds, anomaly_weight, use_global_model, inbox, outbox), daemon=True)
+        for inbox in inboxes
+    ]
+    for process in processes:
+        process.start()
+
+    buffers = [[] for _ in range(workers)]
+    for transaction in events:
+        partition = zlib.crc32(str(transaction.user_id).encode('utf-8')) % workers
+        buffers[partition].append(transaction)
+        if len(buffers[partition]) >= chunk_size:
+            inboxes[partition].put(buffers[partition])
+            buffers[partition] = []
+
+    for partition, inbox in enumerate(inboxes):
+        if buffers[partition]:
+            inbox.put(buffers[partition])
+        inbox.put(None)
+
+    result = BacktestResult(thresholds)
+    for _ in processes:
+        result.merge(outbox.get())
+    for process in processes:
+        process.join()
+
+    return result.report(time.perf_counter() - start)
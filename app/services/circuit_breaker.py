@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import deque
+
+from config.settings import Config
+
+
+class CircuitBreaker:
+    """
+    Failure- and latency-aware circuit breaker for one downstream service.
+
+    Outcomes are counted in one-second buckets over a rolling window. The
+    breaker opens when, over at least `min_calls` calls, the share of
+    failures or of calls slower than `slow_call_ms` reaches its threshold.
+    While open every call is refused without waiting on the service; after
+    `open_seconds` a few probe calls are let through, and the breaker
+    closes again only if all of them succeed quickly.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, window_seconds=None, min_calls=None, failure_rate=None, slow_call_ms=None,
+                 slow_call_rate=None, open_seconds=None, half_open_calls=None):
+        self.name = name
+        self.window_seconds = window_seconds or Config.ACQUIRER_BREAKER_WINDOW_SECONDS
+        self.min_calls = min_calls or Config.ACQUIRER_BREAKER_MIN_CALLS
+        self.failure_rate = failure_rate or Config.ACQUIRER_BREAKER_FAILURE_RATE
+        self.slow_call_ms = slow_call_ms or Config.ACQUIRER_BREAKER_SLOW_CALL_MS
+        self.slow_call_rate = slow_call_rate or Config.ACQUIRER_BREAKER_SLOW_CALL_RATE
+        self.open_seconds = open_seconds or Config.ACQUIRER_BREAKER_OPEN_SECONDS
+        self.half_open_calls = half_open_calls or Config.ACQUIRER_BREAKER_HALF_OPEN_CALLS
+
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        self._buckets = deque()  # [second, calls, failures, slow calls]
+        self._calls = self._failures = self._slow = 0
+        self._probes_started = 0
+        self._probes_passed = 0
+
+        self.rejected = 0
+        self.times_opened = 0
+
+    def allow(self):
+        """
+        Whether a call may go ahead. In half-open state this also claims
+        one of the probe slots, so callers must record() the outcome.
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probes_started = self._probes_passed = 0
+
+            if self.state == self.HALF_OPEN:
+                if self._probes_started >= self.half_open_calls:
+                    self.rejected += 1
+                    return False
+                self._probes_started += 1
+            return True
+
+    def is_open(self):
+        """
+        True while calls are being refused; does not claim a probe slot
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self._opened_at < self.open_seconds
+            return self.state == self.HALF_OPEN and self._probes_started >= self.half_open_calls
+
+    def record(self, success, latency_ms):
+        slow = latency_ms >= self.slow_call_ms
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if not success or slow:
+                    self._open()
+                    return
+                self._probes_passed += 1
+                if self._probes_passed >= self.half_open_calls:
+                    self._close()
+                return
+            if self.state == self.OPEN:
+                # A call that started before the breaker opened
+                return
+
+            second = int(time.monotonic())
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append([second, 0, 0, 0])
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            bucket[2] += not success
+            bucket[3] += slow
+            self._calls += 1
+            self._failures += not success
+            self._slow += slow
+
+            while self._buckets[0][0] <= second - self.window_seconds:
+                _, calls, failures, slow_calls = self._buckets.popleft()
+                self._calls -= calls
+                self._failures -= failures
+                self._slow -= slow_calls
+
+            if self._calls >= self.min_calls and (self._failures / self._calls >= self.failure_rate or
+                                                  self._slow / self._calls >= self.slow_call_rate):
+                self._open()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self.state,
+                'window_calls': self._calls,
+                'window_failures': self._failures,
+                'window_slow_calls': self._slow,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected
+            }
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._buckets.clear()
+        self._calls = self._failures = self._slow = 0
@@ -0,0 +1,149 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from app import db
+from app.models.payment import Payment
+from app.models.transaction import Transaction
+from app.services.archive import transaction_archive
+from config.settings import Config
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+# Exported columns, named as in each model's to_dict(); payments leave out the encrypted card fields
+EXPORT_COLUMNS = {
+    'transactions': ('id', 'reference_number', 'user_id', 'merchant_id', 'card_id', 'amount', 'currency',
+                     'status', 'version', 'transaction_type', 'description', 'fraud_score', 'is_fraudulent',
+                     'refunded_total', 'original_transaction_id', 'created_at', 'updated_at'),
+    'payments': ('id', 'transaction_id', 'amount', 'currency', 'status', 'payment_method',
+                 'payment_date', 'last_updated', 'refund_id')
+}
+
+# Written as isoformat(), like to_dict()
+DATETIME_COLUMNS = ('created_at', 'updated_at', 'payment_date', 'last_updated')
+
+MEDIA_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+class ExportService:
+    """
+    Full exports of transactions or payments as CSV or NDJSON, optionally
+    gzipped, filtered by user, merchant, date range and status.
+
+    Rows are read as plain tuples from one server-side cursor
+    (stream_results), EXPORT_CHUNK_SIZE at a time, and each chunk is
+    encoded (and compressed) before the next is fetched, so memory holds
+    one chunk however many rows match. Transaction exports start with the
+    archived transactions, oldest month first. The archive's file list
+    and the table are read in one snapshot (REPEATABLE READ on Postgres),
+    so a transaction archived during the export appears exactly once.
+    """
+
+    def __init__(self, chunk_size=None, gzip_level=None):
+        self.chunk_size = chunk_size or Config.EXPORT_CHUNK_SIZE
+        self.gzip_level = gzip_level or Config.EXPORT_GZIP_LEVEL
+
+    def export(self, kind, fmt='csv', compress=False, user_id=None, merchant_id=None,
+               start=None, end=None, status=None, bind=None):
+        """
+        Iterator over the export as chunks of bytes. `start` and `end`
+        bound created_at (payment_date for payments) as [start, end).
+        `bind` is the engine to read from, by default the app's; pass a
+        session's get_bind() to read from the replica it was routed to.
+        Raises ValueError here, before anything is read, for an unknown
+        kind or format.
+        """
+        if kind not in EXPORT_COLUMNS:
+            raise ValueError(f"Unknown export: {kind!r}")
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt!r}")
+        filters = {'user_id': user_id, 'merchant_id': merchant_id, 'start': start, 'end': end, 'status': status}
+        return self._stream(kind, fmt, compress, filters, bind or db.engine)
+
+    def filename(self, kind, fmt, compress=False):
+        return f"{kind}-{datetime.utcnow():%Y%m%d}.{fmt}" + ('.gz' if compress else '')
+
+    def media_type(self, fmt, compress=False):
+        return 'application/gzip' if compress else MEDIA_TYPES[fmt]
+
+    def _stream(self, kind, fmt, compress, filters, bind):
+        columns = EXPORT_COLUMNS[kind]
+        encode = self._csv if fmt == 'csv' else self._ndjson
+        # wbits 31: a gzip stream with header and trailer, written as it goes
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31) if compress else None
+
+        def emit(data):
+            return compressor.compress(data) if compressor is not None else data
+
+        if fmt == 'csv':
+            yield emit((','.join(columns) + '\n').encode())
+
+        with bind.connect() as conn:
+            if conn.dialect.name == 'postgresql':
+                conn = conn.execution_options(isolation_level='REPEATABLE READ')
+            with conn.begin():
+                for chunk in self._chunks(conn, kind, columns, filters):
+                    data = emit(encode(columns, chunk))
+                    if data:
+                        yield data
+
+        if compressor is not None:
+            yield compressor.flush()
+
+    def _chunks(self, conn, kind, columns, filters):
+        # Open the table's cursor first: on SQLite the archive file list is then read in its snapshot too
+        result = conn.execution_options(stream_results=True, yield_per=self.chunk_size) \
+            .execute(self._query(kind, columns, filters))
+        if kind == 'transactions':
+            paths = transaction_archive.export_paths(conn, filters['start'], filters['end'])
+            yield from transaction_archive.export_batches(paths, columns, self.chunk_size, **filters)
+        for chunk in result.partitions():
+            yield chunk
+
+    def _query(self, kind, columns, filters):
+        t = Transaction.__table__
+        if kind == 'transactions':
+            table, created = t, t.c.created_at
+            query = db.select(*(t.c[name] for name in columns))
+        else:
+            table = Payment.__table__
+            created = table.c.payment_date
+            query = db.select(*(table.c[name] for name in columns))
+            if filters['user_id'] is not None or filters['merchant_id'] is not None:
+                query = query.join(t, t.c.id == table.c.transaction_id)
+
+        if filters['user_id'] is not None:
+            query = query.where(t.c.user_id == filters['user_id'])
+        if filters['merchant_id'] is not None:
+            query = query.where(t.c.merchant_id == filters['merchant_id'])
+        if filters['status'] is not None:
+            query = query.where(table.c.status == filters['status'])
+        if filters['start'] is not None:
+            query = query.where(created >= filters['start'])
+        if filters['end'] is not None:
+            query = query.where(created < filters['end'])
+        return query.order_by(created, table.c.id)
+
+    def _csv(self, columns, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(self._rows(columns, rows))
+        return buffer.getvalue().encode()
+
+    def _ndjson(self, columns, rows):
+        return ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in self._rows(columns, rows)).encode()
+
+    def _rows(self, columns, rows):
+        # Only the datetime columns need converting; the rest go out as read
+        positions = [i for i, name in enumerate(columns) if name in DATETIME_COLUMNS]
+        for row in rows:
+            row = list(row)
+            for i in positions:
+                if row[i] is not None:
+                    row[i] = row[i].isoformat()
+            yield row
+
+
+# Create an instance of the export service
+export_service = ExportService()
@@ -0,0 +1,203 @@
+from app import db
+from app.models.feature_profile import UserFeatureProfile
+from app.models.transaction import Transaction
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+
+class FeatureStore:
+    # How long before a rebuild starts a transaction committed during it may have been created
+    REBUILD_LATE_WINDOW = timedelta(minutes=5)
+
+    @staticmethod
+    def record_transaction(transaction):
+        """
+        Fold a new transaction into its user's feature profile.
+        The caller commits, so the profile is written with the transaction.
+        """
+        created_at = transaction.created_at or datetime.utcnow()
+
+        # Lock the profile row where the database supports it so concurrent
+        # payments for the same user don't lose updates
+        profile = UserFeatureProfile.query.filter_by(user_id=transaction.user_id).with_for_update().first()
+        if profile is None:
+            profile = UserFeatureProfile(transaction.user_id)
+            db.session.add(profile)
+
+        profile.record(transaction.amount, created_at)
+        return profile
+
+    @staticmethod
+    def preview_profile(transaction):
+        """
+        A copy of the user's profile with `transaction` folded in, never
+        written. Scores a payment as record_transaction() would leave the
+        profile, without taking the profile's lock until the payment commits.
+        """
+        profile = FeatureStore._copy_profile(transaction.user_id, FeatureStore.get_profile(transaction.user_id))
+        profile.record(transaction.amount, transaction.created_at or datetime.utcnow())
+        return profile
+
+    @staticmethod
+    def preview_profiles(transactions):
+        """
+        preview_profile() for a batch: copies of its users' profiles, keyed
+        by user id, with every transaction of the batch folded in
+        """
+        stored = FeatureStore.get_profiles(list({transaction.user_id for transaction in transactions}))
+        profiles = {}
+        for transaction in transactions:
+            profile = profiles.get(transaction.user_id)
+            if profile is None:
+                profile = profiles[transaction.user_id] = FeatureStore._copy_profile(
+                    transaction.user_id, stored.get(transaction.user_id))
+            profile.record(transaction.amount, transaction.created_at or datetime.utcnow())
+        return profiles
+
+    @staticmethod
+    def _copy_profile(user_id, stored):
+        profile = UserFeatureProfile(user_id)
+        if stored is not None:
+            for column in UserFeatureProfile.FEATURE_COLUMNS:
+                setattr(profile, column, getattr(stored, column))
+        return profile
+
+    @staticmethod
+    def record_transactions(transactions):
+        """
+        Fold a batch of new transactions into their users' profiles, locking
+        and loading all affected profiles in one query. The caller commits.
+        """
+        user_ids = list({transaction.user_id for transaction in transactions})
+        profiles = {
+            profile.user_id: profile
+            for profile in UserFeatureProfile.query.filter(UserFeatureProfile.user_id.in_(user_ids)).with_for_update().all()
+        }
+
+        for transaction in transactions:
+            profile = profiles.get(transaction.user_id)
+            if profile is None:
+                profile = profiles[transaction.user_id] = UserFeatureProfile(transaction.user_id)
+                db.session.add(profile)
+            profile.record(transaction.amount, transaction.created_at or datetime.utcnow())
+        return profiles
+
+    @staticmethod
+    def get_profile(user_id):
+        """
+        Get a user's feature profile (single primary key read)
+        """
+        if not user_id:
+            return None
+        return db.session.get(UserFeatureProfile, user_id)
+
+    @staticmethod
+    def get_profiles(user_ids):
+        """
+        Get feature profiles for many users keyed by user id
+        """
+        if not user_ids:
+            return {}
+        profiles = UserFeatureProfile.query.filter(UserFeatureProfile.user_id.in_(user_ids)).all()
+        return {profile.user_id: profile for profile in profiles}
+
+    @staticmethod
+    def rebuild(batch_size=5000):
+        """
+        Rebuild every profile from the transactions table while live scoring
+        keeps reading and updating them.
+        Rows are streamed in keyset pages of (user_id, created_at, id), so memory
+        stays bounded by one page of profiles. The profiles of the users a page
+        finishes overwrite the stored ones in place (see _store_rebuilt), and
+        profiles of users with no transactions left are deleted at the end.
+        Returns the number of transactions and profiles processed.
+        """
+        started = datetime.utcnow()
+        columns = (Transaction.user_id, Transaction.created_at, Transaction.id)
+        last_key = None
+        built = {}  # user_id -> profile built from that user's rows so far
+        last_read = {}  # user_id -> (created_at, id) of that user's last row read
+        transaction_count = 0
+        profile_count = 0
+
+        while True:
+            query = db.session.query(Transaction.user_id, Transaction.created_at, Transaction.id, Transaction.amount)
+            if last_key is not None:
+                query = query.filter(db.tuple_(*columns) > last_key)
+            page = query.order_by(*columns).limit(batch_size).all()
+
+            if not page:
+                break
+
+            for user_id, created_at, transaction_id, amount in page:
+                profile = built.get(user_id)
+                if profile is None:
+                    profile = built[user_id] = UserFeatureProfile(user_id)
+                    profile_count += 1
+                profile.record(amount, created_at)
+                last_read[user_id] = (created_at, transaction_id)
+                transaction_count += 1
+
+            last_key = page[-1][:3]
+            # The page's last user may have more rows on the next page
+            unfinished = page[-1][0]
+            FeatureStore._store_rebuilt({user_id: profile for user_id, profile in built.items() if user_id != unfinished},
+                                        last_read, started)
+            built = {unfinished: built[unfinished]}
+            last_read = {unfinished: last_read[unfinished]}
+
+        FeatureStore._store_rebuilt(built, last_read, started)
+
+        # Users whose transactions are all gone
+        t = Transaction.__table__
+        UserFeatureProfile.query.filter(~db.exists().where(t.c.user_id == UserFeatureProfile.user_id)) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+
+        return {'transactions': transaction_count, 'profiles': profile_count}
+
+    @staticmethod
+    def _store_rebuilt(built, last_read, started):
+        """
+        Write rebuilt profiles over the stored ones in one commit. The stored
+        rows are locked first, and transactions recorded for those users
+        after their rows were read are folded in, so a concurrent
+        record_transaction() is neither lost nor counted twice. Rows recorded
+        during the rebuild carry a created_at from at most
+        REBUILD_LATE_WINDOW before it started.
+        """
+        if not built:
+            return
+        user_ids = list(built)
+        since = max(min(key[0] for user_id, key in last_read.items() if user_id in built),
+                    started - FeatureStore.REBUILD_LATE_WINDOW)
+
+        for attempt in range(2):
+            stored = {
+                profile.user_id: profile
+                for profile in UserFeatureProfile.query.filter(UserFeatureProfile.user_id.in_(user_ids)).with_for_update().all()
+            }
+            late = db.session.query(Transaction.user_id, Transaction.created_at, Transaction.id, Transaction.amount) \
+                .filter(Transaction.user_id.in_(user_ids), Transaction.created_at >= since) \
+                .order_by(Transaction.created_at, Transaction.id).all()
+
+            for user_id, profile in built.items():
+                target = stored.get(user_id)
+                if target is None:
+                    target = UserFeatureProfile(user_id)
+                    db.session.add(target)
+                for column in UserFeatureProfile.FEATURE_COLUMNS:
+                    setattr(target, column, getattr(profile, column))
+                stored[user_id] = target
+
+            for user_id, created_at, transaction_id, amount in late:
+                if (created_at, transaction_id) > last_read[user_id]:
+                    stored[user_id].record(amount, created_at)
+
+            try:
+                db.session.commit()
+                return
+            except IntegrityError:
+                # A concurrent record_transaction() created one of these profiles first
+                db.session.rollback()
+                if attempt:
+                    raise
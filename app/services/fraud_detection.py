@@ -1,39 +1,169 @@
 from app import db
 from app.models.transaction import Transaction
 from config.settings import Config
-import pandas as pd
-from sklearn.ensemble import IsolationForest
-import numpy as np
+from app.services.fraud_model_cache import fraud_model_cache
+from app.services.fraud_model import global_fraud_model, model_features
+from app.services.feature_store import FeatureStore
+from app.services.fraud_rules import fraud_rule_engine, validate_rule, transaction_features, transaction_columns
+from app.services.fraud_scoring_pool import fraud_scoring_pool, score_anomaly
+from app.services.velocity import velocity_store
+from app.services.state_machine import transaction_states, IllegalTransitionError
+from app.models.fraud_rule import FraudRule
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
+import numpy as np
 
 class FraudDetectionService:
+    # Maximum number of user ids per feature profile query in batch scoring
+    BATCH_USER_CHUNK = 500
+    
     @staticmethod
-    def analyze_transaction(transaction, user_id):
+    def analyze_transaction(transaction, user_id, now=None, profile=None):
         """
         Analyze a transaction for potential fraud
         Returns a fraud score (0-100) where higher is more likely to be fraud
         """
-        # Get user's transaction history
-        user_history = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.created_at.desc()).limit(20).all()
+        now = FraudDetectionService._event_time(transaction, now)
+        
+        # Get user's behavioural features, unless the caller already has them
+        if profile is None:
+            profile = FeatureStore.get_profile(user_id)
+        
+        return FraudDetectionService.score_transaction(transaction, profile, now)
+    
+    @staticmethod
+    def score_transaction(transaction, profile, now, rules=None, velocity=None, model_cache=None,
+                          anomaly_weight=None, global_model=None):
+        """
+        Score a transaction against explicit state. The live path uses the
+        shared rule engine, velocity store and models; replays pass their
+        own so they don't touch production state.
+        """
+        velocity = velocity or velocity_store
         
-        # If this is the first transaction, use simple rules
-        if not user_history:
-            return FraudDetectionService._simple_fraud_check(transaction)
+        # Velocity is added on top of whichever score applies
+        velocity_score = velocity.score(transaction, now)
+        
+        # If this is the first transaction, use rules only
+        rule_score = FraudDetectionService._rule_score(transaction, now, rules)
+        if not profile or not profile.transaction_count:
+            return min(rule_score + velocity_score, 100)
         
         # Combine rule-based and anomaly detection
-        rule_score = FraudDetectionService._simple_fraud_check(transaction)
-        anomaly_score = FraudDetectionService._anomaly_detection(transaction, user_history)
+        anomaly_score = FraudDetectionService._anomaly_detection(transaction, profile, now, model_cache, global_model)
         
-        # Combine scores (60% anomaly, 40% rule-based)
-        combined_score = (anomaly_score * 0.6) + (rule_score * 0.4)
+        return FraudDetectionService._combine(anomaly_score, rule_score, velocity_score, anomaly_weight)
+    
+    @staticmethod
+    def analyze_batch(transactions, now=None, profiles=None):
+        """
+        Analyze many transactions in one call
+        `profiles` replaces the stored feature profiles, keyed by user id
+        (see FeatureStore.preview_profiles).
+        Returns a list of fraud scores (0-100) in the same order as the input
+        """
+        if not transactions:
+            return []
         
-        return min(combined_score, 100)  # Cap at 100
+        times = [FraudDetectionService._event_time(t, now) for t in transactions]
+        amounts = np.array([t.amount for t in transactions], dtype=float)
+        hours = np.array([t.hour for t in times])
+        weekdays = np.array([t.weekday() for t in times])
+        user_ids = [t.user_id for t in transactions]
+        
+        # Rule-based scores for the whole batch at once
+        fraud_rule_engine.refresh_if_stale()
+        compiled_rules = fraud_rule_engine.compiled
+        rule_scores = FraudDetectionService._simple_fraud_check_batch(amounts, hours) + compiled_rules.evaluate_batch(
+            transaction_columns(transactions, times, compiled_rules.fields), len(transactions))
+        
+        # Group row positions by user so each user's model scores in one pass
+        positions_by_user = {}
+        for position, user_id in enumerate(user_ids):
+            positions_by_user.setdefault(user_id, []).append(position)
+        
+        if profiles is None:
+            profiles = {}
+            user_list = list(positions_by_user)
+            chunk_size = FraudDetectionService.BATCH_USER_CHUNK
+            for start in range(0, len(user_list), chunk_size):
+                profiles.update(FeatureStore.get_profiles(user_list[start:start + chunk_size]))
+        
+        anomaly_scores = np.zeros(len(transactions))
+        has_history = np.zeros(len(transactions), dtype=bool)
+        rows = np.column_stack([amounts, hours, weekdays])
+        
+        if global_fraud_model.loaded:
+            # One score_samples call over every row that has a profile
+            scored_positions, feature_rows = [], []
+            for position, transaction in enumerate(transactions):
+                profile = profiles.get(transaction.user_id)
+                if profile and profile.transaction_count:
+                    scored_positions.append(position)
+                    feature_rows.append(model_features(transaction.amount, times[position], profile))
+            
+            has_history[scored_positions] = True
+            if feature_rows:
+                try:
+                    anomaly_scores[scored_positions] = global_fraud_model.score(feature_rows)
+                except Exception as e:
+                    print(f"Anomaly detection error: {e}")
+        else:
+            for user_id, positions in positions_by_user.items():
+                profile = profiles.get(user_id)
+                if not profile or not profile.transaction_count:
+                    continue
+                training_rows = profile.training_rows()
+                
+                has_history[positions] = True
+                try:
+                    scores = fraud_model_cache.score(user_id, training_rows, rows[positions])
+                    anomaly_scores[positions] = np.where(scores < 0, 100, 0)
+                except Exception as e:
+                    print(f"Anomaly detection error: {e}")
+        
+        velocity_scores = np.array([velocity_store.score(t, times[i]) for i, t in enumerate(transactions)], dtype=float)
+        
+        # Blend anomaly and rule scores where there is history
+        weight = Config.FRAUD_ANOMALY_WEIGHT
+        combined = np.where(has_history, (anomaly_scores * weight) + (rule_scores * (1 - weight)), rule_scores) + velocity_scores
+        
+        return np.minimum(combined, 100).tolist()  # Cap at 100
+    
+    @staticmethod
+    def _event_time(transaction, now=None):
+        """
+        Time a transaction is scored at: the explicit time if given, else when
+        it happened, so replays see the hour and weekday of the original event
+        """
+        return now or getattr(transaction, 'created_at', None) or datetime.utcnow()
     
     @staticmethod
-    def _simple_fraud_check(transaction):
+    def _combine(anomaly_score, rule_score, velocity_score=0, anomaly_weight=None):
+        """
+        Blend anomaly and rule scores (60/40 by default), add velocity and cap at 100
+        """
+        weight = Config.FRAUD_ANOMALY_WEIGHT if anomaly_weight is None else anomaly_weight
+        combined_score = (anomaly_score * weight) + (rule_score * (1 - weight)) + velocity_score
+        return min(combined_score, 100)
+    
+    @staticmethod
+    def _rule_score(transaction, now, rules=None):
+        """
+        Built-in rules plus the compiled rules stored in the database
+        """
+        if rules is None:
+            fraud_rule_engine.refresh_if_stale()
+            rules = fraud_rule_engine.compiled
+        score, _ = rules.evaluate(transaction_features(transaction, now))
+        return FraudDetectionService._simple_fraud_check(transaction, now) + score
+    
+    @staticmethod
+    def _simple_fraud_check(transaction, now=None):
         """
         Simple rule-based fraud detection
         """
+        now = FraudDetectionService._event_time(transaction, now)
         score = 0
         
         # Check amount thresholds
@@ -45,7 +175,7 @@ class FraudDetectionService:
             score += 5
         
         # Check transaction time (unusual hours)
-        hour = datetime.utcnow().hour
+        hour = now.hour
         if 0 <= hour < 5:  # Transactions between midnight and 5am
             score += 10
         
@@ -56,40 +186,52 @@ class FraudDetectionService:
         return score
     
     @staticmethod
-    def _anomaly_detection(transaction, history):
+    def _simple_fraud_check_batch(amounts, hours):
+        """
+        Vectorized version of _simple_fraud_check over arrays of amounts and hours
+        """
+        # Check amount thresholds
+        scores = np.select([amounts > 1000, amounts > 500, amounts > 200], [15, 10, 5], default=0).astype(float)
+        
+        # Check transaction time (unusual hours)
+        scores += np.where((hours >= 0) & (hours < 5), 10, 0)
+        
+        # Check for round amounts (often fraudulent)
+        scores += np.where(amounts == np.trunc(amounts), 5, 0)
+        
+        return scores
+    
+    @staticmethod
+    def _anomaly_detection(transaction, profile, now=None, model_cache=None, global_model=None):
         """
         Use anomaly detection to identify unusual transactions
         """
-        # Convert history to dataframe
-        data = []
-        for t in history:
-            data.append({
-                'amount': t.amount,
-                'hour': t.created_at.hour,
-                'day_of_week': t.created_at.weekday(),
-                'days_since': (datetime.utcnow() - t.created_at).days
-            })
-        
-        if not data:
+        now = FraudDetectionService._event_time(transaction, now)
+        
+        # Prefer the pre-trained global model; callers that pass their own
+        # per-user cache (replays) only get it when they ask for it
+        if global_model is None and model_cache is None:
+            global_model = global_fraud_model
+        if global_model is not None and global_model.loaded:
+            try:
+                return int(global_model.score([model_features(transaction.amount, now, profile)])[0])
+            except Exception as e:
+                print(f"Anomaly detection error: {e}")
+                return 0
+        
+        training_rows = profile.training_rows()
+        if not training_rows:
             return 0
-            
-        # Add current transaction
-        data.append({
-            'amount': transaction.amount,
-            'hour': datetime.utcnow().hour,
-            'day_of_week': datetime.utcnow().weekday(),
-            'days_since': 0
-        })
         
-        df = pd.DataFrame(data)
+        model_cache = model_cache or fraud_model_cache
+        current_row = [transaction.amount, now.hour, now.weekday()]
         
         try:
-            # Use Isolation Forest for anomaly detection
-            model = IsolationForest(contamination=0.1, random_state=42)
-            df['scores'] = model.fit_predict(df[['amount', 'hour', 'day_of_week']])
+            # Score against the user's cached Isolation Forest
+            scores = model_cache.score(transaction.user_id, training_rows, [current_row])
             
-            # Get anomaly score for current transaction (last row)
-            anomaly_score = 1 if df['scores'].iloc[-1] == -1 else 0
+            # Negative decision values are anomalies
+            anomaly_score = 1 if scores[0] < 0 else 0
             
             # Convert to 0-100 scale
             return anomaly_score * 100
@@ -98,17 +240,192 @@ class FraudDetectionService:
             return 0
 
     @staticmethod
-    def is_transaction_fraudulent(transaction, user_id):
+    def get_global_model_info():
+        """
+        Get the version and training metadata of the loaded global model
+        """
+        return global_fraud_model.info()
+
+    @staticmethod
+    def get_model_cache_stats():
+        """
+        Get hit rate and refit counters for the anomaly model cache
+        """
+        return fraud_model_cache.stats()
+
+    @staticmethod
+    def is_transaction_fraudulent(transaction, user_id, deferrable=True, profile=None):
         """
-        Determine if a transaction is fraudulent based on the fraud score
+        Determine if a transaction is fraudulent based on the fraud score.
+        Pass `deferrable=False` when the transaction isn't written yet: it is
+        then scored inline, as a late score from the pool would be lost.
+        `profile` replaces the stored feature profile (see FeatureStore.preview_profile).
         """
-        fraud_score = FraudDetectionService.analyze_transaction(transaction, user_id)
+        # The global model is a cheap call, so only per-user fits go to the pool
+        if deferrable and fraud_scoring_pool.enabled and not global_fraud_model.loaded:
+            fraud_score = FraudDetectionService._analyze_with_deadline(transaction, user_id, profile=profile)
+        else:
+            fraud_score = FraudDetectionService.analyze_transaction(transaction, user_id, profile=profile)
         transaction.fraud_score = fraud_score
         
         # Mark as fraudulent if above threshold
         if fraud_score >= Config.FRAUD_DETECTION_THRESHOLD:
-            transaction.is_fraudulent = True
-            transaction.status = 'blocked'
+            transaction_states.apply(transaction, 'blocked', is_fraudulent=True)
             return True
         
-        return False
\ No newline at end of file
+        return False
+
+    @staticmethod
+    def _analyze_with_deadline(transaction, user_id, now=None, profile=None):
+        """
+        Same score as analyze_transaction, with the anomaly model run in the
+        scoring pool. If the pool is full or the deadline passes, return the
+        rules-only score; a late anomaly score is applied after the fact.
+        """
+        now = FraudDetectionService._event_time(transaction, now)
+        rule_score = FraudDetectionService._rule_score(transaction, now)
+        velocity_score = velocity_store.score(transaction, now)
+        
+        if profile is None:
+            profile = FeatureStore.get_profile(user_id)
+        if not profile or not profile.transaction_count:
+            return min(rule_score + velocity_score, 100)
+        
+        current_row = [transaction.amount, now.hour, now.weekday()]
+        future = fraud_scoring_pool.submit(score_anomaly, user_id, profile.training_rows(), current_row)
+        if future is None:
+            return min(rule_score + velocity_score, 100)
+        
+        try:
+            anomaly_score = fraud_scoring_pool.wait(future)
+        except FutureTimeoutError:
+            transaction_id = transaction.id
+            fraud_scoring_pool.defer(
+                future,
+                lambda late_score: FraudDetectionService._apply_deferred_score(transaction_id, rule_score, late_score, velocity_score)
+            )
+            return min(rule_score + velocity_score, 100)
+        except Exception as e:
+            print(f"Anomaly detection error: {e}")
+            anomaly_score = 0
+        
+        return FraudDetectionService._combine(anomaly_score, rule_score, velocity_score)
+
+    @staticmethod
+    def _apply_deferred_score(transaction_id, rule_score, anomaly_score, velocity_score=0):
+        """
+        Store a full score that arrived after the deadline and flag the
+        transaction for review if it crosses the threshold
+        """
+        transaction = db.session.get(Transaction, transaction_id)
+        if not transaction:
+            return False
+        
+        fraud_score = FraudDetectionService._combine(anomaly_score, rule_score, velocity_score)
+        transaction.fraud_score = fraud_score
+        
+        flagged = fraud_score >= Config.FRAUD_DETECTION_THRESHOLD
+        if flagged:
+            # Whatever status the payment reached meanwhile, as long as it can still be flagged
+            try:
+                transaction_states.transition(transaction_id, 'flagged_for_fraud', is_fraudulent=True)
+            except IllegalTransitionError:
+                flagged = False
+        
+        db.session.commit()
+        return flagged
+
+    @staticmethod
+    def get_velocity_stats():
+        """
+        Get key counts and evictions for the velocity counters
+        """
+        return velocity_store.stats()
+
+    @staticmethod
+    def get_scoring_pool_stats():
+        """
+        Get scoring pool configuration, queue depth and timeout counters
+        """
+        return fraud_scoring_pool.stats()
+
+    @staticmethod
+    def detect_fraud(transaction_data):
+        """
+        Score a transaction described by a dict without saving it
+        """
+        now = datetime.utcnow()
+        transaction = Transaction(
+            user_id=transaction_data.get('user_id'),
+            merchant_id=transaction_data.get('merchant_id'),
+            card_id=transaction_data.get('card_id'),
+            amount=float(transaction_data.get('amount', 0)),
+            currency=transaction_data.get('currency', 'USD'),
+            transaction_type=transaction_data.get('transaction_type', 'payment')
+        )
+        
+        fraud_rule_engine.refresh_if_stale()
+        compiled_rules = fraud_rule_engine.compiled
+        _, matched_rules = compiled_rules.evaluate(transaction_features(transaction, now))
+        fraud_score = FraudDetectionService.analyze_transaction(transaction, transaction.user_id, now)
+        
+        return {
+            'is_fraud': fraud_score >= Config.FRAUD_DETECTION_THRESHOLD,
+            'fraud_score': fraud_score,
+            'threshold': Config.FRAUD_DETECTION_THRESHOLD,
+            'matched_rules': matched_rules,
+            'rules_version': compiled_rules.version
+        }
+
+    @staticmethod
+    def get_rules():
+        """
+        Get all fraud detection rules
+        """
+        return [rule.to_dict() for rule in FraudRule.query.order_by(FraudRule.created_at).all()]
+
+    @staticmethod
+    def add_rule(rule_data):
+        """
+        Validate and store a fraud rule, then swap in the recompiled rule set
+        """
+        try:
+            rule = FraudRule(**validate_rule(rule_data))
+        except ValueError as e:
+            return {
+                'success': False,
+                'message': str(e)
+            }
+        
+        db.session.add(rule)
+        db.session.commit()
+        fraud_rule_engine.reload(force=True)
+        
+        return {
+            'success': True,
+            'message': 'Rule added successfully',
+            'rule': rule.to_dict(),
+            'rules_version': fraud_rule_engine.compiled.version
+        }
+
+    @staticmethod
+    def delete_rule(rule_id):
+        """
+        Delete a fraud rule, then swap in the recompiled rule set
+        """
+        rule = db.session.get(FraudRule, rule_id)
+        if not rule:
+            return {
+                'success': False,
+                'message': f'Rule with ID {rule_id} not found'
+            }
+        
+        db.session.delete(rule)
+        db.session.commit()
+        fraud_rule_engine.reload(force=True)
+        
+        return {
+            'success': True,
+            'message': 'Rule deleted successfully',
+            'rules_version': fraud_rule_engine.compiled.version
+        }
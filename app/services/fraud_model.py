@@ -0,0 +1,257 @@
+import json
+import math
+import os
+import pickle
+import random
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import sklearn
+from sklearn.ensemble import IsolationForest
+
+from config.settings import Config
+
+# Bump when the artifact layout or feature definitions change
+ARTIFACT_FORMAT_VERSION = 1
+
+MODEL_FEATURES = [
+    'log_amount',
+    'amount_z',
+    'hour_sin',
+    'hour_cos',
+    'hour_rarity',
+    'weekday_rarity',
+    'log_history_size'
+]
+
+
+def model_features(amount, when, profile):
+    """
+    Per-user normalized feature row for the global model.
+    `profile` already includes the transaction being scored, as it does in
+    process_payment, so histogram buckets are never empty.
+    """
+    count = max(profile.transaction_count, 1)
+    std = max(math.sqrt(profile.amount_variance), 1.0)
+    hour = when.hour
+
+    return [
+        math.log1p(max(amount, 0)),
+        (amount - profile.amount_mean) / std,
+        math.sin(2 * math.pi * hour / 24),
+        math.cos(2 * math.pi * hour / 24),
+        1 - profile.hour_histogram[hour] / count,
+        1 - profile.weekday_histogram[when.weekday()] / count,
+        math.log1p(profile.transaction_count)
+    ]
+
+
+def train_global_model(events, max_samples=None, random_state=42):
+    """
+    Train the global model from transactions in time order.
+    Builds point-in-time user profiles while streaming and keeps a reservoir
+    sample of feature rows, so memory is bounded by max_samples plus one
+    small profile per user.
+    """
+    from app.models.feature_profile import UserFeatureProfile
+
+    max_samples = max_samples or Config.FRAUD_MODEL_MAX_TRAINING_SAMPLES
+    rng = random.Random(random_state)
+    profiles = {}
+    sample = []
+    seen = 0
+
+    for transaction in events:
+        profile = profiles.get(transaction.user_id)
+        if profile is None:
+            profile = profiles[transaction.user_id] = UserFeatureProfile(transaction.user_id)
+        profile.record(transaction.amount, transaction.created_at)
+
+        row = model_features(transaction.amount, transaction.created_at, profile)
+        seen += 1
+        if len(sample) < max_samples:
+            sample.append(row)
+        else:
+            slot = rng.randrange(seen)
+            if slot < max_samples:
+                sample[slot] = row
+
+    if not sample:
+        raise ValueError('No transactions to train on')
+
+    model = IsolationForest(
+        n_estimators=100,
+        contamination=Config.FRAUD_MODEL_CONTAMINATION,
+        random_state=random_state
+    )
+    model.fit(np.asarray(sample, dtype=float))
+
+    manifest = {
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'trained_at': datetime.utcnow().isoformat(),
+        'features': MODEL_FEATURES,
+        'training_rows': seen,
+        'sampled_rows': len(sample),
+        'sklearn_version': sklearn.__version__
+    }
+    return model, manifest
+
+
+def save_artifact(model, manifest, model_dir=None):
+    """
+    Write fraud-model-<version>.pkl/.json and point LATEST at it.
+    LATEST is replaced atomically so readers never see a partial artifact.
+    """
+    model_dir = model_dir or Config.FRAUD_MODEL_DIR
+    os.makedirs(model_dir, exist_ok=True)
+
+    version = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+    manifest = dict(manifest, version=version)
+
+    with open(os.path.join(model_dir, f'fraud-model-{version}.pkl'), 'wb') as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(model_dir, f'fraud-model-{version}.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    latest_tmp = os.path.join(model_dir, 'LATEST.tmp')
+    with open(latest_tmp, 'w') as f:
+        f.write(version)
+    os.replace(latest_tmp, os.path.join(model_dir, 'LATEST'))
+
+    return version
+
+
+def load_artifact(model_dir=None, version=None):
+    """
+    Load a model artifact (the LATEST one by default)
+    Returns (model, manifest), or (None, None) if there is no artifact
+    """
+    model_dir = model_dir or Config.FRAUD_MODEL_DIR
+    if version is None:
+        try:
+            with open(os.path.join(model_dir, 'LATEST'), 'r') as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None, None
+
+    with open(os.path.join(model_dir, f'fraud-model-{version}.json'), 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != ARTIFACT_FORMAT_VERSION or manifest.get('features') != MODEL_FEATURES:
+        raise ValueError(f"Fraud model artifact {version} is not compatible with this code")
+
+    with open(os.path.join(model_dir, f'fraud-model-{version}.pkl'), 'rb') as f:
+        model = pickle.load(f)
+    return model, manifest
+
+
+class GlobalFraudModel:
+    """
+    Holds the loaded global model. The (model, manifest) pair is replaced
+    as one reference, so scoring threads always see a consistent version.
+    """
+
+    def __init__(self, model_dir=None):
+        self.model_dir = model_dir or Config.FRAUD_MODEL_DIR
+        self._current = (None, None)
+        self._retrain_thread = None
+
+    @property
+    def loaded(self):
+        return self._current[0] is not None
+
+    @property
+    def version(self):
+        manifest = self._current[1]
+        return manifest['version'] if manifest else None
+
+    def load_latest(self):
+        """
+        Load the newest artifact if it differs from the one in memory
+        Returns True if a new model was swapped in
+        """
+        model_dir = self.model_dir
+        try:
+            with open(os.path.join(model_dir, 'LATEST'), 'r') as f:
+                latest = f.read().strip()
+        except FileNotFoundError:
+            return False
+
+        if latest == self.version:
+            return False
+
+        model, manifest = load_artifact(model_dir, latest)
+        self._current = (model, manifest)
+        return True
+
+    def swap(self, model, manifest):
+        self._current = (model, manifest)
+
+    def score(self, rows):
+        """
+        Return 0-100 anomaly scores for feature rows
+        """
+        model = self._current[0]
+        samples = model.score_samples(np.asarray(rows, dtype=float))
+        return np.where(samples < model.offset_, 100, 0)
+
+    def info(self):
+        manifest = self._current[1]
+        return dict(manifest, loaded=True) if manifest else {'loaded': False}
+
+    def retrain(self, app, max_samples=None):
+        """
+        Train on all payments, save a new artifact and swap it in
+        """
+        from app.services.backtest import stream_database
+
+        with app.app_context():
+            model, manifest = train_global_model(stream_database(), max_samples=max_samples)
+        version = save_artifact(model, manifest, self.model_dir)
+        self.swap(model, dict(manifest, version=version))
+        return version
+
+    def start_retraining(self, app, interval_seconds=None):
+        """
+        Start a daemon thread that keeps the model fresh. Each tick it picks up
+        artifacts written by other processes. Only the process holding the
+        'fraud-model-retrain' job lease retrains, once the latest artifact is
+        older than the interval and there are payments to train on; the
+        others load what it publishes.
+        """
+        interval_seconds = interval_seconds or Config.FRAUD_MODEL_RETRAIN_SECONDS
+        if self._retrain_thread is not None or interval_seconds <= 0:
+            return
+        from app.services.job_lease import job_leases
+
+        def run():
+            while True:
+                time.sleep(min(interval_seconds, 60))
+                try:
+                    self.load_latest()
+                    with app.app_context():
+                        leader = job_leases.hold('fraud-model-retrain', Config.FRAUD_MODEL_LEASE_SECONDS)
+                    if not leader:
+                        continue
+                    manifest = self._current[1]
+                    trained_at = datetime.fromisoformat(manifest['trained_at']) if manifest else None
+                    if trained_at is None or (datetime.utcnow() - trained_at).total_seconds() >= interval_seconds:
+                        if self._has_training_data(app):
+                            self.retrain(app)
+                except Exception as e:
+                    print(f"Fraud model retraining error: {e}")
+
+        self._retrain_thread = threading.Thread(target=run, name='fraud-model-retrain', daemon=True)
+        self._retrain_thread.start()
+
+    def _has_training_data(self, app):
+        from app import db
+        from app.models.transaction import Transaction
+
+        with app.app_context():
+            return db.session.query(Transaction.query.filter_by(transaction_type='payment').exists()).scalar()
+
+
+# Create an instance of the model holder
+global_fraud_model = GlobalFraudModel()
@@ -0,0 +1,178 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+from config.settings import Config
+
+
+def fit_anomaly_model(training_rows):
+    """
+    Fit an IsolationForest on rows of [amount, hour, day_of_week]
+    """
+    model = IsolationForest(contamination=0.1, random_state=42)
+    model.fit(np.asarray(training_rows, dtype=float))
+    return model
+
+
+class FraudModelCache:
+    """
+    Per-user LRU cache of fitted anomaly models.
+
+    Models are fitted once on a cache miss and then reused for scoring.
+    A model is refitted in the background after `refit_after` new
+    transactions have been scored against it, or once it is older than
+    `ttl_seconds`; the stale model keeps serving until the refit lands.
+    After a failed refit the count starts over and no refit is tried for
+    `refit_backoff_seconds`.
+    With `background=False` refits run inline, which keeps replays
+    deterministic.
+    """
+
+    def __init__(self, max_bytes=None, refit_after=None, ttl_seconds=None, background=True,
+                 refit_backoff_seconds=None):
+        self.max_bytes = max_bytes if max_bytes is not None else Config.FRAUD_MODEL_CACHE_MAX_BYTES
+        self.refit_after = refit_after if refit_after is not None else Config.FRAUD_MODEL_REFIT_AFTER
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else Config.FRAUD_MODEL_TTL_SECONDS
+        self.refit_backoff_seconds = refit_backoff_seconds if refit_backoff_seconds is not None \
+            else Config.FRAUD_MODEL_REFIT_BACKOFF_SECONDS
+
+        self._models = OrderedDict()  # user_id -> entry dict, least recently used first
+        self._refitting = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fraud-model-refit') if background else None
+
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.refits = 0
+        self.refit_failures = 0
+        self.evictions = 0
+
+    def score(self, user_id, training_rows, rows):
+        """
+        Score rows with the user's cached model and return decision_function values.
+        Negative values are anomalies. `training_rows` is only fitted on a miss
+        or handed to the background refit.
+        """
+        with self._lock:
+            entry = self._models.get(user_id)
+            if entry is not None:
+                self._models.move_to_end(user_id)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is None:
+            # A freshly fitted model already reflects training_rows, so
+            # these rows do not count towards the next refit
+            entry = self._store(user_id, fit_anomaly_model(training_rows))
+            return entry['model'].decision_function(np.asarray(rows, dtype=float))
+
+        scores = entry['model'].decision_function(np.asarray(rows, dtype=float))
+
+        with self._lock:
+            now = time.monotonic()
+            entry['scored'] += len(rows)
+            expired = now - entry['fitted_at'] >= self.ttl_seconds
+            failed_at = entry['refit_failed_at']
+            backing_off = failed_at is not None and now - failed_at < self.refit_backoff_seconds
+            refit = (entry['scored'] >= self.refit_after or expired) and not backing_off \
+                and user_id not in self._refitting
+            if refit:
+                self._refitting.add(user_id)
+
+        if refit:
+            if self._executor is not None:
+                self._executor.submit(self._refit, user_id, [list(r) for r in training_rows])
+            else:
+                self._refit(user_id, training_rows)
+
+        return scores
+
+    def invalidate(self, user_id):
+        """
+        Drop a user's model so the next score refits it
+        """
+        with self._lock:
+            entry = self._models.pop(user_id, None)
+            if entry is not None:
+                self.current_bytes -= entry['size']
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """
+        Get cache counters for tuning
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'models': len(self._models),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups > 0 else 0,
+                'refits': self.refits,
+                'refit_failures': self.refit_failures,
+                'refits_in_progress': len(self._refitting),
+                'evictions': self.evictions,
+                'refit_after': self.refit_after,
+                'ttl_seconds': self.ttl_seconds,
+                'refit_backoff_seconds': self.refit_backoff_seconds
+            }
+
+    def _refit(self, user_id, training_rows):
+        try:
+            self._store(user_id, fit_anomaly_model(training_rows))
+            with self._lock:
+                self.refits += 1
+        except Exception as e:
+            print(f"Fraud model refit error for user {user_id}: {e}")
+            with self._lock:
+                self.refit_failures += 1
+                entry = self._models.get(user_id)
+                if entry is not None:
+                    # Keep serving the old model and back off rather than refit on every score
+                    entry['scored'] = 0
+                    entry['refit_failed_at'] = time.monotonic()
+        finally:
+            with self._lock:
+                self._refitting.discard(user_id)
+
+    def _store(self, user_id, model):
+        entry = {
+            'model': model,
+            'size': len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)),
+            'fitted_at': time.monotonic(),
+            'scored': 0,
+            'refit_failed_at': None
+        }
+
+        with self._lock:
+            previous = self._models.pop(user_id, None)
+            if previous is not None:
+                self.current_bytes -= previous['size']
+
+            self._models[user_id] = entry
+            self.current_bytes += entry['size']
+
+            # Evict least recently used models until we are under the memory cap
+            while self.current_bytes > self.max_bytes and len(self._models) > 1:
+                _, evicted = self._models.popitem(last=False)
+                self.current_bytes -= evicted['size']
+                self.evictions += 1
+
+        return entry
+
+
+# Create an instance of the cache
+fraud_model_cache = FraudModelCache()
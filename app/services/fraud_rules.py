@@ -0,0 +1,246 @@
+import threading
+import time
+
+import numpy as np
+
+from app import db
+from app.models.fraud_rule import FraudRule
+from config.settings import Config
+
+# Fields a rule can test, with the type rule values are coerced to
+RULE_FIELDS = {
+    'amount': float,
+    'hour': int,
+    'day_of_week': int,
+    'currency': str,
+    'transaction_type': str,
+    'merchant_id': str,
+    'card_id': str,
+    'user_id': str
+}
+
+# Rule operators and the Python operator they compile to
+RULE_OPERATORS = {
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+    'eq': '==',
+    'ne': '!=',
+    'in': 'in',
+    'not_in': 'not in'
+}
+
+NUMERIC_OPERATORS = {'gt', 'gte', 'lt', 'lte'}
+SET_OPERATORS = {'in', 'not_in'}
+
+# Accepted spellings of is_active, as sent in JSON or form data
+BOOLEAN_VALUES = {'true': True, '1': True, 'false': False, '0': False}
+
+
+def validate_rule(rule_data):
+    """
+    Validate rule input and return it normalized
+    Raises ValueError describing the first problem found
+    """
+    name = rule_data.get('name')
+    field = rule_data.get('field')
+    operator = rule_data.get('operator')
+    value = rule_data.get('value')
+    score = rule_data.get('score')
+
+    if not name:
+        raise ValueError('Rule name is required')
+    if field not in RULE_FIELDS:
+        raise ValueError(f"Unsupported field '{field}'. Supported fields: {', '.join(RULE_FIELDS)}")
+    if operator not in RULE_OPERATORS:
+        raise ValueError(f"Unsupported operator '{operator}'. Supported operators: {', '.join(RULE_OPERATORS)}")
+    if operator in NUMERIC_OPERATORS and RULE_FIELDS[field] is str:
+        raise ValueError(f"Operator '{operator}' cannot be used with field '{field}'")
+
+    try:
+        coerce = RULE_FIELDS[field]
+        if operator in SET_OPERATORS:
+            if not isinstance(value, (list, tuple)) or not value:
+                raise ValueError(f"Operator '{operator}' requires a non-empty list value")
+            value = sorted({coerce(v) for v in value})
+        else:
+            value = coerce(value)
+        score = float(score)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid rule value or score: {e}")
+
+    is_active = rule_data.get('is_active', True)
+    if not isinstance(is_active, bool):
+        is_active = BOOLEAN_VALUES.get(str(is_active).strip().lower())
+        if is_active is None:
+            raise ValueError(f"Invalid is_active '{rule_data['is_active']}'. Use true or false")
+
+    return {
+        'name': name,
+        'description': rule_data.get('description'),
+        'field': field,
+        'operator': operator,
+        'value': value,
+        'score': score,
+        'is_active': is_active
+    }
+
+
+def transaction_features(transaction, now):
+    """
+    Build the feature dict rules are evaluated against
+    """
+    return {
+        'amount': transaction.amount,
+        'hour': now.hour,
+        'day_of_week': now.weekday(),
+        'currency': transaction.currency,
+        'transaction_type': transaction.transaction_type,
+        'merchant_id': transaction.merchant_id,
+        'card_id': transaction.card_id,
+        'user_id': transaction.user_id
+    }
+
+
+def transaction_columns(transactions, times, fields):
+    """
+    Build column arrays for the given fields over a batch of transactions
+    scored at the matching entries of times
+    """
+    columns = {}
+    for field in fields:
+        if field == 'hour':
+            columns[field] = np.array([t.hour for t in times])
+        elif field == 'day_of_week':
+            columns[field] = np.array([t.weekday() for t in times])
+        elif field == 'amount':
+            columns[field] = np.array([t.amount for t in transactions], dtype=float)
+        else:
+            columns[field] = np.array([getattr(t, field) for t in transactions], dtype=object)
+    return columns
+
+
+class CompiledRuleSet:
+    """
+    Immutable set of rules compiled into two generated functions: one that
+    scores a single feature dict and one that scores column arrays
+    """
+
+    def __init__(self, rules, version=0):
+        self.rules = tuple(rules)
+        self.version = version
+        self.fields = sorted({rule['field'] for rule in self.rules})
+        self.source = self._generate_source()
+
+        namespace = {'np': np}
+        for i, rule in enumerate(self.rules):
+            value = rule['value']
+            namespace[f'_v{i}'] = frozenset(value) if rule['operator'] in SET_OPERATORS else value
+            namespace[f'_l{i}'] = list(value) if rule['operator'] in SET_OPERATORS else None
+            namespace[f'_s{i}'] = rule['score']
+            namespace[f'_id{i}'] = rule['id']
+
+        exec(compile(self.source, f'<fraud-rules-v{version}>', 'exec'), namespace)
+        self._evaluate = namespace['_evaluate']
+        self._evaluate_batch = namespace['_evaluate_batch']
+
+    def evaluate(self, features):
+        """Return (score, matched rule ids) for one feature dict"""
+        return self._evaluate(features)
+
+    def evaluate_batch(self, columns, size):
+        """Return an array of rule scores for column arrays of length size"""
+        return self._evaluate_batch(columns, size)
+
+    def _generate_source(self):
+        # Field names and operators come from the whitelists above and rule
+        # values are bound as constants, so nothing user supplied is inlined
+        scalar = ['def _evaluate(f):', '    score = 0.0', '    matched = []']
+        batch = ['def _evaluate_batch(c, n):', '    score = np.zeros(n)']
+
+        for field in self.fields:
+            scalar.append(f'    {field} = f[{field!r}]')
+            batch.append(f'    {field} = c[{field!r}]')
+
+        for i, rule in enumerate(self.rules):
+            field, operator = rule['field'], rule['operator']
+            scalar.append(f'    if {field} {RULE_OPERATORS[operator]} _v{i}:')
+            scalar.append(f'        score += _s{i}')
+            scalar.append(f'        matched.append(_id{i})')
+
+            if operator == 'in':
+                condition = f'np.isin({field}, _l{i})'
+            elif operator == 'not_in':
+                condition = f'~np.isin({field}, _l{i})'
+            else:
+                condition = f'({field} {RULE_OPERATORS[operator]} _v{i})'
+            batch.append(f'    score += np.where({condition}, _s{i}, 0.0)')
+
+        scalar.append('    return score, matched')
+        batch.append('    return score')
+        return '\n'.join(scalar) + '\n\n' + '\n'.join(batch) + '\n'
+
+
+class FraudRuleEngine:
+    """
+    Holds the compiled rule set and hot-swaps it when rules change.
+
+    Readers grab the current CompiledRuleSet reference once per evaluation,
+    so a reload replaces it atomically without locking the scoring path.
+    Changes made by other processes are picked up by a cheap signature
+    check (rule count and latest update time) every `refresh_seconds`.
+    """
+
+    def __init__(self, refresh_seconds=None):
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else Config.FRAUD_RULES_REFRESH_SECONDS
+        self._compiled = CompiledRuleSet([])
+        self._signature = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    @property
+    def compiled(self):
+        return self._compiled
+
+    def evaluate(self, features):
+        return self._compiled.evaluate(features)
+
+    def refresh_if_stale(self):
+        """
+        Reload the rules if the refresh interval has passed and they changed
+        """
+        if self._checked_at is not None and time.monotonic() - self._checked_at < self.refresh_seconds:
+            return
+        try:
+            self.reload()
+        except Exception as e:
+            print(f"Fraud rule reload error: {e}")
+            self._checked_at = time.monotonic()
+
+    def reload(self, force=False):
+        """
+        Recompile the active rules from the database and swap them in
+        Returns True if a new rule set was installed
+        """
+        with self._lock:
+            signature = tuple(db.session.query(db.func.count(FraudRule.id), db.func.max(FraudRule.updated_at)).one())
+            self._checked_at = time.monotonic()
+            if not force and signature == self._signature:
+                return False
+
+            rules = FraudRule.query.filter_by(is_active=True).order_by(FraudRule.created_at).all()
+            compiled = CompiledRuleSet(
+                [{'id': r.id, 'field': r.field, 'operator': r.operator, 'value': r.value, 'score': r.score} for r in rules],
+                version=self._compiled.version + 1
+            )
+
+            self._compiled = compiled
+            self._signature = signature
+            self.reloads += 1
+            return True
+
+
+# Create an instance of the engine
+fraud_rule_engine = FraudRuleEngine()
@@ -0,0 +1,192 @@
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from flask import current_app
+
+from config.settings import Config
+
+
+def score_anomaly(user_id, training_rows, current_row):
+    """
+    Runs inside a pool worker: score one feature row against the worker's
+    own cached model and return the 0-100 anomaly score
+    """
+    from app.services.fraud_model_cache import fraud_model_cache
+
+    scores = fraud_model_cache.score(user_id, training_rows, [current_row])
+    return 100 if scores[0] < 0 else 0
+
+
+def warm_worker():
+    """
+    Runs once in each new pool worker: import sklearn and fit a throwaway
+    model so the worker's first real score isn't spent loading them
+    """
+    from app.services.fraud_model_cache import fit_anomaly_model
+
+    fit_anomaly_model([[1.0, 0, 0], [2.0, 12, 3], [3.0, 23, 6]])
+
+
+class FraudScoringPool:
+    """
+    Process pool that runs anomaly scoring off the request thread.
+
+    Callers submit work and wait up to `timeout_ms`. When the deadline
+    passes the caller falls back to a rules-only score and hands the
+    still-running future to `defer`, whose callback is applied in an app
+    context once the full score arrives. At most `queue_depth` scores are
+    in flight; beyond that `submit` returns None and callers skip the pool.
+    Workers load sklearn when they start (warm_worker); warm() starts them
+    ahead of the first request.
+    """
+
+    def __init__(self, pool_size=None, queue_depth=None, timeout_ms=None):
+        self.pool_size = pool_size if pool_size is not None else Config.FRAUD_SCORING_POOL_SIZE
+        self.queue_depth = queue_depth if queue_depth is not None else Config.FRAUD_SCORING_QUEUE_DEPTH
+        self.timeout_ms = timeout_ms if timeout_ms is not None else Config.FRAUD_SCORING_TIMEOUT_MS
+
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.queue_depth)
+        self._lock = threading.Lock()
+        self._deferred = queue.Queue()
+        self._deferred_thread = None
+
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.failures = 0
+        self.deferred_pending = 0
+        self.deferred_completed = 0
+        self.deferred_flagged = 0
+
+    @property
+    def enabled(self):
+        return self.pool_size > 0
+
+    def submit(self, fn, *args):
+        """
+        Submit work to the pool
+        Returns a future, or None if the queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return None
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.submitted += 1
+            self.in_flight += 1
+        future.add_done_callback(self._on_done)
+        return future
+
+    def warm(self):
+        """
+        Start the workers now rather than on the first submit. Does not wait
+        for them; does nothing when the pool is disabled.
+        """
+        if self.enabled:
+            # With spawn, the first submit starts every worker, each running warm_worker
+            self._get_executor().submit(int)
+
+    def wait(self, future):
+        """
+        Wait for a future up to the deadline
+        Raises concurrent.futures.TimeoutError when the deadline passes
+        """
+        try:
+            return future.result(timeout=self.timeout_ms / 1000)
+        except FutureTimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise
+
+    def defer(self, future, callback):
+        """
+        Run callback(result) in an app context once a timed out future finishes.
+        The callback returns True if it flagged the transaction.
+        """
+        app = current_app._get_current_object()
+        with self._lock:
+            self.deferred_pending += 1
+            if self._deferred_thread is None:
+                self._deferred_thread = threading.Thread(target=self._run_deferred, name='fraud-deferred-scores', daemon=True)
+                self._deferred_thread.start()
+        future.add_done_callback(lambda done: self._deferred.put((done, callback, app)))
+
+    def stats(self):
+        """
+        Get pool configuration and counters
+        """
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'pool_size': self.pool_size,
+                'queue_depth': self.queue_depth,
+                'timeout_ms': self.timeout_ms,
+                'in_flight': self.in_flight,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+                'failures': self.failures,
+                'deferred_pending': self.deferred_pending,
+                'deferred_completed': self.deferred_completed,
+                'deferred_flagged': self.deferred_flagged
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawn rather than fork: the parent has live threads and DB connections
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=warm_worker
+                )
+            return self._executor
+
+    def _on_done(self, future):
+        self._slots.release()
+        with self._lock:
+            self.in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failures += 1
+            else:
+                self.completed += 1
+
+    def _run_deferred(self):
+        while True:
+            future, callback, app = self._deferred.get()
+            flagged = False
+            try:
+                if not future.cancelled() and future.exception() is None:
+                    with app.app_context():
+                        flagged = bool(callback(future.result()))
+            except Exception as e:
+                print(f"Deferred fraud scoring error: {e}")
+            finally:
+                with self._lock:
+                    self.deferred_pending -= 1
+                    self.deferred_completed += 1
+                    if flagged:
+                        self.deferred_flagged += 1
+
+
+# Create an instance of the pool
+fraud_scoring_pool = FraudScoringPool()
@@ -0,0 +1,261 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.idempotency_key import IdempotencyKey
+from config.settings import Config
+
+
+class _InFlight:
+    def __init__(self, request_hash):
+        self.request_hash = request_hash
+        self.response = None
+        self.done = threading.Event()
+
+
+class IdempotencyStore:
+    """
+    Runs each (scope, key) at most once and replays the stored result.
+
+    Completed results are kept in an in-memory LRU in front of the
+    idempotency_keys table, so repeats seen by this process are answered
+    without touching the database. Concurrent duplicates in one process
+    wait on the first execution; across processes the first to insert the
+    key's row owns it and the others poll that row until it completes.
+    Claims are written on their own connection so they are visible to
+    other processes before the payment itself commits.
+
+    A claim is never taken over while it is in progress, even once its
+    owner is past `lock_seconds`: the owner may still be waiting on the
+    acquirer, or may have charged and died before recording the result,
+    so running the request again could charge twice. Repeats of such a
+    key get 'in_progress' (409) until it expires.
+    """
+
+    def __init__(self, ttl_seconds=None, cache_size=None, lock_seconds=None, wait_seconds=None):
+        self.ttl_seconds = ttl_seconds or Config.IDEMPOTENCY_TTL_SECONDS
+        self.cache_size = cache_size or Config.IDEMPOTENCY_CACHE_SIZE
+        self.lock_seconds = lock_seconds or Config.IDEMPOTENCY_LOCK_SECONDS
+        self.wait_seconds = wait_seconds if wait_seconds is not None else Config.IDEMPOTENCY_WAIT_SECONDS
+
+        self._cache = OrderedDict()  # (scope, key) -> (expires at, request hash, response)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.conflicts = 0
+
+    @staticmethod
+    def request_hash(params):
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def execute(self, scope, key, params, fn):
+        """
+        Return fn()'s result for a new key, or the stored result for a repeat.
+        Results with status 'error' or 'unavailable' are not stored, so the request can be retried:
+        fn() must only return those when it failed before anything reached the acquirer. Any other
+        result, 'pending' included, is stored, and a key whose fn() raised stays claimed.
+        """
+        request_hash = self.request_hash(params)
+        cache_key = (scope, key)
+
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                if cached[0] > time.time():
+                    self._cache.move_to_end(cache_key)
+                    self.hits += 1
+                else:
+                    del self._cache[cache_key]
+                    cached = None
+
+            flight = None
+            if cached is None:
+                flight = self._in_flight.get(cache_key)
+                owner = flight is None
+                if owner:
+                    flight = self._in_flight[cache_key] = _InFlight(request_hash)
+                else:
+                    self.coalesced += 1
+
+        if cached is not None:
+            return self._replay(cached[1], cached[2], request_hash)
+
+        if not owner:
+            flight.done.wait(self.wait_seconds)
+            if flight.response is None:
+                return self._in_progress()
+            return self._replay(flight.request_hash, flight.response, request_hash)
+
+        try:
+            flight.response = self._execute_claimed(scope, key, request_hash, fn)
+            return flight.response
+        finally:
+            with self._lock:
+                self._in_flight.pop(cache_key, None)
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cached_keys': len(self._cache),
+                'in_flight': len(self._in_flight),
+                'hits': self.hits,
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'conflicts': self.conflicts
+            }
+
+    def purge_expired(self):
+        """
+        Delete expired keys from the table
+        Returns the number of rows deleted
+        """
+        table = IdempotencyKey.__table__
+        with db.engine.begin() as conn:
+            result = conn.execute(table.delete().where(table.c.expires_at <= datetime.utcnow()))
+
+        now = time.time()
+        with self._lock:
+            for cache_key in [k for k, (expires_at, _, _) in self._cache.items() if expires_at <= now]:
+                del self._cache[cache_key]
+        return result.rowcount
+
+    def _execute_claimed(self, scope, key, request_hash, fn):
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            state, row = self._claim(scope, key, request_hash)
+            if state == 'claimed':
+                break
+            if state == 'completed':
+                self._remember(scope, key, row.request_hash, row.response, row.expires_at)
+                with self._lock:
+                    self.hits += 1
+                return self._replay(row.request_hash, row.response, request_hash)
+            if state == 'stale':
+                return self._in_progress(stale=True)
+            # Another process is running this key
+            if time.monotonic() >= deadline:
+                return self._in_progress()
+            time.sleep(0.05)
+
+        with self._lock:
+            self.executions += 1
+        # If fn() raises, it may have reached the acquirer first, so the key is not released for a rerun
+        response = fn()
+
+        # Nothing was sent, so a retry cannot charge twice
+        if response.get('status') in ('error', 'unavailable'):
+            self._release(scope, key)
+            return response
+
+        try:
+            expires_at = self._complete(scope, key, response)
+        except Exception as e:
+            # fn() has run, so the key stays claimed rather than being released for a rerun
+            print(f"Idempotency key completion error: {e}")
+            return response
+        self._remember(scope, key, request_hash, response, expires_at)
+        return response
+
+    def _claim(self, scope, key, request_hash):
+        table = IdempotencyKey.__table__
+        now = datetime.utcnow()
+        values = {
+            'request_hash': request_hash,
+            'status': 'in_progress',
+            'response': None,
+            'locked_until': now + timedelta(seconds=self.lock_seconds),
+            'created_at': now,
+            'expires_at': now + timedelta(seconds=self.ttl_seconds)
+        }
+
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert().values(scope=scope, key=key, **values))
+            return 'claimed', None
+        except IntegrityError:
+            pass
+
+        with db.engine.begin() as conn:
+            row = conn.execute(db.select(table).where(table.c.scope == scope, table.c.key == key)).first()
+            if row is None:
+                return 'in_progress', None
+
+            # Take over an expired key; an in-progress claim is never run again
+            if row.expires_at <= now:
+                result = conn.execute(table.update()
+                                      .where(table.c.scope == scope, table.c.key == key,
+                                             table.c.status == row.status,
+                                             table.c.locked_until == row.locked_until,
+                                             table.c.expires_at == row.expires_at)
+                                      .values(**values))
+                return ('claimed', None) if result.rowcount == 1 else ('in_progress', None)
+
+            if row.status == 'completed':
+                return 'completed', row
+            if row.locked_until <= now:
+                return 'stale', None
+            return 'in_progress', None
+
+    def _complete(self, scope, key, response):
+        table = IdempotencyKey.__table__
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        with db.engine.begin() as conn:
+            conn.execute(table.update()
+                         .where(table.c.scope == scope, table.c.key == key)
+                         .values(status='completed', response=response, expires_at=expires_at))
+        return expires_at
+
+    def _release(self, scope, key):
+        table = IdempotencyKey.__table__
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.scope == scope, table.c.key == key,
+                                                  table.c.status == 'in_progress'))
+        except Exception as e:
+            print(f"Idempotency key release error: {e}")
+
+    def _remember(self, scope, key, request_hash, response, expires_at):
+        expires_ts = (expires_at - datetime(1970, 1, 1)).total_seconds()
+        with self._lock:
+            self._cache[(scope, key)] = (expires_ts, request_hash, response)
+            self._cache.move_to_end((scope, key))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _replay(self, stored_hash, response, request_hash):
+        if stored_hash != request_hash:
+            with self._lock:
+                self.conflicts += 1
+            return {
+                'success': False,
+                'message': 'Idempotency key was already used with different request parameters',
+                'status': 'conflict'
+            }
+        return dict(response, idempotent_replay=True)
+
+    @staticmethod
+    def _in_progress(stale=False):
+        if stale:
+            message = ('A request with this idempotency key did not finish and may have been charged; '
+                       'it is not run again')
+        else:
+            message = 'A request with this idempotency key is still in progress'
+        return {
+            'success': False,
+            'message': message,
+            'status': 'in_progress'
+        }
+
+
+# Create an instance of the store
+idempotency_store = IdempotencyStore()
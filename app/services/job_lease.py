@@ -0,0 +1,68 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.job_lease import JobLease
+
+
+class JobLeases:
+    """
+    Elects one process to run a background job, by name.
+
+    A job's lease is a row in job_leases held by a random per-process
+    owner token until it expires. Its holder renews it every time it asks,
+    and any process may take it over once it has expired, so a holder that
+    stops is replaced after one lease period. These leases are separate
+    from the worker id leases behind reference numbers.
+    """
+
+    def __init__(self):
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Also runs in a forked child: the parent's leases are not ours
+        self._owner = uuid.uuid4().hex
+
+    def hold(self, name, ttl_seconds):
+        """
+        True if this process holds the lease `name` for the next
+        `ttl_seconds`: it already held it, or it was free or expired.
+        Must run in an app context.
+        """
+        table = JobLease.__table__
+        now = datetime.utcnow()
+        values = {'owner': self._owner, 'hostname': socket.gethostname(), 'pid': os.getpid(),
+                  'expires_at': now + timedelta(seconds=ttl_seconds)}
+
+        with db.engine.begin() as conn:
+            result = conn.execute(table.update()
+                                  .where(table.c.name == name,
+                                         db.or_(table.c.owner == self._owner, table.c.expires_at <= now))
+                                  .values(**values))
+        if result.rowcount == 1:
+            return True
+
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert().values(name=name, acquired_at=now, **values))
+            return True
+        except IntegrityError:
+            # Held by another process
+            return False
+
+    def release(self, name):
+        """
+        Give the lease up so another process can take it right away
+        """
+        table = JobLease.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.name == name, table.c.owner == self._owner))
+
+
+# Create an instance of the leases
+job_leases = JobLeases()
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.models.merchant import Merchant
+from config.settings import Config
+
+
+class MerchantCache:
+    """
+    Process-local LRU cache of merchant summaries (name and status) for
+    pages that only need to label a merchant.
+
+    Entries are dropped when a merchant is updated or deleted through the
+    ORM in this process: once at flush and again after the commit, so a
+    reader racing the commit cannot put the old row back. A load that
+    started before an invalidation is not cached. Changes made by other
+    processes are picked up after `ttl_seconds`.
+    """
+
+    def __init__(self, max_size=None, ttl_seconds=None):
+        self.max_size = max_size if max_size is not None else Config.MERCHANT_CACHE_SIZE
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else Config.MERCHANT_CACHE_TTL_SECONDS
+
+        self._summaries = OrderedDict()  # merchant_id -> (expires_at, summary), least recently used first
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, merchant_id):
+        """
+        Summary dict for one merchant, or None if it does not exist
+        """
+        return self.get_many([merchant_id]).get(merchant_id)
+
+    def get_many(self, merchant_ids):
+        """
+        Summaries for several merchants, loading all misses in one query.
+        Returns {merchant_id: summary}; unknown ids are left out.
+        """
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for merchant_id in set(merchant_ids):
+                entry = self._summaries.get(merchant_id)
+                if entry is not None and entry[0] > now:
+                    self._summaries.move_to_end(merchant_id)
+                    found[merchant_id] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.append(merchant_id)
+                    self.misses += 1
+            generation = self._generation
+
+        if missing:
+            loaded = {merchant.id: self.summarize(merchant)
+                      for merchant in Merchant.query.filter(Merchant.id.in_(missing))}
+            found.update(loaded)
+            with self._lock:
+                if generation == self._generation:
+                    expires_at = time.monotonic() + self.ttl_seconds
+                    for merchant_id, summary in loaded.items():
+                        self._summaries[merchant_id] = (expires_at, summary)
+                        self._summaries.move_to_end(merchant_id)
+                    while len(self._summaries) > self.max_size:
+                        self._summaries.popitem(last=False)
+        return found
+
+    def invalidate(self, merchant_id):
+        with self._lock:
+            self._summaries.pop(merchant_id, None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._summaries.clear()
+            self._generation += 1
+
+    @staticmethod
+    def summarize(merchant):
+        return {
+            'id': merchant.id,
+            'name': merchant.business_name,
+            'is_active': merchant.is_active,
+            'is_verified': merchant.is_verified
+        }
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._summaries), 'hits': self.hits, 'misses': self.misses}
+
+
+# Create an instance of the cache
+merchant_cache = MerchantCache()
+
+
+@event.listens_for(Merchant, 'after_update')
+@event.listens_for(Merchant, 'after_delete')
+def _merchant_changed(mapper, connection, target):
+    merchant_cache.invalidate(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_merchant_ids', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_merchants(session):
+    for merchant_id in session.info.pop('changed_merchant_ids', ()):
+        merchant_cache.invalidate(merchant_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_merchants(session):
+    session.info.pop('changed_merchant_ids', None)
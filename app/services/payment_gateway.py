@@ -1,16 +1,48 @@
+import math
 import uuid
-import random
-from datetime import datetime
+from datetime import datetime, timedelta
 from app import db
+from app.models.merchant import Merchant
 from app.models.transaction import Transaction
+from app.models.user import Card
 from app.services.fraud_detection import FraudDetectionService
+from app.services.acquirer import acquirer, authorization_request
+from app.services.feature_store import FeatureStore
+from app.services.idempotency import idempotency_store
+from app.services.payment_journal import payment_journal
+from app.services.reference import reference_generator
+from app.services.state_machine import transaction_states, TransitionConflictError
+from app.services.transaction_stats import transaction_stats
+from app.services.velocity import velocity_store
+from config.settings import Config
+
+# Half a cent, so float rounding never rejects refunding the exact remainder
+REFUND_TOLERANCE = 0.005
 
 class PaymentGateway:
     @staticmethod
-    def process_payment(user_id, merchant_id, card_id, amount, currency='USD', description=None):
+    def process_payment(user_id, merchant_id, card_id, amount, currency='USD', description=None, idempotency_key=None):
         """
         Process a payment transaction
+        When the acquirer's answer is unknown (timeout, error) the payment
+        stays 'pending' for reconcile_pending_payments().
+        A repeated idempotency key returns the first result without charging again.
         """
+        if idempotency_key:
+            return idempotency_store.execute(
+                f'payment:{user_id}', idempotency_key,
+                {'merchant_id': merchant_id, 'card_id': card_id, 'amount': amount, 'currency': currency, 'description': description},
+                lambda: PaymentGateway.process_payment(user_id, merchant_id, card_id, amount, currency, description)
+            )
+        
+        # Fail fast while the acquirer's circuit is open, before anything is written
+        if not acquirer.is_available():
+            return PaymentGateway._acquirer_unavailable()
+        
+        if Config.PAYMENT_SINGLE_COMMIT:
+            return PaymentGateway._process_payment_single_commit(user_id, merchant_id, card_id, amount, currency, description)
+        
+        sent = False
         try:
             # Generate reference number
             reference = PaymentGateway._generate_reference()
@@ -24,10 +56,16 @@ class PaymentGateway:
                 currency=currency,
                 description=description,
                 reference_number=reference,
-                status='pending'
+                status='pending',
+                created_at=datetime.utcnow()
             )
             
             db.session.add(transaction)
+            transaction_stats.record_created(transaction.created_at, transaction.status)
+            
+            # Update the user's fraud features in the same commit
+            FeatureStore.record_transaction(transaction)
+            velocity_store.record(transaction)
             db.session.commit()
             
             # Run fraud detection
@@ -42,12 +80,26 @@ class PaymentGateway:
                     'status': 'blocked'
                 }
             
-            # Simulate payment processing
-            success = PaymentGateway._simulate_payment_processing()
+            # Authorize with the acquirer
+            sent = True
+            status = PaymentGateway._authorize(transaction)
+            if status == 'pending':
+                return PaymentGateway._payment_pending(reference)
             
-            if success:
-                transaction.status = 'completed'
-                db.session.commit()
+            try:
+                transaction_states.apply(transaction, status)
+            except TransitionConflictError:
+                # A late fraud score flagged it while we waited on the acquirer; leave it for review
+                db.session.rollback()
+                return {
+                    'success': False,
+                    'message': 'Transaction was flagged for potential fraud',
+                    'reference': reference,
+                    'status': 'flagged_for_fraud'
+                }
+            db.session.commit()
+            
+            if status == 'completed':
                 return {
                     'success': True,
                     'message': 'Payment processed successfully',
@@ -55,8 +107,6 @@ class PaymentGateway:
                     'status': 'completed'
                 }
             else:
-                transaction.status = 'failed'
-                db.session.commit()
                 return {
                     'success': False,
                     'message': 'Payment processing failed',
@@ -67,6 +117,9 @@ class PaymentGateway:
         except Exception as e:
             db.session.rollback()
             print(f"Payment processing error: {e}")
+            # The row is still 'pending'; once the acquirer may have charged, a retry must not run again
+            if sent:
+                return PaymentGateway._payment_pending(reference)
             return {
                 'success': False,
                 'message': f'An error occurred: {str(e)}',
@@ -74,13 +127,356 @@ class PaymentGateway:
             }
     
     @staticmethod
-    def refund_transaction(transaction_id, amount=None, reason=None):
+    def _process_payment_single_commit(user_id, merchant_id, card_id, amount, currency='USD', description=None):
+        """
+        Process a payment with one commit: the reference, fraud score and
+        gateway decision are settled before the row is written, so only a
+        payment whose outcome is unknown is ever 'pending'. The journal
+        covers the window between the gateway call and the commit. No
+        database transaction or profile lock is held across the gateway
+        call: the score uses a copy of the profile, and the profile row is
+        locked and updated just before the commit. If that commit fails,
+        the journal writes the payment as 'pending' at once for
+        reconcile_pending_payments().
+        """
+        journaled = None
+        try:
+            reference = PaymentGateway._generate_reference()
+            
+            # The id is set up front so the journal can refer to it
+            transaction = Transaction(
+                id=str(uuid.uuid4()),
+                user_id=user_id,
+                merchant_id=merchant_id,
+                card_id=card_id,
+                amount=amount,
+                currency=currency,
+                description=description,
+                reference_number=reference,
+                transaction_type='payment',
+                status='pending',
+                is_fraudulent=False,
+                created_at=datetime.utcnow()
+            )
+            
+            velocity_store.record(transaction)
+            
+            # Run fraud detection inline; the row isn't written for a deferred score to update
+            profile = FeatureStore.preview_profile(transaction)
+            is_fraudulent = FraudDetectionService.is_transaction_fraudulent(transaction, user_id, deferrable=False,
+                                                                            profile=profile)
+            
+            # Nothing is written yet; end the read transaction before calling the acquirer
+            db.session.commit()
+            
+            if not is_fraudulent:
+                payment_journal.begin(transaction)
+                journaled = transaction
+                # An unknown outcome is written as 'pending'
+                transaction_states.apply(transaction, PaymentGateway._authorize(transaction))
+            
+            FeatureStore.record_transaction(transaction)
+            db.session.add(transaction)
+            transaction_stats.record_created(transaction.created_at, transaction.status)
+            db.session.commit()
+            
+            if is_fraudulent:
+                return {
+                    'success': False,
+                    'message': 'Transaction was flagged for potential fraud',
+                    'reference': reference,
+                    'status': 'blocked'
+                }
+            
+            payment_journal.commit(transaction.id)
+            
+            if transaction.status == 'pending':
+                return PaymentGateway._payment_pending(reference)
+            if transaction.status == 'completed':
+                return {
+                    'success': True,
+                    'message': 'Payment processed successfully',
+                    'reference': reference,
+                    'status': 'completed'
+                }
+            return {
+                'success': False,
+                'message': 'Payment processing failed',
+                'reference': reference,
+                'status': 'failed'
+            }
+        
+        except Exception as e:
+            db.session.rollback()
+            print(f"Payment processing error: {e}")
+            if journaled is not None:
+                # If resolve() fails too, the begin entry stays for recover(); either way it may have been charged
+                payment_journal.resolve(journaled)
+                return PaymentGateway._payment_pending(journaled.reference_number)
+            return {
+                'success': False,
+                'message': f'An error occurred: {str(e)}',
+                'status': 'error'
+            }
+    
+    @staticmethod
+    def process_payments_batch(merchant_id, charges, chunk_size=None, idempotency_key=None):
+        """
+        Process a batch of charges for one merchant.
+        Each chunk of valid charges is fraud scored in one pass, bulk
+        inserted as pending, authorized concurrently and settled in a second
+        commit. Returns a result per charge in input order.
+        """
+        if idempotency_key:
+            return idempotency_store.execute(
+                f'payment_batch:{merchant_id}', idempotency_key, {'charges': charges},
+                lambda: PaymentGateway.process_payments_batch(merchant_id, charges, chunk_size)
+            )
+        
+        chunk_size = chunk_size or Config.PAYMENT_BATCH_CHUNK_SIZE
+        
+        if not isinstance(charges, list) or not charges:
+            return {'success': False, 'message': 'charges must be a non-empty list'}
+        if len(charges) > Config.PAYMENT_BATCH_MAX_ITEMS:
+            return {'success': False, 'message': f'A batch can contain at most {Config.PAYMENT_BATCH_MAX_ITEMS} charges'}
+        
+        merchant = db.session.get(Merchant, merchant_id)
+        if not merchant or not merchant.is_active:
+            return {'success': False, 'message': 'Merchant not found or inactive'}
+        
+        if not acquirer.is_available():
+            return PaymentGateway._acquirer_unavailable()
+        
+        results = [None] * len(charges)
+        valid = PaymentGateway._validate_batch(charges, results)
+        
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            try:
+                PaymentGateway._process_batch_chunk(merchant_id, chunk, results)
+            except Exception as e:
+                # Raised before the chunk was sent; failures after it leave its charges pending
+                db.session.rollback()
+                print(f"Batch payment processing error: {e}")
+                for index, _ in chunk:
+                    results[index] = {
+                        'index': index,
+                        'success': False,
+                        'message': f'An error occurred: {str(e)}',
+                        'status': 'error'
+                    }
+        
+        summary = {}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+        
+        return {
+            'success': True,
+            'message': f'Processed {len(charges)} charges',
+            'summary': summary,
+            'results': results
+        }
+    
+    @staticmethod
+    def _validate_batch(charges, results):
+        """
+        Check every charge and its card in bulk
+        Fills results for rejected charges and returns [(index, charge)] for the rest
+        """
+        card_ids = list({c.get('card_id') for c in charges if isinstance(c, dict) and c.get('card_id')})
+        cards = {}
+        for start in range(0, len(card_ids), 500):
+            for card_id, user_id, is_active in db.session.query(Card.id, Card.user_id, Card.is_active)\
+                    .filter(Card.id.in_(card_ids[start:start + 500])):
+                cards[card_id] = (user_id, is_active)
+        
+        valid = []
+        for index, charge in enumerate(charges):
+            message = None
+            if not isinstance(charge, dict):
+                message = 'Charge must be an object'
+            elif not charge.get('user_id') or not charge.get('card_id'):
+                message = 'user_id and card_id are required'
+            else:
+                try:
+                    amount = float(charge.get('amount'))
+                except (TypeError, ValueError):
+                    amount = None
+                currency = charge.get('currency', 'USD')
+                card = cards.get(charge['card_id'])
+                
+                if amount is None or amount <= 0:
+                    message = 'Amount must be greater than zero'
+                elif not isinstance(currency, str) or len(currency) != 3:
+                    message = 'Currency must be a 3 letter code'
+                elif card is None or card[0] != charge['user_id'] or not card[1]:
+                    message = 'Card not found'
+                else:
+                    valid.append((index, dict(charge, amount=amount, currency=currency.upper())))
+            
+            if message:
+                results[index] = {'index': index, 'success': False, 'message': message, 'status': 'rejected'}
+        
+        return valid
+    
+    @staticmethod
+    def _process_batch_chunk(merchant_id, chunk, results):
+        """
+        Score, insert and settle one chunk of validated charges.
+        The rows are committed as pending before any is sent to the
+        acquirer, so an approved charge always has its row; the profile
+        locks are taken only once the acquirer has answered. A charge whose
+        outcome is unknown, or whose settling commit fails, stays pending
+        for reconcile_pending_payments().
+        """
+        now = datetime.utcnow()
+        references = reference_generator.next_references(len(chunk))
+        rows = []
+        for (_, charge), reference in zip(chunk, references):
+            rows.append({
+                'id': str(uuid.uuid4()),
+                'user_id': charge['user_id'],
+                'merchant_id': merchant_id,
+                'card_id': charge['card_id'],
+                'amount': charge['amount'],
+                'currency': charge['currency'],
+                'description': charge.get('description'),
+                'reference_number': reference,
+                'transaction_type': 'payment',
+                'status': 'pending',
+                'is_fraudulent': False,
+                'created_at': now,
+                'updated_at': now
+            })
+        
+        # Transient rows for scoring against copies of the profiles; they are written below with one bulk insert
+        transactions = [Transaction(**row) for row in rows]
+        for transaction in transactions:
+            velocity_store.record(transaction)
+        scores = FraudDetectionService.analyze_batch(transactions, profiles=FeatureStore.preview_profiles(transactions))
+        
+        to_authorize = []
+        for row, transaction, score in zip(rows, transactions, scores):
+            row['fraud_score'] = score
+            if score >= Config.FRAUD_DETECTION_THRESHOLD:
+                row['is_fraudulent'] = True
+                row['status'] = 'blocked'
+            else:
+                to_authorize.append((row, transaction))
+        
+        db.session.bulk_insert_mappings(Transaction, rows)
+        transaction_stats.record_created_many((row['created_at'], row['status']) for row in rows)
+        db.session.commit()
+        
+        # From here the charges may reach the acquirer, so a failure leaves them pending
+        try:
+            # Every authorization in the chunk is in flight at once
+            authorizations = acquirer.authorize_many([authorization_request(t) for _, t in to_authorize])
+            by_status = {}
+            for (row, _), authorization in zip(to_authorize, authorizations):
+                by_status.setdefault(PaymentGateway._payment_status(authorization), []).append(row['id'])
+            
+            settled = {}
+            for status, ids in by_status.items():
+                if status != 'pending':
+                    settled.update(dict.fromkeys(transaction_states.transition_many(ids, status, 'pending'), status))
+            FeatureStore.record_transactions(transactions)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Batch payment processing error: {e}")
+            settled = {}
+        
+        for row, _ in to_authorize:
+            row['status'] = settled.get(row['id'], 'pending')
+        
+        messages = {
+            'blocked': 'Transaction was flagged for potential fraud',
+            'completed': 'Payment processed successfully',
+            'failed': 'Payment processing failed',
+            'pending': PaymentGateway._payment_pending(None)['message']
+        }
+        for (index, _), row in zip(chunk, rows):
+            results[index] = {
+                'index': index,
+                'success': row['status'] == 'completed',
+                'message': messages[row['status']],
+                'transaction_id': row['id'],
+                'reference': row['reference_number'],
+                'status': row['status'],
+                'fraud_score': row['fraud_score']
+            }
+    
+    @staticmethod
+    def reconcile_pending_payments(older_than_seconds=None, transaction_ids=None):
+        """
+        Settle payments left 'pending' by a timeout, an acquirer error or a
+        failed commit, once older than `older_than_seconds`
+        (PAYMENT_RECONCILE_AFTER_SECONDS); `transaction_ids` narrows it to
+        those payments. With ACQUIRER_DEDUPES_REFERENCE each authorization
+        is sent again under its own reference, which returns the acquirer's
+        first decision. Otherwise it is voided, so a charge that may have
+        gone through is released and the payment fails.
+        Returns counts of payments checked, completed, failed and still pending.
+        """
+        older_than_seconds = older_than_seconds if older_than_seconds is not None \
+            else Config.PAYMENT_RECONCILE_AFTER_SECONDS
+        cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+        query = Transaction.query.filter(Transaction.transaction_type == 'payment', Transaction.status == 'pending',
+                                         Transaction.created_at <= cutoff)
+        if transaction_ids is not None:
+            query = query.filter(Transaction.id.in_(list(transaction_ids)))
+        payments = query.order_by(Transaction.created_at).all()
+        
+        report = {'checked': len(payments), 'completed': 0, 'failed': 0, 'pending': 0}
+        for payment in payments:
+            try:
+                if Config.ACQUIRER_DEDUPES_REFERENCE:
+                    outcome = acquirer.authorize(authorization_request(payment))
+                    # Refused now says nothing about the first attempt
+                    status = 'pending' if outcome['status'] == 'unavailable' else PaymentGateway._payment_status(outcome)
+                else:
+                    status = 'failed' if acquirer.void(authorization_request(payment))['approved'] else 'pending'
+                if status != 'pending':
+                    transaction_states.apply(payment, status)
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Payment reconcile error for {payment.reference_number}: {e}")
+                status = 'pending'
+            report[status] += 1
+        return report
+    
+    @staticmethod
+    def refund_transaction(transaction_id, amount=None, reason=None, idempotency_key=None):
         """
         Process a refund for a transaction
+        The amount is reserved on the payment's refunded_total before the
+        acquirer is called and given back only if the acquirer declines it,
+        so checking what is left to refund never reads earlier refunds.
+        When the outcome is unknown (timeout, error) the refund stays
+        'pending' with the amount reserved, for reconcile_pending_refunds().
+        A repeated idempotency key returns the first result without refunding again.
         """
+        # None refunds whatever is left; anything else must be at least a cent
+        if amount is not None and not PaymentGateway._is_refund_amount(amount):
+            return {
+                'success': False,
+                'message': 'Refund amount must be a positive number of at least 0.01'
+            }
+        
+        if idempotency_key:
+            return idempotency_store.execute(
+                f'refund:{transaction_id}', idempotency_key, {'amount': amount, 'reason': reason},
+                lambda: PaymentGateway.refund_transaction(transaction_id, amount, reason)
+            )
+        
+        if not acquirer.is_available():
+            return PaymentGateway._acquirer_unavailable()
+        
         try:
             # Find the original transaction
-            transaction = Transaction.query.get(transaction_id)
+            transaction = db.session.get(Transaction, transaction_id)
             
             if not transaction:
                 return {
@@ -88,19 +484,25 @@ class PaymentGateway:
                     'message': 'Transaction not found'
                 }
             
+            if transaction.transaction_type != 'payment':
+                return {
+                    'success': False,
+                    'message': 'Only payments can be refunded'
+                }
+            
             if transaction.status != 'completed':
                 return {
                     'success': False,
                     'message': f'Cannot refund a transaction with status: {transaction.status}'
                 }
             
-            # If no amount is specified, refund the full amount
-            refund_amount = amount if amount else transaction.amount
+            # If no amount is specified, refund whatever is left
+            refund_amount = round(amount if amount is not None else transaction.refundable_amount, 2)
             
-            if refund_amount > transaction.amount:
+            if refund_amount <= 0:
                 return {
                     'success': False,
-                    'message': 'Refund amount cannot exceed the original transaction amount'
+                    'message': 'This transaction has already been fully refunded'
                 }
             
             # Create refund transaction
@@ -113,33 +515,23 @@ class PaymentGateway:
                 description=f"Refund for transaction {transaction.reference_number}: {reason}" if reason else f"Refund for transaction {transaction.reference_number}",
                 reference_number=PaymentGateway._generate_reference(),
                 transaction_type='refund',
-                status='pending'
+                status='pending',
+                original_transaction_id=transaction.id,
+                created_at=datetime.utcnow()
             )
             
             db.session.add(refund)
+            transaction_stats.record_created(refund.created_at, refund.status)
             
-            # Process the refund
-            success = PaymentGateway._simulate_payment_processing(success_rate=95)
-            
-            if success:
-                refund.status = 'completed'
-                db.session.commit()
-                return {
-                    'success': True,
-                    'message': 'Refund processed successfully',
-                    'reference': refund.reference_number,
-                    'status': 'completed'
-                }
-            else:
-                refund.status = 'failed'
-                db.session.commit()
+            # Reserve the amount on the payment in the same commit as the pending refund
+            if not PaymentGateway._adjust_refunded_total(transaction.id, refund_amount):
+                db.session.rollback()
                 return {
                     'success': False,
-                    'message': 'Refund processing failed',
-                    'reference': refund.reference_number,
-                    'status': 'failed'
+                    'message': f'Refund amount exceeds the remaining refundable amount of {db.session.get(Transaction, transaction_id).refundable_amount:.2f}'
                 }
-                
+            reference = refund.reference_number
+            db.session.commit()
         except Exception as e:
             db.session.rollback()
             print(f"Refund processing error: {e}")
@@ -148,19 +540,153 @@ class PaymentGateway:
                 'message': f'An error occurred: {str(e)}',
                 'status': 'error'
             }
+        
+        # From here the refund may reach the acquirer, so a failure leaves it pending and reserved
+        try:
+            outcome = acquirer.refund(authorization_request(refund))
+            return PaymentGateway._finish_refund(refund, outcome)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Refund processing error: {e}")
+            return PaymentGateway._refund_pending(reference)
+    
+    @staticmethod
+    def reconcile_pending_refunds(older_than_seconds=None):
+        """
+        Settle refunds left 'pending' by a timeout or error, once older than
+        `older_than_seconds` (REFUND_RECONCILE_AFTER_SECONDS). Each is sent
+        again under its own reference, which only the acquirer's dedup on
+        the reference makes safe; without ACQUIRER_DEDUPES_REFERENCE they are
+        only counted, for reconciling with the acquirer by hand.
+        Returns counts of refunds checked, completed, failed and still pending.
+        """
+        older_than_seconds = older_than_seconds if older_than_seconds is not None \
+            else Config.REFUND_RECONCILE_AFTER_SECONDS
+        cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+        refunds = (Transaction.query
+                   .filter(Transaction.transaction_type == 'refund', Transaction.status == 'pending',
+                           Transaction.created_at < cutoff)
+                   .order_by(Transaction.created_at).all())
+        
+        report = {'checked': len(refunds), 'completed': 0, 'failed': 0, 'pending': 0}
+        for refund in refunds:
+            if not Config.ACQUIRER_DEDUPES_REFERENCE:
+                report['pending'] += 1
+                continue
+            try:
+                outcome = acquirer.refund(authorization_request(refund))
+                # Refused now says nothing about the first attempt, so keep the amount reserved
+                if outcome['status'] == 'unavailable':
+                    report['pending'] += 1
+                    continue
+                result = PaymentGateway._finish_refund(refund, outcome)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Refund reconcile error for {refund.reference_number}: {e}")
+                result = {'status': 'pending'}
+            report[result['status']] += 1
+        return report
+    
+    @staticmethod
+    def _finish_refund(refund, outcome):
+        """
+        Record the acquirer's answer for a pending refund. Only a decline,
+        or a call refused before it was sent, gives the reserved amount back.
+        """
+        if outcome['approved']:
+            transaction_states.apply(refund, 'completed')
+            db.session.commit()
+            return {
+                'success': True,
+                'message': 'Refund processed successfully',
+                'reference': refund.reference_number,
+                'status': 'completed'
+            }
+        
+        if outcome['status'] in ('declined', 'unavailable'):
+            transaction_states.apply(refund, 'failed')
+            PaymentGateway._adjust_refunded_total(refund.original_transaction_id, -refund.amount)
+            db.session.commit()
+            return {
+                'success': False,
+                'message': 'Refund processing failed',
+                'reference': refund.reference_number,
+                'status': 'failed'
+            }
+        
+        return PaymentGateway._refund_pending(refund.reference_number)
+    
+    @staticmethod
+    def _refund_pending(reference):
+        return {
+            'success': False,
+            'message': 'The refund outcome is not known yet; it stays pending until reconciled with the acquirer',
+            'reference': reference,
+            'status': 'pending'
+        }
+    
+    @staticmethod
+    def _is_refund_amount(amount):
+        # bool is an int, and infinity would pass a plain > 0 check
+        return (isinstance(amount, (int, float)) and not isinstance(amount, bool)
+                and math.isfinite(amount) and round(amount, 2) > 0)
+    
+    @staticmethod
+    def _adjust_refunded_total(transaction_id, amount):
+        """
+        Add `amount` to a payment's refunded total in the current transaction.
+        A reservation only matches while the total stays within the payment
+        amount, so concurrent partial refunds can never over-refund.
+        Returns False if it would.
+        """
+        table = Transaction.__table__
+        conditions = [table.c.id == transaction_id]
+        if amount > 0:
+            conditions += [table.c.status == 'completed',
+                           table.c.refunded_total + amount <= table.c.amount + REFUND_TOLERANCE]
+        result = db.session.execute(
+            table.update().where(*conditions).values(refunded_total=table.c.refunded_total + amount)
+        )
+        return result.rowcount == 1
     
     @staticmethod
     def _generate_reference():
         """
-        Generate a unique reference number for transactions
+        Generate a unique, time-ordered reference number for transactions
         """
-        timestamp = datetime.utcnow().strftime('%Y%m%d%H%M')
-        random_part = str(random.randint(1000, 9999))
-        return f"TX-{timestamp}-{random_part}"
+        return reference_generator.next_reference()
     
     @staticmethod
-    def _simulate_payment_processing(success_rate=90):
+    def _authorize(transaction):
         """
-        Simulate payment processing with a given success rate
+        Authorize a payment with the acquirer
+        Returns the status to record: 'completed', 'failed', or 'pending'
+        when a timeout or acquirer error leaves the outcome unknown
         """
-        return random.randint(1, 100) <= success_rate
\ No newline at end of file
+        return PaymentGateway._payment_status(acquirer.authorize(authorization_request(transaction)))
+    
+    @staticmethod
+    def _payment_status(outcome):
+        if outcome['approved']:
+            return 'completed'
+        # Only a decline, or a call refused before it was sent, is known not to have charged
+        if outcome['status'] in ('declined', 'unavailable'):
+            return 'failed'
+        return 'pending'
+    
+    @staticmethod
+    def _payment_pending(reference):
+        return {
+            'success': False,
+            'message': 'The payment outcome is not known yet; it stays pending until reconciled with the acquirer',
+            'reference': reference,
+            'status': 'pending'
+        }
+    
+    @staticmethod
+    def _acquirer_unavailable():
+        return {
+            'success': False,
+            'message': 'The card acquirer is unavailable, please retry shortly',
+            'status': 'unavailable'
+        }
@@ -0,0 +1,257 @@
+import glob
+import json
+import os
+import threading
+from datetime import datetime
+
+from config.settings import Config
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class PaymentJournal:
+    """
+    Write-ahead journal for single-commit payments.
+
+    Before a payment reaches the gateway its full row is appended as a
+    `begin` entry; once the row is committed a `commit` entry follows.
+    A crash in between leaves a begin without a commit, and recovery
+    writes that payment as 'pending' so the outcome can be reconciled
+    with the acquirer instead of being lost. A commit that fails in a
+    live process is resolved the same way at once, with resolve().
+
+    Each process appends to its own file, so writers never interleave
+    and recovery only touches journals whose process has exited.
+    """
+
+    def __init__(self, directory=None, fsync=None, compact_bytes=None):
+        self.directory = directory or Config.PAYMENT_JOURNAL_DIR
+        self.fsync = fsync if fsync is not None else Config.PAYMENT_JOURNAL_FSYNC
+        self.compact_bytes = compact_bytes or Config.PAYMENT_JOURNAL_COMPACT_BYTES
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+        self.begun = 0
+        self.committed = 0
+        self.compactions = 0
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f'payments-{os.getpid()}.journal')
+
+    def begin(self, transaction):
+        """
+        Durably record a payment before it is sent to the gateway
+        """
+        self._append(self._entry(transaction), durable=True)
+        self.begun += 1
+
+    def commit(self, transaction_id):
+        """
+        Mark a payment as written. Not fsynced: if this entry is lost,
+        recovery finds the row already exists and skips it.
+        """
+        self._append({'op': 'commit', 'id': transaction_id}, durable=False)
+        self.committed += 1
+
+    def resolve(self, transaction):
+        """
+        Settle a journaled payment whose commit failed, from the process
+        that began it: write its row as 'pending' in a commit of its own,
+        then mark it written. Call after rolling back the failed commit.
+        Returns False if the row could not be written either; its begin
+        entry then stays for recover().
+        """
+        from app import db
+
+        try:
+            self._write_pending(self._entry(transaction))
+        except Exception as e:
+            db.session.rollback()
+            print(f"Payment journal resolve error for {transaction.id}: {e}")
+            return False
+        self.commit(transaction.id)
+        return True
+
+    def stats(self):
+        with self._lock:
+            size = self._file.tell() if self._file else 0
+        return {
+            'directory': self.directory,
+            'fsync': self.fsync,
+            'begun': self.begun,
+            'committed': self.committed,
+            'in_flight': self.begun - self.committed,
+            'bytes': size,
+            'compactions': self.compactions
+        }
+
+    def recover(self):
+        """
+        Write rows for payments that were journaled by an exited process but
+        never committed, then remove those journals. Must run in an app context.
+        Each payment commits on its own: one that is already written (also by
+        another process recovering the same journal) is skipped, and one that
+        fails is rolled back and keeps its journal for the next recovery.
+        The recovered payments are then reconciled with the acquirer; any
+        still pending are left to the reconcile-payments job.
+        Returns the number of payments recovered.
+        """
+        from app import db
+        from app.services.payment_gateway import PaymentGateway
+
+        recovered = []
+        for path in glob.glob(os.path.join(self.directory, 'payments-*.journal')):
+            try:
+                pid = int(os.path.basename(path).split('-')[1].split('.')[0])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                if self._file is not None:
+                    continue
+            elif _pid_alive(pid):
+                continue
+
+            try:
+                pending = self._read_pending(path)
+            except FileNotFoundError:
+                # Already recovered by another process
+                continue
+
+            failed = 0
+            for entry in pending:
+                try:
+                    if self._write_pending(entry):
+                        recovered.append(entry['id'])
+                except Exception as e:
+                    db.session.rollback()
+                    failed += 1
+                    print(f"Payment journal recovery error for {entry.get('id')}: {e}")
+
+            if not failed:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+        if recovered:
+            # Their processes are gone, so nothing else is still settling them
+            PaymentGateway.reconcile_pending_payments(older_than_seconds=0, transaction_ids=recovered)
+        return len(recovered)
+
+    @staticmethod
+    def _entry(transaction):
+        return {
+            'op': 'begin',
+            'id': transaction.id,
+            'user_id': transaction.user_id,
+            'merchant_id': transaction.merchant_id,
+            'card_id': transaction.card_id,
+            'amount': transaction.amount,
+            'currency': transaction.currency,
+            'description': transaction.description,
+            'reference_number': transaction.reference_number,
+            'fraud_score': transaction.fraud_score,
+            'created_at': transaction.created_at.isoformat()
+        }
+
+    @staticmethod
+    def _write_pending(entry):
+        """
+        Commit the journaled payment `entry` as a 'pending' row. Returns
+        False if its row is already written, also if another process
+        writes it meanwhile.
+        """
+        from sqlalchemy.exc import IntegrityError
+
+        from app import db
+        from app.models.transaction import Transaction
+        from app.services.feature_store import FeatureStore
+        from app.services.transaction_stats import transaction_stats
+
+        if db.session.get(Transaction, entry['id']) is not None:
+            return False
+        transaction = Transaction(
+            id=entry['id'],
+            user_id=entry['user_id'],
+            merchant_id=entry['merchant_id'],
+            card_id=entry['card_id'],
+            amount=entry['amount'],
+            currency=entry['currency'],
+            description=entry['description'],
+            reference_number=entry['reference_number'],
+            fraud_score=entry['fraud_score'],
+            status='pending',
+            created_at=datetime.fromisoformat(entry['created_at'])
+        )
+        db.session.add(transaction)
+        FeatureStore.record_transaction(transaction)
+        transaction_stats.record_created(transaction.created_at, transaction.status)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Written meanwhile, e.g. by another process recovering this journal
+            db.session.rollback()
+            return False
+        return True
+
+    def _append(self, entry, durable):
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            f = self._open()
+            f.write(line)
+            f.flush()
+            if durable and self.fsync:
+                os.fsync(f.fileno())
+            if entry['op'] == 'commit' and f.tell() > self.compact_bytes:
+                self._compact()
+
+    def _open(self):
+        # Reopen after a fork so each process keeps its own journal
+        if self._file is None or self._pid != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            self._file = open(self.path, 'a')
+            self._pid = os.getpid()
+        return self._file
+
+    def _compact(self):
+        # Keep only entries still waiting for a commit; called with the lock held
+        pending = self._read_pending(self.path)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for entry in pending:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'a')
+        self.compactions += 1
+
+    @staticmethod
+    def _read_pending(path):
+        pending = {}
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write
+                    continue
+                if entry.get('op') == 'begin':
+                    pending[entry['id']] = entry
+                else:
+                    pending.pop(entry.get('id'), None)
+        return list(pending.values())
+
+
+# Create an instance of the journal
+payment_journal = PaymentJournal()
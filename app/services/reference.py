@@ -0,0 +1,269 @@
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.worker_lease import WorkerLease
+from config.settings import Config
+
+# 2024-01-01T00:00:00Z; 41 bits of milliseconds last until 2093
+REFERENCE_EPOCH_MS = 1704067200000
+
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+TIMESTAMP_SHIFT = WORKER_BITS + SEQUENCE_BITS
+
+REFERENCE_PREFIX = 'TX-'
+
+
+class LeaseUnavailableError(RuntimeError):
+    """Raised when no worker id can be leased"""
+
+
+def format_reference(reference_id, prefix=REFERENCE_PREFIX):
+    """
+    Render a 63-bit id as fixed-width hex, so references sort in time order.
+    TX- plus 16 digits fits Transaction.reference_number (20 characters).
+    """
+    return f"{prefix}{reference_id:016X}"
+
+
+def parse_reference(reference):
+    """
+    Split a reference back into (issued at, worker id, sequence)
+    """
+    reference_id = int(reference.rsplit('-', 1)[-1], 16)
+    timestamp_ms = (reference_id >> TIMESTAMP_SHIFT) + REFERENCE_EPOCH_MS
+    return (
+        datetime(1970, 1, 1) + timedelta(milliseconds=timestamp_ms),
+        (reference_id >> SEQUENCE_BITS) & MAX_WORKER_ID,
+        reference_id & SEQUENCE_MASK
+    )
+
+
+class ReferenceGenerator:
+    """
+    Snowflake-style reference ids: 41 bits of milliseconds, a 10 bit worker
+    id and a 12 bit sequence. Ids only need local state, so generating one
+    costs no database round-trip.
+
+    The worker id is leased from the worker_leases table and renewed in the
+    background. A lease is only taken over once it has expired, and the new
+    holder starts after the highest timestamp the previous one recorded, so
+    two processes never issue the same id. If renewal stops working the
+    generator renews or re-leases synchronously before issuing more ids.
+    """
+
+    def __init__(self, ttl_seconds=None, prefix=REFERENCE_PREFIX):
+        self.ttl_seconds = ttl_seconds or Config.REFERENCE_LEASE_TTL_SECONDS
+        self.prefix = prefix
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Also runs in a forked child: the parent's lease and thread are not ours
+        self._lock = threading.Lock()
+        self._app = None
+        self._renew_thread = None
+        self.worker_id = None
+        self._owner = None
+        self._worker_bits = 0
+        self._last_ms = 0
+        self._sequence = 0
+        self._valid_until = 0.0
+        self.leases_acquired = 0
+        self.renewals = 0
+        self.renewal_failures = 0
+
+    def start(self, app):
+        """
+        Lease a worker id now and keep it renewed in the background
+        """
+        with self._lock:
+            self._app = app
+            with app.app_context():
+                self._acquire()
+        self._start_renewal()
+
+    def next_id(self):
+        with self._lock:
+            if time.monotonic() >= self._valid_until:
+                self._ensure_lease()
+            return self._next()
+
+    def next_reference(self):
+        return format_reference(self.next_id(), self.prefix)
+
+    def next_references(self, count):
+        """
+        Generate `count` references, reserving whole runs of sequence
+        numbers per millisecond under the lock and formatting outside it
+        """
+        runs = []
+        with self._lock:
+            if time.monotonic() >= self._valid_until:
+                self._ensure_lease()
+            while count > 0:
+                first = self._next()
+                take = min(count, SEQUENCE_MASK - self._sequence + 1)
+                self._sequence += take - 1
+                runs.append(range(first, first + take))
+                count -= take
+
+        prefix = self.prefix
+        return [f"{prefix}{reference_id:016X}" for run in runs for reference_id in run]
+
+    def _next(self):
+        now_ms = time.time_ns() // 1000000 - REFERENCE_EPOCH_MS
+        if now_ms > self._last_ms:
+            self._last_ms = now_ms
+            self._sequence = 0
+        else:
+            # Same millisecond, or the clock moved back: keep counting from
+            # the last timestamp and borrow the next one when the sequence wraps
+            self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+            if self._sequence == 0:
+                self._last_ms += 1
+        return (self._last_ms << TIMESTAMP_SHIFT) | self._worker_bits | self._sequence
+
+    def stats(self):
+        return {
+            'worker_id': self.worker_id,
+            'lease_ttl_seconds': self.ttl_seconds,
+            'lease_valid_for_seconds': max(self._valid_until - time.monotonic(), 0),
+            'leases_acquired': self.leases_acquired,
+            'renewals': self.renewals,
+            'renewal_failures': self.renewal_failures
+        }
+
+    def release(self):
+        """
+        Give the worker id back so another process can take it right away
+        """
+        with self._lock:
+            if self.worker_id is None or self._app is None:
+                return
+            try:
+                with self._app.app_context():
+                    table = WorkerLease.__table__
+                    with db.engine.begin() as conn:
+                        conn.execute(table.update()
+                                     .where(table.c.worker_id == self.worker_id, table.c.owner == self._owner)
+                                     .values(expires_at=datetime.utcnow(), last_timestamp_ms=self._last_ms))
+            except Exception as e:
+                print(f"Worker lease release error: {e}")
+            self.worker_id = None
+            self._valid_until = 0.0
+
+    def _ensure_lease(self):
+        # Called with the lock held, on first use or when renewal fell behind
+        if self._app is None:
+            self._app = current_app._get_current_object()
+        with self._app.app_context():
+            if self.worker_id is None or not self._renew():
+                self._acquire()
+        self._start_renewal()
+
+    def _acquire(self):
+        table = WorkerLease.__table__
+        engine = db.engine
+        now = datetime.utcnow()
+
+        with engine.begin() as conn:
+            leases = conn.execute(db.select(table.c.worker_id, table.c.expires_at)).all()
+        leased = {worker_id for worker_id, _ in leases}
+        expired = [worker_id for worker_id, expires_at in leases if expires_at <= now]
+        unused = [worker_id for worker_id in range(MAX_WORKER_ID + 1) if worker_id not in leased]
+        random.shuffle(expired)
+        random.shuffle(unused)
+
+        owner = uuid.uuid4().hex
+        for worker_id in unused + expired:
+            started = time.monotonic()
+            now = datetime.utcnow()
+            values = {
+                'owner': owner,
+                'hostname': socket.gethostname()[:255],
+                'pid': os.getpid(),
+                'expires_at': now + timedelta(seconds=self.ttl_seconds),
+                'acquired_at': now
+            }
+            try:
+                with engine.begin() as conn:
+                    if worker_id in leased:
+                        result = conn.execute(table.update()
+                                              .where(table.c.worker_id == worker_id, table.c.expires_at <= now)
+                                              .values(**values))
+                        if result.rowcount != 1:
+                            continue
+                        last_ms = conn.execute(db.select(table.c.last_timestamp_ms)
+                                               .where(table.c.worker_id == worker_id)).scalar()
+                    else:
+                        conn.execute(table.insert().values(worker_id=worker_id, last_timestamp_ms=0, **values))
+                        last_ms = 0
+            except IntegrityError:
+                # Another process inserted this id first
+                continue
+
+            self.worker_id = worker_id
+            self._owner = owner
+            self._worker_bits = worker_id << SEQUENCE_BITS
+            self._last_ms = max(self._last_ms, last_ms or 0)
+            self._valid_until = started + self.ttl_seconds * 2 / 3
+            self.leases_acquired += 1
+            return
+
+        raise LeaseUnavailableError(f'All {MAX_WORKER_ID + 1} worker ids are leased')
+
+    def _renew(self):
+        """Extend the lease; returns False if another process took it over"""
+        table = WorkerLease.__table__
+        worker_id, owner = self.worker_id, self._owner
+        started = time.monotonic()
+        with db.engine.begin() as conn:
+            result = conn.execute(table.update()
+                                  .where(table.c.worker_id == worker_id, table.c.owner == owner)
+                                  .values(expires_at=datetime.utcnow() + timedelta(seconds=self.ttl_seconds),
+                                          last_timestamp_ms=self._last_ms))
+        if result.rowcount != 1:
+            # Stop issuing ids under this worker id straight away
+            self.worker_id = None
+            self._valid_until = 0.0
+            return False
+        self._valid_until = started + self.ttl_seconds * 2 / 3
+        self.renewals += 1
+        return True
+
+    def _start_renewal(self):
+        if self._renew_thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.ttl_seconds / 3)
+                if self.worker_id is None:
+                    continue
+                # Renew without the lock so id generation never waits on the database
+                try:
+                    with self._app.app_context():
+                        if not self._renew():
+                            self.renewal_failures += 1
+                except Exception as e:
+                    self.renewal_failures += 1
+                    print(f"Worker lease renewal error: {e}")
+
+        self._renew_thread = threading.Thread(target=run, name='reference-lease-renewal', daemon=True)
+        self._renew_thread.start()
+
+
+# Create an instance of the generator
+reference_generator = ReferenceGenerator()
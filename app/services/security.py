@@ -5,7 +5,7 @@ from jose import JWTError, jwt
 from typing import Optional, List, Dict, Any
 from app.models.user import User
 from app.utils.logging import log_activity
-from config.database import get_db
+from config.dependencies import get_db
 from config.settings import SECRET_KEY, ALGORITHM
 from app.services.authentication import auth_service
 
@@ -0,0 +1,268 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.settlement import SettlementBatch, SettlementRun
+from app.models.transaction import Transaction
+from config.settings import Config
+
+# Transaction types that move money between the merchant and us
+SETTLED_TYPES = ('payment', 'refund')
+
+
+class SettlementEngine:
+    """
+    Aggregates completed payments and refunds into one settlement batch per
+    merchant and currency for each settlement window, and marks every row
+    it counts with the batch id.
+
+    Rows are read in (created_at, id) order from a server-side cursor, which
+    follows the table's insertion order, so memory holds one chunk plus a
+    batch id per merchant and currency no matter how many rows the window
+    has. Each chunk's batch totals, row marks and the run's checkpoint are
+    committed together; a run that stops part way resumes after the last
+    committed row. A row is only marked if it is still unsettled, and only
+    the rows a chunk actually marked are added to the batches, so
+    overlapping runs never count a row twice.
+
+    Rows that reach 'completed' after their window's run has finished are
+    late: each run also settles the late rows of earlier windows (back to
+    the first window ever settled) into its own batches.
+
+    The cursor stays open while chunks are committed on other connections.
+    On SQLite that needs the database in WAL mode, which settle() enables.
+    """
+
+    def __init__(self, chunk_size=None, window_hours=None):
+        self.chunk_size = chunk_size or Config.SETTLEMENT_CHUNK_SIZE
+        self.window_hours = window_hours or Config.SETTLEMENT_WINDOW_HOURS
+
+    def window_for(self, moment):
+        """
+        The settlement window containing `moment`, aligned to UTC midnight
+        """
+        window = timedelta(hours=self.window_hours)
+        midnight = datetime(moment.year, moment.month, moment.day)
+        start = midnight + ((moment - midnight) // window) * window
+        return start, start + window
+
+    def settle(self, window_start=None, window_end=None, limit=None):
+        """
+        Settle one window, by default the last one that has closed.
+        With `limit`, stop once about that many rows are settled and leave
+        the run to be resumed by the next call.
+        Returns a report of the rows and batches processed.
+        """
+        if window_start is None:
+            window_start, window_end = self.window_for(datetime.utcnow() - timedelta(hours=self.window_hours))
+        elif window_end is None:
+            window_end = window_start + timedelta(hours=self.window_hours)
+
+        run = self._start_run(window_start, window_end)
+        if run.status == 'completed':
+            return self._report(run, rows=0, elapsed=0.0, resumed=False)
+
+        resumed = run.rows_processed > 0
+        self._enable_wal()
+
+        started = time.perf_counter()
+        rows = 0
+        batch_ids = {}
+        settled_since = self._settled_since()
+
+        with db.engine.connect() as reader:
+            result = reader.execution_options(stream_results=True).execute(self._rows_query(run, settled_since))
+            for chunk in result.partitions(self.chunk_size):
+                by_key = {}
+                for transaction_id, created_at, merchant_id, currency, amount, transaction_type in chunk:
+                    by_key.setdefault((merchant_id, currency), {})[transaction_id] = (transaction_type, amount)
+
+                with db.engine.begin() as conn:
+                    for key in by_key:
+                        if key not in batch_ids:
+                            batch_ids[key] = self._batch_id(conn, run, key)
+                    rows += self._apply(conn, run, chunk[-1], batch_ids, by_key)
+                if limit is not None and rows >= limit:
+                    break
+            else:
+                self._complete_run(run)
+
+        db.session.refresh(run)
+        return self._report(run, rows=rows, elapsed=time.perf_counter() - started, resumed=resumed)
+
+    @staticmethod
+    def _settled_since():
+        # Late rows are swept back to the first window any run covered, not through all history
+        return db.session.query(db.func.min(SettlementRun.window_start)).scalar()
+
+    def _rows_query(self, run, settled_since):
+        t = Transaction.__table__
+        query = db.select(t.c.id, t.c.created_at, t.c.merchant_id, t.c.currency, t.c.amount,
+                          t.c.transaction_type).where(
+            t.c.status == 'completed',
+            t.c.transaction_type.in_(SETTLED_TYPES),
+            t.c.created_at >= min(settled_since or run.window_start, run.window_start),
+            t.c.created_at < run.window_end,
+            t.c.settlement_batch_id.is_(None)
+        )
+        if run.checkpoint_transaction_id is not None:
+            query = query.where(db.tuple_(t.c.created_at, t.c.id) >
+                                (run.checkpoint_created_at, run.checkpoint_transaction_id))
+        return query.order_by(t.c.created_at, t.c.id)
+
+    def _start_run(self, window_start, window_end):
+        run = SettlementRun.query.filter_by(window_start=window_start, window_end=window_end).first()
+        if run is not None:
+            return run
+        run = SettlementRun(window_start=window_start, window_end=window_end)
+        db.session.add(run)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Started by another process at the same moment
+            db.session.rollback()
+            run = SettlementRun.query.filter_by(window_start=window_start, window_end=window_end).one()
+        return run
+
+    def _batch_id(self, conn, run, key):
+        batches = SettlementBatch.__table__
+        merchant_id, currency = key
+        existing = db.select(batches.c.id).where(
+            batches.c.merchant_id == merchant_id,
+            batches.c.currency == currency,
+            batches.c.window_start == run.window_start
+        )
+        batch_id = conn.execute(existing).scalar()
+        if batch_id is not None:
+            return batch_id
+
+        batch_id = str(uuid.uuid4())
+        try:
+            # A savepoint, so losing the race to another run only undoes this insert
+            with conn.begin_nested():
+                conn.execute(batches.insert().values(
+                    id=batch_id, run_id=run.id, merchant_id=merchant_id, currency=currency,
+                    window_start=run.window_start, window_end=run.window_end,
+                    payment_count=0, payment_total=0, refund_count=0, refund_total=0,
+                    status='open', created_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            # Another run created this (merchant, currency, window) batch first
+            return conn.execute(existing).scalar_one()
+        runs = SettlementRun.__table__
+        conn.execute(runs.update().where(runs.c.id == run.id)
+                     .values(batches_created=runs.c.batches_created + 1))
+        return batch_id
+
+    @staticmethod
+    def _apply(conn, run, last, batch_ids, by_key):
+        """
+        Mark one chunk's still unsettled rows, add those to their batches
+        and move the checkpoint. `by_key` maps (merchant, currency) to
+        {transaction id: (type, amount)}. Returns the number of rows marked.
+        """
+        batches = SettlementBatch.__table__
+        transactions = Transaction.__table__
+        runs = SettlementRun.__table__
+
+        deltas = {}
+        marked = 0
+        for key, rows in by_key.items():
+            delta = {'payment_count': 0, 'payment_total': 0, 'refund_count': 0, 'refund_total': 0}
+            for transaction_id in SettlementEngine._mark(conn, transactions, batch_ids[key], list(rows)):
+                transaction_type, amount = rows[transaction_id]
+                if transaction_type == 'payment':
+                    delta['payment_count'] += 1
+                    delta['payment_total'] += round(amount * 100)
+                else:
+                    delta['refund_count'] += 1
+                    delta['refund_total'] += round(amount * 100)
+                marked += 1
+            if delta['payment_count'] or delta['refund_count']:
+                deltas[key] = delta
+
+        if deltas:
+            conn.execute(
+            batches.update().where(batches.c.id == db.bindparam('batch_id')).values(
+                payment_count=batches.c.payment_count + db.bindparam('add_payment_count'),
+                payment_total=batches.c.payment_total + db.bindparam('add_payment_total'),
+                refund_count=batches.c.refund_count + db.bindparam('add_refund_count'),
+                refund_total=batches.c.refund_total + db.bindparam('add_refund_total')
+            ),
+                [{'batch_id': batch_ids[key], **{f'add_{name}': value for name, value in delta.items()}}
+                 for key, delta in deltas.items()]
+            )
+        conn.execute(runs.update().where(runs.c.id == run.id).values(
+            checkpoint_created_at=last.created_at,
+            checkpoint_transaction_id=last.id,
+            rows_processed=runs.c.rows_processed + marked,
+            updated_at=datetime.utcnow()
+        ))
+        return marked
+
+    @staticmethod
+    def _mark(conn, transactions, batch_id, transaction_ids):
+        """
+        Set the batch on those of `transaction_ids` that are still unsettled
+        and return their ids. A row another run marked meanwhile is skipped.
+        """
+        unsettled = transactions.c.settlement_batch_id.is_(None)
+        if conn.dialect.update_returning:
+            return conn.execute(transactions.update()
+                                .where(transactions.c.id.in_(transaction_ids), unsettled)
+                                .values(settlement_batch_id=batch_id)
+                                .returning(transactions.c.id)).scalars().all()
+        marked = []
+        for transaction_id in transaction_ids:
+            result = conn.execute(transactions.update().where(transactions.c.id == transaction_id, unsettled)
+                                  .values(settlement_batch_id=batch_id))
+            if result.rowcount == 1:
+                marked.append(transaction_id)
+        return marked
+
+    @staticmethod
+    def _complete_run(run):
+        now = datetime.utcnow()
+        batches = SettlementBatch.__table__
+        runs = SettlementRun.__table__
+        with db.engine.begin() as conn:
+            conn.execute(batches.update().where(batches.c.run_id == run.id, batches.c.status == 'open')
+                         .values(status='closed', closed_at=now))
+            conn.execute(runs.update().where(runs.c.id == run.id)
+                         .values(status='completed', completed_at=now, updated_at=now))
+
+    @staticmethod
+    def _enable_wal():
+        if db.engine.dialect.name != 'sqlite':
+            return
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+
+    @staticmethod
+    def _report(run, rows, elapsed, resumed):
+        return {
+            'run_id': run.id,
+            'window_start': run.window_start.isoformat(),
+            'window_end': run.window_end.isoformat(),
+            'status': run.status,
+            'resumed': resumed,
+            'rows': rows,
+            'rows_total': run.rows_processed,
+            'batches': run.batches_created,
+            'elapsed_seconds': elapsed,
+            'rows_per_second': rows / elapsed if elapsed else 0.0
+        }
+
+    @staticmethod
+    def batches_for(window_start, merchant_id=None):
+        query = SettlementBatch.query.filter_by(window_start=window_start)
+        if merchant_id:
+            query = query.filter_by(merchant_id=merchant_id)
+        return query.order_by(SettlementBatch.merchant_id, SettlementBatch.currency).all()
+
+
+# Create an instance of the engine
+settlement_engine = SettlementEngine()
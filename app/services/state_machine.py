@@ -0,0 +1,188 @@
+from sqlalchemy import inspect
+from sqlalchemy.orm import object_session
+
+from app import db
+from app.models.payment import Payment
+from app.models.transaction import Transaction
+from app.services.transaction_stats import transaction_stats
+
+
+class TransitionError(Exception):
+    """A status change that could not be applied"""
+    retryable = False
+
+
+class IllegalTransitionError(TransitionError):
+    """The change is not allowed from the entity's current status"""
+
+
+class TransitionConflictError(TransitionError):
+    """
+    Another writer changed the entity since it was read. Re-read it and
+    try again.
+    """
+    retryable = True
+
+
+# status -> statuses it may move to
+TRANSACTION_TRANSITIONS = {
+    'pending': {'completed', 'failed', 'blocked', 'flagged_for_fraud'},
+    'completed': {'refunded', 'disputed', 'flagged_for_fraud'},
+    'flagged_for_fraud': {'completed', 'blocked', 'refunded'},
+    'disputed': {'completed', 'refunded'},
+    'blocked': {'completed'},
+    'failed': set(),
+    'refunded': set()
+}
+
+PAYMENT_TRANSITIONS = {
+    'pending': {'completed', 'failed'},
+    'completed': {'refunded'},
+    'failed': set(),
+    'refunded': set()
+}
+
+
+class StateMachine:
+    """
+    Status transitions for one model, applied as compare-and-set UPDATEs.
+
+    Every transition bumps the row's version. The UPDATE only matches if
+    the row is still in a status the new one may be reached from, and,
+    when the caller read the row first, still at the version it read; so
+    neither illegal nor lost updates need a lock or a read beforehand.
+    Only when nothing matched is the row read, to tell an illegal change
+    (IllegalTransitionError) from a concurrent one (TransitionConflictError).
+
+    `on_transition(created_at, old_status, new_status, session)` is called
+    after each applied transition, in the same session, so derived data
+    commits with it; `on_transitions` takes a list of created_at instead,
+    for transition_many(). When the caller does not say which status it
+    expects the row to be in, each possible source status is tried in turn
+    so the one it moved from is known.
+    """
+
+    def __init__(self, model, transitions, on_transition=None, on_transitions=None):
+        self.model = model
+        self.transitions = transitions
+        self.on_transition = on_transition
+        self.on_transitions = on_transitions
+        self._sources = {}
+        for source, targets in transitions.items():
+            for target in targets:
+                self._sources.setdefault(target, []).append(source)
+
+    def can_transition(self, from_status, to_status):
+        return to_status in self.transitions.get(from_status, ())
+
+    def apply(self, entity, new_status, **values):
+        """
+        Move a loaded entity to `new_status`, expecting the status and
+        version it was loaded with. Entities not yet in the database just
+        have their status set. Other column `values` are written in the
+        same UPDATE.
+        """
+        state = inspect(entity)
+        if not state.persistent:
+            entity.status = new_status
+            for name, value in values.items():
+                setattr(entity, name, value)
+            return entity.version
+
+        if not self.can_transition(entity.status, new_status):
+            raise IllegalTransitionError(f"Cannot move {self.model.__name__} {entity.id} "
+                                         f"from '{entity.status}' to '{new_status}'")
+        return self.transition(entity.id, new_status, expected_status=entity.status,
+                               expected_version=entity.version, session=object_session(entity), **values)
+
+    def transition(self, entity_id, new_status, expected_status=None, expected_version=None, session=None, **values):
+        """
+        Move the row `entity_id` to `new_status` without reading it first.
+        With `expected_version` the change only applies to that version.
+        Returns the new version when it is known, else None.
+        """
+        session = session or db.session
+        sources = self._sources.get(new_status)
+        if not sources:
+            raise IllegalTransitionError(f"No {self.model.__name__} status can move to '{new_status}'")
+        if expected_status is not None and expected_status not in sources:
+            raise IllegalTransitionError(f"Cannot move {self.model.__name__} {entity_id} "
+                                         f"from '{expected_status}' to '{new_status}'")
+
+        model = self.model
+        conditions = [model.id == entity_id]
+        if expected_version is not None:
+            conditions.append(model.version == expected_version)
+
+        # on_transition needs the row's created_at: returned by the UPDATE where the database can
+        returning = self.on_transition is not None and session.get_bind().dialect.update_returning
+        for old_status in ([expected_status] if expected_status is not None else sources):
+            statement = (db.update(model).where(*conditions, model.status == old_status)
+                         .values(status=new_status, version=model.version + 1, **values)
+                         .execution_options(synchronize_session='evaluate'))
+            if returning:
+                row = session.execute(statement.returning(model.created_at)).first()
+                applied = row is not None
+            else:
+                applied = session.execute(statement).rowcount == 1
+            if applied:
+                if self.on_transition is not None:
+                    if returning:
+                        created_at = row.created_at
+                    else:
+                        created_at = session.execute(db.select(model.created_at).where(model.id == entity_id)).scalar()
+                    self.on_transition(created_at, old_status, new_status, session)
+                return expected_version + 1 if expected_version is not None else None
+
+        current = session.execute(db.select(model.status, model.version).where(model.id == entity_id)).first()
+        if current is None:
+            raise TransitionError(f"{model.__name__} {entity_id} not found")
+        if expected_version is not None and current.version != expected_version:
+            raise TransitionConflictError(f"{model.__name__} {entity_id} changed from version {expected_version} "
+                                          f"to {current.version}; reload and retry")
+        if expected_status is not None and current.status != expected_status:
+            raise TransitionConflictError(f"{model.__name__} {entity_id} is now '{current.status}'; reload and retry")
+        raise IllegalTransitionError(f"Cannot move {model.__name__} {entity_id} "
+                                     f"from '{current.status}' to '{new_status}'")
+
+    def transition_many(self, entity_ids, new_status, expected_status, session=None):
+        """
+        Move every row of `entity_ids` still in `expected_status` to
+        `new_status` in one UPDATE. Rows another writer moved first are
+        left alone. Returns the ids that were moved.
+        """
+        session = session or db.session
+        if not self.can_transition(expected_status, new_status):
+            raise IllegalTransitionError(f"Cannot move {self.model.__name__} from '{expected_status}' to '{new_status}'")
+        if not entity_ids:
+            return []
+        if not session.get_bind().dialect.update_returning:
+            moved = []
+            for entity_id in entity_ids:
+                try:
+                    self.transition(entity_id, new_status, expected_status=expected_status, session=session)
+                except TransitionError:
+                    continue
+                moved.append(entity_id)
+            return moved
+
+        model = self.model
+        rows = session.execute(
+            db.update(model).where(model.id.in_(entity_ids), model.status == expected_status)
+            .values(status=new_status, version=model.version + 1)
+            .returning(model.id, model.created_at)
+            .execution_options(synchronize_session='evaluate')
+        ).all()
+        if rows:
+            if self.on_transitions is not None:
+                self.on_transitions([row.created_at for row in rows], expected_status, new_status, session)
+            elif self.on_transition is not None:
+                for row in rows:
+                    self.on_transition(row.created_at, expected_status, new_status, session)
+        return [row.id for row in rows]
+
+
+# Create instances of the state machines
+transaction_states = StateMachine(Transaction, TRANSACTION_TRANSITIONS, on_transition=transaction_stats.record_transition,
+                                  on_transitions=transaction_stats.record_transitions)
+payment_states = StateMachine(Payment, PAYMENT_TRANSITIONS)
@@ -0,0 +1,287 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+from app import db
+from app.models.stats import TransactionCounter, ALL_TIME
+from app.models.transaction import Transaction
+from config.settings import Config
+
+GRANULARITIES = ('hour', 'day', 'all')
+
+
+def bucket_starts(created_at):
+    """
+    (granularity, bucket_start) of every counter a transaction created at `created_at` counts in
+    """
+    hour = created_at.replace(minute=0, second=0, microsecond=0)
+    return (('hour', hour), ('day', hour.replace(hour=0)), ('all', ALL_TIME))
+
+
+class TransactionStats:
+    """
+    Transaction counts by status, kept in hourly, daily and all-time
+    counters so the admin dashboard reads a few rows instead of counting
+    the transactions table.
+
+    Writers call record_created() for each transaction they insert, and
+    status transitions are recorded by the transaction state machine, in
+    the writer's own session so the counters commit or roll back with the
+    write. Counts "since" a moment add up daily and hourly counters and
+    count the transactions table only for the part of an hour before the
+    first whole one, which the created_at index answers directly.
+
+    Writes that bypass these hooks make the counters drift from the
+    table; reconcile() reports the drift and can correct it.
+    """
+
+    def __init__(self, shards=None):
+        self.shards = shards or Config.STATS_COUNTER_SHARDS
+
+    def record_created(self, created_at, status, session=None):
+        self.record_created_many([(created_at, status)], session)
+
+    def record_created_many(self, rows, session=None):
+        """
+        Count inserted transactions given as (created_at, status) pairs
+        """
+        deltas = Counter()
+        for created_at, status in rows:
+            for granularity, bucket_start in bucket_starts(created_at):
+                deltas[(granularity, bucket_start, status)] += 1
+        self._apply(deltas, session)
+
+    def record_transition(self, created_at, old_status, new_status, session=None):
+        self.record_transitions([created_at], old_status, new_status, session)
+
+    def record_transitions(self, created_ats, old_status, new_status, session=None):
+        """
+        Count transactions, given by their created_at, moving between two statuses
+        """
+        deltas = Counter()
+        for created_at in created_ats:
+            for granularity, bucket_start in bucket_starts(created_at):
+                deltas[(granularity, bucket_start, old_status)] -= 1
+                deltas[(granularity, bucket_start, new_status)] += 1
+        self._apply(deltas, session)
+
+    def _apply(self, deltas, session=None):
+        session = session or db.session
+        # Hour, then day, then all-time counters, each in order: reconcile() relies on this locking order
+        params = [{'granularity': granularity, 'bucket_start': bucket_start, 'status': status,
+                   'shard': random.randrange(self.shards), 'count': delta}
+                  for (granularity, bucket_start, status), delta in sorted(deltas.items(), key=lambda item: _counter_order(item[0]))
+                  if delta]
+        if not params:
+            return
+
+        table = TransactionCounter.__table__
+        dialect = session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            statement = insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.granularity, table.c.bucket_start, table.c.status, table.c.shard],
+                set_={'count': table.c.count + statement.excluded['count']}
+            )
+            session.execute(statement, params)
+            return
+
+        for row in params:
+            result = session.execute(
+                table.update().where(
+                    table.c.granularity == row['granularity'], table.c.bucket_start == row['bucket_start'],
+                    table.c.status == row['status'], table.c.shard == row['shard']
+                ).values(count=table.c.count + row['count'])
+            )
+            if result.rowcount == 0:
+                session.execute(table.insert().values(**row))
+
+    def count(self, status=None, since=None, session=None):
+        """
+        Transactions created at or after `since` (ever, if None), in `status` if given
+        """
+        session = session or db.session
+        counters = TransactionCounter.__table__
+        total = db.func.coalesce(db.func.sum(counters.c.count), 0)
+
+        def counted(granularity, *conditions):
+            query = db.select(total).where(counters.c.granularity == granularity, *conditions)
+            if status is not None:
+                query = query.where(counters.c.status == status)
+            return session.execute(query).scalar()
+
+        if since is None:
+            return counted('all')
+
+        first_hour = since.replace(minute=0, second=0, microsecond=0)
+        if first_hour < since:
+            first_hour += timedelta(hours=1)
+        first_day = first_hour.replace(hour=0)
+        if first_day < first_hour:
+            first_day += timedelta(days=1)
+
+        # The part hour from the transactions table, whole hours up to the first whole day, then days
+        t = Transaction.__table__
+        edge = db.select(db.func.count()).select_from(t).where(t.c.created_at >= since, t.c.created_at < first_hour)
+        if status is not None:
+            edge = edge.where(t.c.status == status)
+        result = session.execute(edge).scalar()
+        result += counted('hour', counters.c.bucket_start >= first_hour, counters.c.bucket_start < first_day)
+        result += counted('day', counters.c.bucket_start >= first_day)
+        return result
+
+    def by_status(self, session=None):
+        """
+        All-time count of transactions per status
+        """
+        session = session or db.session
+        counters = TransactionCounter.__table__
+        query = (db.select(counters.c.status, db.func.sum(counters.c.count))
+                 .where(counters.c.granularity == 'all').group_by(counters.c.status))
+        return {status: count for status, count in session.execute(query) if count}
+
+    def recompute(self, session=None, archived=None):
+        """
+        Counts per (granularity, bucket_start, status) computed from the transactions table and the archive.
+        `archived` is the archive's hourly_counts(), if already read.
+        """
+        from app.services.archive import transaction_archive
+
+        session = session or db.session
+        t = Transaction.__table__
+        if session.get_bind().dialect.name == 'postgresql':
+            hour = db.func.date_trunc('hour', t.c.created_at)
+        else:
+            hour = db.func.strftime('%Y-%m-%d %H:00:00', t.c.created_at)
+
+        hourly = Counter()
+        query = db.select(hour, t.c.status, db.func.count()).where(t.c.created_at.isnot(None)).group_by(hour, t.c.status)
+        for bucket, status, count in session.execute(query):
+            if isinstance(bucket, str):
+                bucket = datetime.fromisoformat(bucket)
+            hourly[(bucket, status)] += count
+        # Archived transactions still count, in the status they were archived in
+        hourly.update(archived if archived is not None else transaction_archive.hourly_counts())
+
+        expected = Counter()
+        for (bucket, status), count in hourly.items():
+            for granularity, bucket_start in bucket_starts(bucket):
+                expected[(granularity, bucket_start, status)] += count
+        return expected
+
+    def current(self, session=None):
+        session = session or db.session
+        counters = TransactionCounter.__table__
+        query = (db.select(counters.c.granularity, counters.c.bucket_start, counters.c.status,
+                           db.func.sum(counters.c.count))
+                 .group_by(counters.c.granularity, counters.c.bucket_start, counters.c.status))
+        return Counter({(granularity, bucket_start, status): count
+                        for granularity, bucket_start, status, count in session.execute(query) if count})
+
+    def reconcile(self, fix=False, session=None):
+        """
+        Compare the counters with counts recomputed from the transactions
+        table. With `fix`, correct each drifting bucket by the difference,
+        counted again while only that bucket's counters are locked, so
+        writers to other buckets carry on and none of their updates are
+        lost or counted twice.
+        Returns a report with every drifting counter.
+        """
+        from app.services.archive import transaction_archive
+
+        session = session or db.session
+        archived = transaction_archive.hourly_counts()
+        actual = self.current(session)
+        expected = self.recompute(session, archived)
+        session.rollback()
+
+        drifted = [key for key in sorted(set(expected) | set(actual), key=_counter_order)
+                   if expected.get(key, 0) != actual.get(key, 0)]
+        drift = []
+        for key in drifted:
+            granularity, bucket_start, status = key
+            drift.append({'granularity': granularity, 'bucket_start': bucket_start.isoformat(),
+                          'status': status, 'expected': expected.get(key, 0), 'actual': actual.get(key, 0)})
+
+        if fix:
+            # Hours first: days are then recounted from the fixed hour counters, and all-time from the days
+            for granularity, bucket_start in dict.fromkeys((granularity, bucket_start)
+                                                           for granularity, bucket_start, _ in drifted):
+                self._fix_bucket(session, granularity, bucket_start, archived)
+
+        return {'counters': len(expected), 'drifted': len(drift), 'fixed': fix and bool(drift), 'drift': drift}
+
+    def _fix_bucket(self, session, granularity, bucket_start, archived):
+        """
+        Bring one bucket's counters to a recount, in a transaction that
+        locks only that bucket's counter rows. An hour is recounted from
+        the transactions table and the archive, a day from its hour
+        counters and all-time from the day counters. Writers lock hour,
+        then day, then all-time counters, so a writer held up by this lock
+        has none of its changes visible to the recount either.
+        """
+        counters = TransactionCounter.__table__
+        bucket = (counters.c.granularity == granularity, counters.c.bucket_start == bucket_start)
+        try:
+            self._lock_bucket(session, granularity, bucket_start)
+            current = dict(session.execute(
+                db.select(counters.c.status, db.func.sum(counters.c.count)).where(*bucket).group_by(counters.c.status)
+            ).all())
+
+            if granularity == 'hour':
+                t = Transaction.__table__
+                recount = Counter(dict(session.execute(
+                    db.select(t.c.status, db.func.count()).where(
+                        t.c.created_at >= bucket_start, t.c.created_at < bucket_start + timedelta(hours=1)
+                    ).group_by(t.c.status)
+                ).all()))
+                for (hour, status), count in archived.items():
+                    if hour == bucket_start:
+                        recount[status] += count
+            else:
+                source = 'hour' if granularity == 'day' else 'day'
+                query = (db.select(counters.c.status, db.func.sum(counters.c.count))
+                         .where(counters.c.granularity == source).group_by(counters.c.status))
+                if granularity == 'day':
+                    query = query.where(counters.c.bucket_start >= bucket_start,
+                                        counters.c.bucket_start < bucket_start + timedelta(days=1))
+                recount = Counter(dict(session.execute(query).all()))
+
+            self._apply(Counter({(granularity, bucket_start, status): recount.get(status, 0) - current.get(status, 0)
+                                 for status in set(recount) | set(current)}), session)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+    def _lock_bucket(self, session, granularity, bucket_start):
+        counters = TransactionCounter.__table__
+        if session.get_bind().dialect.name != 'postgresql':
+            # SQLite has one writer at a time: taking the write lock holds off every writer until the commit
+            session.execute(counters.update().where(db.false()).values(count=counters.c.count))
+            return
+
+        from sqlalchemy.dialects.postgresql import insert
+        from app.services.state_machine import TRANSACTION_TRANSITIONS
+
+        # Create every row a writer could touch, so none can add one past the lock
+        session.execute(insert(counters).on_conflict_do_nothing(), [
+            {'granularity': granularity, 'bucket_start': bucket_start, 'status': status, 'shard': shard, 'count': 0}
+            for status in sorted(TRANSACTION_TRANSITIONS) for shard in range(self.shards)
+        ])
+        session.execute(db.select(counters.c.shard).where(
+            counters.c.granularity == granularity, counters.c.bucket_start == bucket_start
+        ).order_by(counters.c.status, counters.c.shard).with_for_update())
+
+
+def _counter_order(key):
+    granularity, bucket_start, status = key
+    return GRANULARITIES.index(granularity), bucket_start, status
+
+
+# Create an instance of the stats
+transaction_stats = TransactionStats()
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from config.settings import Config
+
+
+def _timestamp(now):
+    if now is None:
+        return time.time()
+    if isinstance(now, datetime):
+        # Naive datetimes in this codebase are UTC
+        return (now - datetime(1970, 1, 1)).total_seconds()
+    return now
+
+
+class VelocityCounter:
+    """
+    Sliding-window event counts per key, kept as a ring of time buckets.
+
+    Each key stores [head bucket number, running total, bucket counts].
+    Moving the head forward clears at most `buckets` slots, so increments
+    and queries are O(1). Keys are kept in least recently touched order
+    and evicted once idle for a full window or past `max_keys`.
+    """
+
+    def __init__(self, window_seconds, buckets=60, max_keys=100000):
+        self.window_seconds = window_seconds
+        self.buckets = buckets
+        self.bucket_seconds = window_seconds / buckets
+        self.max_keys = max_keys
+        self._keys = OrderedDict()
+        self.evictions = 0
+
+    def increment(self, key, now=None, amount=1):
+        """Add events for key and return the count in the window"""
+        bucket = int(_timestamp(now) // self.bucket_seconds)
+        state = self._keys.get(key)
+        if state is None:
+            state = [bucket, 0, [0] * self.buckets]
+            self._keys[key] = state
+        else:
+            self._advance(state, bucket)
+            self._keys.move_to_end(key)
+
+        state[2][state[0] % self.buckets] += amount
+        state[1] += amount
+        self._evict(bucket)
+        return state[1]
+
+    def count(self, key, now=None):
+        """Get the number of events for key in the window ending at now"""
+        state = self._keys.get(key)
+        if state is None:
+            return 0
+        self._advance(state, int(_timestamp(now) // self.bucket_seconds))
+        return state[1]
+
+    def _advance(self, state, bucket):
+        head, _, counts = state
+        if bucket <= head:
+            return
+        # Clear the slots of every bucket that fell out of the window
+        for b in range(head + 1, min(bucket, head + self.buckets) + 1):
+            slot = b % self.buckets
+            state[1] -= counts[slot]
+            counts[slot] = 0
+        state[0] = bucket
+
+    def _evict(self, bucket):
+        while self._keys:
+            key, state = next(iter(self._keys.items()))
+            idle = bucket - state[0] >= self.buckets
+            if not idle and len(self._keys) <= self.max_keys:
+                break
+            del self._keys[key]
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._keys)
+
+    def snapshot(self):
+        return {
+            'window_seconds': self.window_seconds,
+            'buckets': self.buckets,
+            'keys': [[key] + [state[0], state[1], list(state[2])] for key, state in self._keys.items()]
+        }
+
+    def restore(self, data):
+        if data.get('window_seconds') != self.window_seconds or data.get('buckets') != self.buckets:
+            return False
+        self._keys = OrderedDict((key, [head, total, list(counts)]) for key, head, total, counts in data['keys'])
+        return True
+
+
+class VelocityStore:
+    """
+    In-memory velocity signals per card, user and merchant
+    """
+
+    def __init__(self, max_keys=None):
+        max_keys = max_keys if max_keys is not None else Config.VELOCITY_MAX_KEYS
+        self.counters = {
+            'card_1m': VelocityCounter(60, buckets=60, max_keys=max_keys),
+            'user_1h': VelocityCounter(3600, buckets=60, max_keys=max_keys),
+            'merchant_5m': VelocityCounter(300, buckets=60, max_keys=max_keys),
+            'merchant_1h': VelocityCounter(3600, buckets=60, max_keys=max_keys)
+        }
+        self._lock = threading.Lock()
+
+    def record(self, transaction, now=None):
+        """
+        Count a new transaction against its card, user and merchant
+        """
+        now = now or transaction.created_at
+        with self._lock:
+            self.counters['card_1m'].increment(transaction.card_id, now)
+            self.counters['user_1h'].increment(transaction.user_id, now)
+            self.counters['merchant_5m'].increment(transaction.merchant_id, now)
+            self.counters['merchant_1h'].increment(transaction.merchant_id, now)
+
+    def counts(self, transaction, now=None):
+        with self._lock:
+            return {
+                'card_1m': self.counters['card_1m'].count(transaction.card_id, now),
+                'user_1h': self.counters['user_1h'].count(transaction.user_id, now),
+                'merchant_5m': self.counters['merchant_5m'].count(transaction.merchant_id, now),
+                'merchant_1h': self.counters['merchant_1h'].count(transaction.merchant_id, now)
+            }
+
+    def score(self, transaction, now=None):
+        """
+        Velocity score component (0-100) for a transaction
+        """
+        counts = self.counts(transaction, now)
+        score = 0
+
+        # Too many charges on one card in a minute
+        if counts['card_1m'] > Config.VELOCITY_CARD_LIMIT_1M:
+            score += 25
+
+        # Too many charges by one user in an hour
+        if counts['user_1h'] > Config.VELOCITY_USER_LIMIT_1H:
+            score += 15
+
+        # Merchant volume in the last 5 minutes well above its hourly rate
+        expected_5m = counts['merchant_1h'] * 300 / 3600
+        if counts['merchant_5m'] >= Config.VELOCITY_MERCHANT_SPIKE_MIN and \
+                counts['merchant_5m'] > expected_5m * Config.VELOCITY_MERCHANT_SPIKE_FACTOR:
+            score += 10
+
+        return min(score, 100)
+
+    def stats(self):
+        with self._lock:
+            return {name: {'keys': len(counter), 'evictions': counter.evictions} for name, counter in self.counters.items()}
+
+    def save_snapshot(self, path=None):
+        """
+        Write all counters to a JSON file so they survive a restart
+        """
+        path = path or Config.VELOCITY_SNAPSHOT_PATH
+        with self._lock:
+            data = {
+                'saved_at': time.time(),
+                'counters': {name: counter.snapshot() for name, counter in self.counters.items()}
+            }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load_snapshot(self, path=None):
+        """
+        Restore counters from a snapshot file; stale buckets expire on first use
+        """
+        path = path or Config.VELOCITY_SNAPSHOT_PATH
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+
+        with self._lock:
+            for name, counter_data in data.get('counters', {}).items():
+                if name in self.counters:
+                    self.counters[name].restore(counter_data)
+        return True
+
+
+# Create an instance of the store
+velocity_store = VelocityStore()
@@ -0,0 +1,78 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+# Keyset pagination over (created_at, id), newest first.
+# A page is found by seeking past the last row of the previous one rather
+# than skipping an OFFSET, so page N costs the same as page 1 as long as an
+# index ends in (created_at, id).
+
+def encode_cursor(created_at, row_id):
+    """
+    Opaque cursor pointing just after the row with this sort key
+    """
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Sort key (created_at, id) from a cursor; ValueError if it is not one of ours
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(row_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def keyset_page(query, model, cursor=None, limit=100):
+    """
+    One page of `query` newest first, starting after `cursor`.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    ordered = _after(query, model, cursor).order_by(None).order_by(model.created_at.desc(), model.id.desc())
+    rows = ordered.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+def keyset_stream(query, model, cursor=None, batch_size=1000):
+    """
+    Iterator over pages of every row of `query` after `cursor`, newest
+    first, holding one page in memory and no cursor open between pages.
+    A bad cursor raises ValueError here, before anything is streamed.
+    """
+    if cursor:
+        decode_cursor(cursor)
+    return _pages(query, model, cursor, batch_size)
+
+
+def ndjson_lines(pages):
+    """
+    Serialize pages of models with to_dict() as newline-delimited JSON, one chunk per page
+    """
+    for rows in pages:
+        yield ''.join(json.dumps(row.to_dict()) + '\n' for row in rows)
+
+
+def _pages(query, model, cursor, batch_size):
+    while True:
+        rows, cursor = keyset_page(query, model, cursor, batch_size)
+        if rows:
+            yield rows
+        if cursor is None:
+            return
+
+
+def _after(query, model, cursor):
+    if not cursor:
+        return query
+    created_at, row_id = decode_cursor(cursor)
+    return query.filter(tuple_(model.created_at, model.id) < (created_at, row_id))
@@ -0,0 +1,36 @@
+from functools import wraps
+
+from flask import request
+
+from app import db
+from config.database import route_reads, parse_last_write, set_last_write
+from config.settings import Config
+
+
+# Read-only views read from a replica; a client that just wrote reads from
+# the primary until READ_YOUR_WRITES_SECONDS have passed, so it sees its own
+# payment on the next page. The time of its last write travels in a cookie
+# and so holds across processes.
+
+def reads_from_replica(view):
+    """
+    Route the view's reads to a replica unless the client wrote recently
+    """
+    @wraps(view)
+    def decorated_view(*args, **kwargs):
+        route_reads(db.session(), parse_last_write(request.cookies.get(Config.READ_YOUR_WRITES_COOKIE)))
+        return view(*args, **kwargs)
+    return decorated_view
+
+
+def init_read_routing(app):
+    """
+    Set the read-your-writes cookie on responses to requests that committed a write
+    """
+    @app.after_request
+    def remember_last_write(response):
+        if db.session.registry.has():
+            written_at = db.session.info.get('last_write_at')
+            if written_at is not None:
+                set_last_write(response, written_at)
+        return response
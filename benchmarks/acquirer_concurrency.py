@@ -0,0 +1,79 @@
+"""
+Authorize payments against the local stub acquirer one at a time, from
+many request threads, and as concurrent batches, to show how many
+authorizations one worker keeps in flight.
+
+    python -m benchmarks.acquirer_concurrency --latency-ms 80 --requests 2000
+"""
+import argparse
+import threading
+import uuid
+
+from app.services.acquirer import AcquirerRunner, HttpAcquirerClient
+from app.services.acquirer_stub import start_stub_process
+from benchmarks.common import summarize, Timer
+
+
+def make_request(i):
+    return {'reference': f'TX-{i:016X}', 'amount': 25.0, 'currency': 'USD',
+            'card_id': str(uuid.uuid4()), 'merchant_id': 'bench'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency', default='lognormal')
+    parser.add_argument('--latency-ms', type=float, default=80.0)
+    parser.add_argument('--jitter', type=float, default=0.5)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--sequential', type=int, default=50, help='Requests for the one-at-a-time baseline')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--max-connections', type=int, default=100)
+    args = parser.parse_args()
+
+    stub, url = start_stub_process(latency=args.latency, latency_ms=args.latency_ms, jitter=args.jitter, seed=1)
+    runner = AcquirerRunner(HttpAcquirerClient(url, max_connections=args.max_connections, timeout_ms=5000))
+    runner.authorize(make_request(0))
+
+    # One authorization in flight at a time, as the old flow did
+    sequential = []
+    with Timer() as sequential_timer:
+        for i in range(args.sequential):
+            with Timer() as timer:
+                runner.authorize(make_request(i))
+            sequential.append(timer.elapsed * 1000)
+
+    # Many request threads sharing the worker's loop and connection pool
+    threaded = []
+    lock = threading.Lock()
+    per_thread = args.requests // args.threads
+
+    def worker(offset):
+        for i in range(per_thread):
+            with Timer() as timer:
+                runner.authorize(make_request(offset + i))
+            with lock:
+                threaded.append(timer.elapsed * 1000)
+
+    threads = [threading.Thread(target=worker, args=(t * per_thread,)) for t in range(args.threads)]
+    with Timer() as threaded_timer:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    # One batch with every authorization in flight at once
+    with Timer() as batch_timer:
+        results = runner.authorize_many([make_request(i) for i in range(args.requests)])
+    approved = sum(1 for r in results if r['approved'])
+
+    summarize('sequential', sequential)
+    print(f"            {args.sequential / sequential_timer.elapsed:,.0f} auth/s")
+    summarize(f'{args.threads} threads', threaded)
+    print(f"            {len(threaded) / threaded_timer.elapsed:,.0f} auth/s")
+    print(f"batch:      {args.requests / batch_timer.elapsed:,.0f} auth/s ({approved} approved)")
+    print(f"client:     {runner.stats()}")
+    stub.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Inject slowdowns into the local stub acquirer and compare caller latency
+with and without hedged authorizations and the circuit breaker.
+
+Hedging: a small share of calls stall, which is what sets p99; hedging
+at the p95 latency cuts those calls short.
+
+Breaker: a healthy phase, then an outage where every call runs past the
+client timeout, then recovery. Without the breaker every request thread
+waits out the full timeout for the whole outage; with it calls fail fast
+once it opens and traffic resumes after the half-open probes pass.
+
+    python -m benchmarks.acquirer_resilience --threads 32
+"""
+import argparse
+import threading
+import time
+import uuid
+
+from app.services.acquirer import AcquirerRunner, HttpAcquirerClient, ResilientAcquirerClient
+from app.services.acquirer_stub import control_stub, start_stub_process
+from app.services.circuit_breaker import CircuitBreaker
+from benchmarks.common import percentile, Timer
+
+
+def make_request(i):
+    return {'reference': f'TX-{i:016X}', 'amount': 25.0, 'currency': 'USD',
+            'card_id': str(uuid.uuid4()), 'merchant_id': 'bench'}
+
+
+def run_threads(runner, threads, duration, phases=None, url=None):
+    """
+    Authorize from `threads` request threads for `duration` seconds.
+    `phases` is a list of (start second, name, stub settings) applied as
+    time passes. Returns [(phase, latency ms, status)].
+    """
+    samples = []
+    lock = threading.Lock()
+    phase = {'name': phases[0][1] if phases else 'run'}
+    stop = threading.Event()
+
+    def worker(offset):
+        i = 0
+        while not stop.is_set():
+            name = phase['name']
+            with Timer() as timer:
+                result = runner.authorize(make_request(offset + i))
+            with lock:
+                samples.append((name, timer.elapsed * 1000, result['status']))
+            if result['status'] == 'unavailable':
+                # A client honouring the 503 backs off before retrying
+                time.sleep(0.05)
+            i += 1
+
+    workers = [threading.Thread(target=worker, args=(t * 10 ** 7,)) for t in range(threads)]
+    started = time.monotonic()
+    for t in workers:
+        t.start()
+
+    for at, name, settings in (phases or [])[1:]:
+        time.sleep(max(at - (time.monotonic() - started), 0))
+        control_stub(url, **settings)
+        phase['name'] = name
+    time.sleep(max(duration - (time.monotonic() - started), 0))
+
+    stop.set()
+    for t in workers:
+        t.join()
+    return samples
+
+
+def report(label, samples, phase_names):
+    print(label)
+    for name in phase_names:
+        latencies = sorted(latency for phase, latency, _ in samples if phase == name)
+        if not latencies:
+            continue
+        statuses = {}
+        for phase, _, status in samples:
+            if phase == name:
+                statuses[status] = statuses.get(status, 0) + 1
+        print(f"  {name:<10} n={len(latencies):>6} p50={percentile(latencies, 50):8.1f}ms "
+              f"p99={percentile(latencies, 99):8.1f}ms  {statuses}")
+
+
+def hedging(args):
+    stub, url = start_stub_process(latency='lognormal', latency_ms=args.latency_ms, jitter=0.3,
+                                   stall_rate=args.stall_rate, stall_ms=args.stall_ms, seed=1)
+    results = {}
+    for hedge in (False, True):
+        # The stub deduplicates on the reference, as hedging requires
+        client = ResilientAcquirerClient(HttpAcquirerClient(url, max_connections=200, timeout_ms=5000),
+                                         hedge=hedge, hedge_percentile=95, dedupes_reference=True)
+        runner = AcquirerRunner(client)
+        # Warm the pool and the latency percentile the hedge delay comes from
+        runner.authorize_many([make_request(i) for i in range(200)])
+        results[hedge] = run_threads(runner, args.threads, args.duration)
+        report(f"hedging {'on' if hedge else 'off'}: {client.stats()['hedges']} hedges, "
+               f"{client.stats()['hedge_wins']} won, delay {client.stats()['hedge_delay_ms'] or 0:.1f}ms",
+               results[hedge], ['run'])
+        runner.shutdown()
+    stub.terminate()
+
+    off = sorted(latency for _, latency, _ in results[False])
+    on = sorted(latency for _, latency, _ in results[True])
+    print(f"  p99 {percentile(off, 99):.1f}ms -> {percentile(on, 99):.1f}ms\n")
+
+
+def breaker(args):
+    healthy = {'latency_ms': args.latency_ms, 'stall_rate': 0.0}
+    phases = [
+        (0, 'healthy', healthy),
+        (args.phase_seconds, 'outage', {'latency_ms': args.timeout_ms * 3, 'stall_rate': 0.0}),
+        (args.phase_seconds * 2, 'recovered', healthy)
+    ]
+    names = [name for _, name, _ in phases]
+
+    for enabled in (False, True):
+        stub, url = start_stub_process(latency='lognormal', latency_ms=args.latency_ms, jitter=0.3, seed=1)
+        circuit = CircuitBreaker(url, window_seconds=2, min_calls=20, failure_rate=0.5, slow_call_ms=args.timeout_ms,
+                                 slow_call_rate=0.5, open_seconds=1, half_open_calls=5) if enabled else None
+        client = ResilientAcquirerClient(HttpAcquirerClient(url, max_connections=200, timeout_ms=args.timeout_ms),
+                                         breaker=circuit, hedge=False)
+        runner = AcquirerRunner(client)
+        runner.authorize(make_request(0))
+        samples = run_threads(runner, args.threads, args.phase_seconds * 3, phases, url)
+        breaker_stats = client.stats().get('breaker', {})
+        report(f"breaker {'on' if enabled else 'off'}"
+               + (f": opened {breaker_stats['times_opened']}x, rejected {breaker_stats['rejected']}" if enabled else ''),
+               samples, names)
+        runner.shutdown()
+        stub.terminate()
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--latency-ms', type=float, default=40.0)
+    parser.add_argument('--stall-rate', type=float, default=0.03, help='Share of calls that stall (hedging run)')
+    parser.add_argument('--stall-ms', type=float, default=600.0)
+    parser.add_argument('--duration', type=float, default=8.0, help='Seconds per hedging run')
+    parser.add_argument('--timeout-ms', type=int, default=1000, help='Client timeout (breaker run)')
+    parser.add_argument('--phase-seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    hedging(args)
+    breaker(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from app import db
+from app.models.user import User, Card
+from app.models.merchant import Merchant
+from app.models.transaction import Transaction
+from app.models.feature_profile import UserFeatureProfile
+from config.database import engine_options, configure_engine
+
+
+def make_app(database_uri='sqlite://', tuned=True, **config):
+    """
+    Create a bare Flask app bound to `database_uri` with all tables created.
+    With `tuned` the engine gets the app's pool and SQLite settings.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if tuned:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_uri)
+    app.config.update(config)
+    db.init_app(app)
+    with app.app_context():
+        if tuned:
+            configure_engine(db.engine)
+        db.create_all()
+    return app
+
+
+def seed_accounts(users=10, merchants=2):
+    """
+    Create users with one card each and a few merchants
+    Returns (user_ids, card_ids_by_user, merchant_ids)
+    """
+    user_ids, card_ids, merchant_ids = [], {}, []
+    owner = None
+
+    for i in range(users):
+        user = User(id=str(uuid.uuid4()), email=f'user{i}-{uuid.uuid4().hex[:6]}@example.com',
+                    username=f'user{i}-{uuid.uuid4().hex[:6]}', password_hash='x',
+                    first_name='Bench', last_name=str(i))
+        card = Card(id=str(uuid.uuid4()), user_id=user.id, card_number_hash='x', card_holder_name='Bench',
+                    expiry_month=12, expiry_year=2030, card_type='visa', last_four='1111')
+        db.session.add_all([user, card])
+        user_ids.append(user.id)
+        card_ids[user.id] = card.id
+        owner = owner or user
+
+    for i in range(merchants):
+        merchant = Merchant(id=str(uuid.uuid4()), user_id=owner.id, business_name=f'Merchant {i}',
+                            business_address='1 Bench St', business_phone='555-0000',
+                            business_email=f'merchant{i}@example.com', api_key=uuid.uuid4().hex,
+                            api_secret=uuid.uuid4().hex)
+        db.session.add(merchant)
+        merchant_ids.append(merchant.id)
+
+    db.session.commit()
+    return user_ids, card_ids, merchant_ids
+
+
+def seed_transactions(count, user_ids, card_ids, merchant_ids, start=None, chunk_size=10000, seed=42, days=90):
+    """
+    Bulk insert `count` synthetic transactions spread over the `days` days before `start`
+    """
+    rng = random.Random(seed)
+    start = start or datetime.utcnow()
+    statuses = ['completed'] * 8 + ['failed', 'pending']
+
+    for offset in range(0, count, chunk_size):
+        rows = []
+        for i in range(offset, min(offset + chunk_size, count)):
+            user_id = rng.choice(user_ids)
+            created_at = start - timedelta(seconds=rng.randint(0, days * 24 * 3600))
+            rows.append({
+                'id': str(uuid.uuid4()),
+                'user_id': user_id,
+                'merchant_id': rng.choice(merchant_ids),
+                'card_id': card_ids[user_id],
+                'amount': round(rng.lognormvariate(3.5, 1.0), 2),
+                'currency': 'USD',
+                'status': rng.choice(statuses),
+                'transaction_type': 'payment',
+                'created_at': created_at,
+                'updated_at': created_at,
+                'fraud_score': 0.0,
+                'is_fraudulent': False,
+                'reference_number': f'BX-{i:016d}'
+            })
+        db.session.bulk_insert_mappings(Transaction, rows)
+        db.session.commit()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name, samples_ms):
+    """
+    Print p50/p99/mean for a list of latencies in milliseconds
+    """
+    print(f"{name}: n={len(samples_ms)} p50={percentile(samples_ms, 50):.3f}ms "
+          f"p99={percentile(samples_ms, 99):.3f}ms mean={statistics.mean(samples_ms):.3f}ms")
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
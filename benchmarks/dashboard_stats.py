@@ -0,0 +1,148 @@
+"""
+Fill the dashboard counters from a seeded transactions table, keep them
+up to date through real payments, refunds, fraud flags and reviews (some
+of them running while the counters are rebuilt), then check they agree
+with COUNT queries and time both ways of building the dashboard numbers.
+
+    python -m benchmarks.dashboard_stats --rows 1000000 --payments 500
+    python -m benchmarks.dashboard_stats --database-uri postgresql://localhost/stats_bench
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from app import db
+from app.models.archive import ArchiveFile  # noqa: F401 - reconcile() reads the archive index
+from app.models.transaction import Transaction
+from app.services.payment_gateway import PaymentGateway
+from app.services.state_machine import transaction_states, TransitionError
+from app.services.transaction_stats import transaction_stats
+from benchmarks.common import make_app, seed_accounts, seed_transactions, summarize, Timer
+
+
+def counted_dashboard(now):
+    """
+    The dashboard's transaction numbers as COUNT queries over the table
+    """
+    t = Transaction
+    one_day_ago = now - timedelta(days=1)
+    return {
+        'total': t.query.count(),
+        'today': t.query.filter(t.created_at >= one_day_ago).count(),
+        'week': t.query.filter(t.created_at >= now - timedelta(days=7)).count(),
+        'flagged': t.query.filter(t.status == 'flagged_for_fraud').count(),
+        'flagged_today': t.query.filter(t.status == 'flagged_for_fraud', t.created_at >= one_day_ago).count()
+    }
+
+
+def counter_dashboard(now):
+    one_day_ago = now - timedelta(days=1)
+    by_status = transaction_stats.by_status()
+    return {
+        'total': sum(by_status.values()),
+        'today': transaction_stats.count(since=one_day_ago),
+        'week': transaction_stats.count(since=now - timedelta(days=7)),
+        'flagged': by_status.get('flagged_for_fraud', 0),
+        'flagged_today': transaction_stats.count(status='flagged_for_fraud', since=one_day_ago)
+    }
+
+
+def write_traffic(app, user_ids, card_ids, merchant_ids, payments, seed):
+    """
+    Payments, partial refunds, fraud flags and reviews through the normal write paths
+    """
+    rng = random.Random(seed)
+    outcomes = {}
+    with app.app_context():
+        for _ in range(payments):
+            user_id = rng.choice(user_ids)
+            result = PaymentGateway.process_payment(user_id, rng.choice(merchant_ids), card_ids[user_id],
+                                                    round(rng.uniform(5, 200), 2))
+            outcomes[result['status']] = outcomes.get(result['status'], 0) + 1
+            if result['status'] != 'completed':
+                continue
+            transaction = Transaction.query.filter_by(reference_number=result['reference']).one()
+            roll = rng.random()
+            try:
+                if roll < 0.2:
+                    PaymentGateway.refund_transaction(transaction.id, amount=round(transaction.amount / 2, 2))
+                elif roll < 0.4:
+                    transaction_states.transition(transaction.id, 'flagged_for_fraud', is_fraudulent=True)
+                    db.session.commit()
+                    if rng.random() < 0.5:
+                        transaction_states.transition(transaction.id, rng.choice(['completed', 'blocked']))
+                        db.session.commit()
+            except TransitionError:
+                db.session.rollback()
+        db.session.remove()
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--payments', type=int, default=500, help='Payments per writer thread')
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stats.db')}"
+    app = make_app(database_uri)
+
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            with db.engine.connect() as conn:
+                conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+        user_ids, card_ids, merchant_ids = seed_accounts(users=200, merchants=20)
+        with Timer() as seed_timer:
+            seed_transactions(args.rows, user_ids, card_ids, merchant_ids, chunk_size=50000)
+        print(f"Seeded {args.rows:,} transactions in {seed_timer.elapsed:.1f}s, bypassing the counters")
+
+        report = transaction_stats.reconcile()
+        print(f"before any rebuild: {report['drifted']} of {report['counters']} counters drifted")
+
+    # Correct the counters while writers are going through the normal paths
+    results = [None] * args.writers
+    writers = [threading.Thread(target=lambda i=i: results.__setitem__(
+        i, write_traffic(app, user_ids, card_ids, merchant_ids, args.payments, i))) for i in range(args.writers)]
+    for w in writers:
+        w.start()
+    with app.app_context():
+        with Timer() as fix_timer:
+            report = transaction_stats.reconcile(fix=True)
+        db.session.remove()
+    print(f"corrected {report['drifted']:,} of {report['counters']:,} counters in {fix_timer.elapsed:.1f}s during writes")
+    for w in writers:
+        w.join()
+    outcomes = {}
+    for result in results:
+        for status, count in result.items():
+            outcomes[status] = outcomes.get(status, 0) + count
+    print(f"{args.writers * args.payments} payments during and after the rebuild: {outcomes}")
+
+    with app.app_context():
+        report = transaction_stats.reconcile()
+        print(f"after writes: {report['drifted']} of {report['counters']} counters drifted")
+        for entry in report['drift'][:10]:
+            print(f"    {entry}")
+
+        now = datetime.utcnow()
+        counted_samples, counter_samples = [], []
+        for _ in range(args.repeat):
+            with Timer() as timer:
+                counted = counted_dashboard(now)
+            counted_samples.append(timer.elapsed * 1000)
+            with Timer() as timer:
+                from_counters = counter_dashboard(now)
+            counter_samples.append(timer.elapsed * 1000)
+        summarize('dashboard from COUNT queries', counted_samples)
+        summarize('dashboard from counters', counter_samples)
+        print(f"numbers match: {counted == from_counters} {from_counters}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Run concurrent writers (a transaction insert plus its dashboard counters
+per commit) and readers (a user's latest transactions) against a SQLite
+file, first with SQLAlchemy's engine defaults and then with the shared
+engine's pool and SQLite tuning, and report throughput, lock errors and
+the pool's checkout wait.
+
+    python -m benchmarks.db_engine_load --writers 8 --readers 8 --seconds 10
+    python -m benchmarks.db_engine_load --database-uri postgresql://localhost/engine_bench
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from app import db
+from app.models.transaction import Transaction
+from app.services.transaction_stats import transaction_stats
+from benchmarks.common import make_app, seed_accounts, summarize, Timer
+from config.database import SessionLocal, pool_metrics, pool_stats
+
+
+def writer(app, user_ids, card_ids, merchant_ids, stop, results, seed):
+    rng = random.Random(seed)
+    done, errors, latencies = 0, 0, []
+    with app.app_context():
+        while not stop.is_set():
+            user_id = rng.choice(user_ids)
+            now = datetime.utcnow()
+            with Timer() as timer:
+                try:
+                    db.session.add(Transaction(
+                        id=str(uuid.uuid4()), user_id=user_id, merchant_id=rng.choice(merchant_ids),
+                        card_id=card_ids[user_id], amount=round(rng.uniform(1, 500), 2), currency='USD',
+                        status='completed', transaction_type='payment', created_at=now,
+                        reference_number=f'LD-{uuid.uuid4().hex[:16]}'
+                    ))
+                    transaction_stats.record_created(now, 'completed')
+                    db.session.commit()
+                    done += 1
+                except Exception:
+                    db.session.rollback()
+                    errors += 1
+            latencies.append(timer.elapsed * 1000)
+        db.session.remove()
+    results.append(('write', done, errors, latencies))
+
+
+def reader(app, user_ids, stop, results, seed):
+    """
+    Reads through the FastAPI session factory, to exercise the shared engine
+    """
+    rng = random.Random(seed)
+    done, errors, latencies = 0, 0, []
+    while not stop.is_set():
+        session = SessionLocal()
+        with Timer() as timer:
+            try:
+                session.query(Transaction).filter(Transaction.user_id == rng.choice(user_ids)) \
+                    .order_by(Transaction.created_at.desc()).limit(20).all()
+                done += 1
+            except Exception:
+                errors += 1
+            finally:
+                session.close()
+        latencies.append(timer.elapsed * 1000)
+    results.append(('read', done, errors, latencies))
+
+
+def run(label, database_uri, tuned, args):
+    app = make_app(database_uri, tuned=tuned)
+    with app.app_context():
+        user_ids, card_ids, merchant_ids = seed_accounts(users=200, merchants=20)
+        engine = db.engine
+        settings = {}
+        if engine.dialect.name == 'sqlite':
+            with engine.connect() as conn:
+                for pragma in ('journal_mode', 'synchronous', 'mmap_size', 'busy_timeout'):
+                    settings[pragma] = conn.exec_driver_sql(f'PRAGMA {pragma}').scalar()
+        SessionLocal.configure(bind=engine)
+
+    pool_metrics.reset()
+    stop = threading.Event()
+    results = []
+    threads = [threading.Thread(target=writer, args=(app, user_ids, card_ids, merchant_ids, stop, results, i))
+               for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(app, user_ids, stop, results, 1000 + i))
+                for i in range(args.readers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    print(f"--- {label}: {type(engine.pool).__name__} {settings}")
+    for kind in ('write', 'read'):
+        rows = [r for r in results if r[0] == kind]
+        done = sum(r[1] for r in rows)
+        errors = sum(r[2] for r in rows)
+        latencies = [ms for r in rows for ms in r[3]]
+        print(f"{kind}s: {done / args.seconds:,.0f}/s, {errors} errors")
+        if latencies:
+            summarize(f"  {kind} latency", latencies)
+    if tuned:
+        print(f"pool: {pool_stats(engine)}")
+    with app.app_context():
+        db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a fresh temporary SQLite file per run')
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    for label, tuned in (('engine defaults', False), ('shared engine, tuned', True)):
+        database_uri = args.database_uri or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'load.db')}"
+        run(label, database_uri, tuned, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Export seeded transactions and payments as CSV and NDJSON, plain and
+gzipped, and report rows/s, bytes written and the peak memory the export
+allocated (tracemalloc), next to loading the same rows with .all() and
+to_dict().
+
+    python -m benchmarks.export --rows 1000000
+    python -m benchmarks.export --rows 10000000 --skip-baseline
+"""
+import argparse
+import os
+import tempfile
+import tracemalloc
+import zlib
+
+from app import db
+from app.models.payment import Payment
+from app.models.transaction import Transaction
+from app.services.export import ExportService
+from benchmarks.common import make_app, seed_accounts, seed_transactions, Timer
+
+
+def seed_payments(chunk_size=50000):
+    """
+    One payment per completed transaction, inserted with INSERT ... SELECT
+    """
+    p, t = Payment.__table__, Transaction.__table__
+    select = db.select(t.c.id, t.c.id, t.c.amount, t.c.currency, t.c.status, db.literal(1),
+                       db.literal('credit_card'), t.c.created_at, t.c.created_at) \
+        .where(t.c.status == 'completed')
+    db.session.execute(p.insert().from_select(
+        ['id', 'transaction_id', 'amount', 'currency', 'status', 'version', 'payment_method',
+         'payment_date', 'last_updated'], select))
+    db.session.commit()
+
+
+def run(exporter, kind, fmt, compress, expected, traced=False):
+    """
+    Export to a counting sink; returns (rows/s, bytes, peak traced bytes or None)
+    """
+    decompressor = zlib.decompressobj(31) if compress else None
+    lines = written = 0
+    if traced:
+        tracemalloc.start()
+    with Timer() as timer:
+        for chunk in exporter.export(kind, fmt, compress):
+            written += len(chunk)
+            lines += (decompressor.decompress(chunk) if decompressor else chunk).count(b'\n')
+    peak = None
+    if traced:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    rows = lines - (fmt == 'csv')
+    assert rows == expected, (kind, fmt, rows, expected)
+    return rows / timer.elapsed, written, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--skip-baseline', action='store_true', help='Skip loading every row with .all()')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(directory, 'export.db')}"
+    app = make_app(database_uri)
+    exporter = ExportService(chunk_size=args.chunk_size)
+
+    with app.app_context():
+        accounts = seed_accounts(users=200, merchants=20)
+        with Timer() as seed_timer:
+            seed_transactions(args.rows, *accounts, chunk_size=50000)
+            seed_payments()
+        payments = db.session.query(db.func.count(Payment.id)).scalar()
+        print(f"Seeded {args.rows:,} transactions and {payments:,} payments in {seed_timer.elapsed:.1f}s")
+        db.session.remove()
+
+        for kind, expected in (('transactions', args.rows), ('payments', payments)):
+            for fmt in ('csv', 'ndjson'):
+                for compress in (False, True):
+                    rate, written, _ = run(exporter, kind, fmt, compress, expected)
+                    print(f"{kind} {fmt}{'.gz' if compress else ''}: {rate:,.0f} rows/s, "
+                          f"{written / 1e6:,.1f} MB")
+
+        _, _, peak = run(exporter, 'transactions', 'csv', True, args.rows, traced=True)
+        print(f"peak memory allocated by a transactions csv.gz export: {peak / 1e6:,.1f} MB "
+              f"({args.chunk_size:,} rows per chunk)")
+
+        if not args.skip_baseline:
+            tracemalloc.start()
+            with Timer() as timer:
+                rows = [t.to_dict() for t in Transaction.query.all()]
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"baseline .all() + to_dict(): {len(rows) / timer.elapsed:,.0f} rows/s, "
+                  f"peak memory {peak / 1e6:,.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Compare row-by-row fraud scoring with FraudDetectionService.analyze_batch
+and check that both paths produce the same scores.
+
+    python -m benchmarks.fraud_batch_scoring --users 200 --history 20000 --batch 5000
+"""
+import argparse
+import random
+from datetime import datetime
+
+import numpy as np
+
+from app.models.transaction import Transaction
+from app.services.fraud_detection import FraudDetectionService
+from app.services.fraud_model_cache import fraud_model_cache
+from app.services.feature_store import FeatureStore
+from benchmarks.common import make_app, seed_accounts, seed_transactions, Timer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default='sqlite://')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--history', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=5000)
+    args = parser.parse_args()
+
+    app = make_app(args.database_uri)
+    with app.app_context():
+        user_ids, card_ids, merchant_ids = seed_accounts(args.users)
+        seed_transactions(args.history, user_ids, card_ids, merchant_ids)
+        FeatureStore.rebuild()
+
+        rng = random.Random(7)
+        batch = []
+        for _ in range(args.batch):
+            user_id = rng.choice(user_ids)
+            batch.append(Transaction(user_id=user_id, merchant_id=merchant_ids[0], card_id=card_ids[user_id],
+                                     amount=rng.choice([round(rng.lognormvariate(3.5, 1.5), 2), float(rng.randint(1, 3000))])))
+        now = datetime.utcnow()
+
+        fraud_model_cache.clear()
+        with Timer() as row_timer:
+            row_scores = [FraudDetectionService.analyze_transaction(t, t.user_id, now) for t in batch]
+
+        fraud_model_cache.clear()
+        with Timer() as batch_timer:
+            batch_scores = FraudDetectionService.analyze_batch(batch, now)
+
+        mismatches = int(np.sum(~np.isclose(row_scores, batch_scores)))
+        print(f"row-by-row: {len(batch) / row_timer.elapsed:,.0f} tx/s ({row_timer.elapsed:.2f}s)")
+        print(f"batch:      {len(batch) / batch_timer.elapsed:,.0f} tx/s ({batch_timer.elapsed:.2f}s)")
+        print(f"speedup:    {row_timer.elapsed / batch_timer.elapsed:.1f}x")
+        print(f"parity:     {len(batch) - mismatches}/{len(batch)} scores match")
+
+        if mismatches:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
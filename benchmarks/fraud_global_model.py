@@ -0,0 +1,81 @@
+"""
+Train the global fraud model, then compare per-transaction anomaly scoring
+against it with the per-user model cache, and check that row and batch
+scoring agree when the global model is loaded.
+
+    python -m benchmarks.fraud_global_model --users 200 --history 20000 --requests 2000
+"""
+import argparse
+import random
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+from app.models.transaction import Transaction
+from app.services.backtest import stream_database
+from app.services.feature_store import FeatureStore
+from app.services.fraud_detection import FraudDetectionService
+from app.services.fraud_model import global_fraud_model, train_global_model, save_artifact
+from app.services.fraud_model_cache import fraud_model_cache
+from benchmarks.common import make_app, seed_accounts, seed_transactions, summarize, Timer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default='sqlite://')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--history', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = make_app(args.database_uri)
+    with app.app_context():
+        user_ids, card_ids, merchant_ids = seed_accounts(args.users)
+        seed_transactions(args.history, user_ids, card_ids, merchant_ids)
+        FeatureStore.rebuild()
+
+        with Timer() as train_timer:
+            model, manifest = train_global_model(stream_database())
+        model_dir = tempfile.mkdtemp(prefix='fraud-model-')
+        version = save_artifact(model, manifest, model_dir)
+        print(f"trained {version} on {manifest['training_rows']} rows in {train_timer.elapsed:.2f}s")
+
+        rng = random.Random(7)
+        batch = []
+        for _ in range(args.requests):
+            user_id = rng.choice(user_ids)
+            batch.append(Transaction(user_id=user_id, merchant_id=merchant_ids[0], card_id=card_ids[user_id],
+                                     amount=rng.choice([round(rng.lognormvariate(3.5, 1.5), 2), float(rng.randint(1, 3000))])))
+        now = datetime.utcnow()
+        profiles = {t.user_id: FeatureStore.get_profile(t.user_id) for t in batch}
+
+        fraud_model_cache.clear()
+        per_user = []
+        for t in batch:
+            with Timer() as timer:
+                FraudDetectionService._anomaly_detection(t, profiles[t.user_id], now, model_cache=fraud_model_cache)
+            per_user.append(timer.elapsed * 1000)
+
+        global_fraud_model.model_dir = model_dir
+        global_fraud_model.load_latest()
+        global_only = []
+        for t in batch:
+            with Timer() as timer:
+                FraudDetectionService._anomaly_detection(t, profiles[t.user_id], now)
+            global_only.append(timer.elapsed * 1000)
+
+        summarize('per-user cache', per_user)
+        summarize('global model  ', global_only)
+
+        row_scores = [FraudDetectionService.analyze_transaction(t, t.user_id, now) for t in batch]
+        batch_scores = FraudDetectionService.analyze_batch(batch, now)
+        mismatches = int(np.sum(~np.isclose(row_scores, batch_scores)))
+        print(f"parity: {len(batch) - mismatches}/{len(batch)} scores match")
+
+        if mismatches:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Measure the per-transaction cost of evaluating compiled fraud rules.
+
+    python -m benchmarks.fraud_rules --rules 200 --iterations 100000
+"""
+import argparse
+import random
+import time
+import uuid
+
+import numpy as np
+
+from app.services.fraud_rules import CompiledRuleSet, validate_rule
+
+BUDGET_US = 100
+
+
+def random_rules(count, rng):
+    merchants = [str(uuid.uuid4()) for _ in range(50)]
+    rules = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.5:
+            data = {'field': 'amount', 'operator': rng.choice(['gt', 'gte', 'lt', 'lte']), 'value': rng.uniform(1, 5000)}
+        elif kind < 0.7:
+            data = {'field': rng.choice(['hour', 'day_of_week']), 'operator': rng.choice(['eq', 'ne', 'gte']), 'value': rng.randint(0, 6)}
+        elif kind < 0.85:
+            data = {'field': 'merchant_id', 'operator': rng.choice(['in', 'not_in']), 'value': rng.sample(merchants, 5)}
+        else:
+            data = {'field': 'currency', 'operator': rng.choice(['eq', 'ne']), 'value': rng.choice(['USD', 'EUR', 'GBP'])}
+        data.update(name=f'rule {i}', score=rng.uniform(1, 10))
+        rule = validate_rule(data)
+        rule['id'] = str(uuid.uuid4())
+        rules.append(rule)
+    return rules, merchants
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rules', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    rules, merchants = random_rules(args.rules, rng)
+
+    start = time.perf_counter()
+    compiled = CompiledRuleSet(rules, version=1)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    features = [{
+        'amount': rng.uniform(1, 5000),
+        'hour': rng.randint(0, 23),
+        'day_of_week': rng.randint(0, 6),
+        'currency': rng.choice(['USD', 'EUR', 'GBP']),
+        'transaction_type': 'payment',
+        'merchant_id': rng.choice(merchants),
+        'card_id': None,
+        'user_id': None
+    } for _ in range(1000)]
+
+    evaluate = compiled.evaluate
+    start = time.perf_counter()
+    for i in range(args.iterations):
+        evaluate(features[i % len(features)])
+    per_tx_us = (time.perf_counter() - start) / args.iterations * 1e6
+
+    columns = {field: np.array([features[i % len(features)][field] for i in range(args.batch)],
+                               dtype=float if field == 'amount' else object)
+               for field in compiled.fields}
+    start = time.perf_counter()
+    batch_scores = compiled.evaluate_batch(columns, args.batch)
+    batch_us = (time.perf_counter() - start) / args.batch * 1e6
+
+    # Scalar and vectorized evaluation must agree
+    scalar_scores = [evaluate(features[i % len(features)])[0] for i in range(args.batch)]
+    mismatches = int(np.sum(~np.isclose(batch_scores, scalar_scores)))
+
+    print(f"rules:        {len(rules)}")
+    print(f"compile:      {compile_ms:.2f}ms")
+    print(f"scalar:       {per_tx_us:.2f}us per transaction (budget {BUDGET_US}us)")
+    print(f"vectorized:   {batch_us:.3f}us per transaction")
+    print(f"parity:       {args.batch - mismatches}/{args.batch} scores match")
+
+    if per_tx_us > BUDGET_US or mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Measure idempotency-key overhead on PaymentGateway.process_payment and
+check that retried and concurrent duplicate requests charge only once.
+
+    python -m benchmarks.idempotency --threads 8 --lookups 100000
+"""
+import argparse
+import os
+import tempfile
+import threading
+import uuid
+
+from app import db
+from app.models.transaction import Transaction
+from app.services.fraud_scoring_pool import fraud_scoring_pool
+from app.services.idempotency import idempotency_store
+from app.services.payment_gateway import PaymentGateway
+from benchmarks.common import make_app, seed_accounts, percentile, Timer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--lookups', type=int, default=100000)
+    args = parser.parse_args()
+
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    fraud_scoring_pool.pool_size = 0
+
+    app = make_app(database_uri)
+    with app.app_context():
+        user_ids, card_ids, merchant_ids = seed_accounts(2)
+        user_id, card_id, merchant_id = user_ids[0], card_ids[user_ids[0]], merchant_ids[0]
+
+        def pay(key, amount=25.0):
+            return PaymentGateway.process_payment(user_id, merchant_id, card_id, amount, idempotency_key=key)
+
+        # Sequential retries of one key
+        key = uuid.uuid4().hex
+        first = pay(key)
+        retries = [pay(key) for _ in range(5)]
+        rows = Transaction.query.filter_by(reference_number=first['reference']).count()
+        retry_ok = rows == 1 and all(r.get('idempotent_replay') and r['reference'] == first['reference'] for r in retries)
+        conflict = pay(key, amount=26.0)['status'] == 'conflict'
+
+        # Hot path: repeated key answered from memory
+        samples = []
+        for _ in range(args.lookups):
+            with Timer() as timer:
+                pay(key)
+            samples.append(timer.elapsed * 1000000)
+        print(f"replayed key: n={len(samples)} p50={percentile(samples, 50):.1f}us p99={percentile(samples, 99):.1f}us")
+
+    # Concurrent duplicates of a fresh key
+    key = uuid.uuid4().hex
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        with app.app_context():
+            result = pay(key)
+            with lock:
+                results.append(result)
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with app.app_context():
+        references = {r.get('reference') for r in results}
+        concurrent_rows = Transaction.query.filter(Transaction.reference_number.in_(references)).count()
+
+    print(f"retries:    {'ok' if retry_ok else 'FAILED'} (5 retries, {rows} transaction)")
+    print(f"conflict:   {'ok' if conflict else 'FAILED'} (same key, different amount)")
+    print(f"concurrent: {len(results)} requests, {len(references)} distinct results, {concurrent_rows} transaction")
+    print(f"stats:      {idempotency_store.stats()}")
+
+    if not (retry_ok and conflict and len(references) == 1 and concurrent_rows == 1):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
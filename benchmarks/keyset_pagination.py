@@ -0,0 +1,98 @@
+"""
+Compare OFFSET paging with keyset cursors on (created_at, id) at
+increasing page depths, for the admin listing, a status filter and one
+user's history, check both return the same rows, and time an NDJSON
+stream of the whole table.
+
+    python -m benchmarks.keyset_pagination --rows 1000000 --pages 1 10 100 1000 5000
+    python -m benchmarks.keyset_pagination --database-uri postgresql://localhost/paging_bench
+"""
+import argparse
+import os
+import tempfile
+
+from app import db
+from app.models.transaction import Transaction
+from app.utils.pagination import encode_cursor, keyset_page, keyset_stream, ndjson_lines
+from benchmarks.common import make_app, seed_accounts, seed_transactions, summarize, Timer
+
+
+def offset_page(query, page, size):
+    return (query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+            .offset((page - 1) * size).limit(size).all())
+
+
+def cursor_for(query, page, size):
+    """
+    The cursor a client holds after reading page - 1 (found with OFFSET, untimed)
+    """
+    if page == 1:
+        return None
+    last = (query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+            .offset((page - 1) * size - 1).limit(1).one())
+    return encode_cursor(last.created_at, last.id)
+
+
+def time_pages(name, query, pages, size, repeat):
+    print(f"--- {name}")
+    for page in pages:
+        cursor = cursor_for(query, page, size)
+        offset_samples, keyset_samples = [], []
+        for _ in range(repeat):
+            db.session.expunge_all()
+            with Timer() as timer:
+                by_offset = offset_page(query, page, size)
+            offset_samples.append(timer.elapsed * 1000)
+            db.session.expunge_all()
+            with Timer() as timer:
+                by_keyset, _ = keyset_page(query, Transaction, cursor, size)
+            keyset_samples.append(timer.elapsed * 1000)
+        same = [t.id for t in by_offset] == [t.id for t in by_keyset]
+        summarize(f"page {page:>6} OFFSET", offset_samples)
+        summarize(f"page {page:>6} keyset", keyset_samples)
+        print(f"page {page:>6} same rows: {same}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--stream-batch', type=int, default=1000)
+    args = parser.parse_args()
+
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'paging.db')}"
+    app = make_app(database_uri)
+
+    with app.app_context():
+        user_ids, card_ids, merchant_ids = seed_accounts(users=args.users, merchants=20)
+        with Timer() as seed_timer:
+            seed_transactions(args.rows, user_ids, card_ids, merchant_ids, chunk_size=50000)
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql('ANALYZE')
+        print(f"Seeded {args.rows:,} transactions in {seed_timer.elapsed:.1f}s ({db.engine.dialect.name})")
+
+        per_user = args.rows // args.users // args.page_size
+        time_pages('admin listing', Transaction.query, args.pages, args.page_size, args.repeat)
+        time_pages('status filter (pending)', Transaction.query.filter(Transaction.status == 'pending'),
+                   [p for p in args.pages if p <= args.rows // 10 // args.page_size], args.page_size, args.repeat)
+        time_pages('one user', Transaction.query.filter(Transaction.user_id == user_ids[0]),
+                   [p for p in args.pages if p <= per_user], args.page_size, args.repeat)
+
+        rows = 0
+        size = 0
+        db.session.expunge_all()
+        with Timer() as timer:
+            for chunk in ndjson_lines(keyset_stream(Transaction.query, Transaction, batch_size=args.stream_batch)):
+                rows += chunk.count('\n')
+                size += len(chunk)
+                db.session.expunge_all()
+        print(f"NDJSON stream: {rows:,} rows, {size / 1e6:.0f}MB in {timer.elapsed:.1f}s "
+              f"({rows / timer.elapsed:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Count the SQL statements and time the transaction list pages, comparing
+the old per-row merchant lookups with the merchant joined into the page
+query, and check the merchant cache serves the detail page without a
+query and drops a merchant when it is renamed.
+
+Exits non-zero if a list page takes more than one statement, or the
+cached detail lookup any.
+
+    python -m benchmarks.merchant_queries --merchants 500 --pages 10 100 1000
+"""
+import argparse
+import sys
+
+from app import db
+from app.models.merchant import Merchant
+from app.models.transaction import Transaction
+from app.services.merchant_cache import merchant_cache
+from benchmarks.common import make_app, seed_accounts, seed_transactions, summarize, Timer
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        db.event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        db.event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+def per_row_page(size):
+    """
+    The list views as they were: one merchant lookup per row
+    """
+    rows = []
+    for t in Transaction.query.order_by(Transaction.created_at.desc()).limit(size).all():
+        merchant = Merchant.query.get(t.merchant_id)
+        rows.append((t.to_dict(), merchant.business_name if merchant else 'Unknown'))
+    return rows
+
+
+def joined_page(size):
+    return [(t.to_dict(), t.merchant_name) for t in Transaction.history_query().limit(size).all()]
+
+
+def run_page(page, size, repeat):
+    counts, samples = [], []
+    for _ in range(repeat):
+        db.session.remove()
+        with StatementCounter(db.engine) as counter, Timer() as timer:
+            rows = page(size)
+        counts.append(counter.count)
+        samples.append(timer.elapsed * 1000)
+    return rows, max(counts), samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=20000)
+    parser.add_argument('--merchants', type=int, default=500)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = make_app()
+    failures = []
+    with app.app_context():
+        user_ids, card_ids, merchant_ids = seed_accounts(users=args.users, merchants=args.merchants)
+        seed_transactions(args.transactions, user_ids, card_ids, merchant_ids)
+
+        for size in args.pages:
+            old_rows, old_count, old_samples = run_page(per_row_page, size, args.repeat)
+            new_rows, new_count, new_samples = run_page(joined_page, size, args.repeat)
+            print(f"page of {size}: {old_count} statements per-row, {new_count} joined, "
+                  f"same rows: {old_rows == new_rows}")
+            summarize(f'  per-row {size}', old_samples)
+            summarize(f'  joined {size}', new_samples)
+            if new_count != 1:
+                failures.append(f"joined page of {size} took {new_count} statements")
+
+        db.session.remove()
+        merchant_id = merchant_ids[0]
+        merchant_cache.get(merchant_id)
+        with StatementCounter(db.engine) as counter:
+            summary = merchant_cache.get(merchant_id)
+        print(f"cached detail lookup: {counter.count} statements, {summary['name']!r}")
+        if counter.count:
+            failures.append(f"cached merchant lookup took {counter.count} statements")
+
+        db.session.get(Merchant, merchant_id).business_name = 'Renamed Merchant'
+        db.session.commit()
+        renamed = merchant_cache.get(merchant_id)['name']
+        print(f"after rename: {renamed!r}, cache {merchant_cache.stats()}")
+        if renamed != 'Renamed Merchant':
+            failures.append('merchant cache served a stale name after an update')
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
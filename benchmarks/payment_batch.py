@@ -0,0 +1,77 @@
+"""
+Compare looping over PaymentGateway.process_payment with one
+PaymentGateway.process_payments_batch call for the same charges.
+
+    python -m benchmarks.payment_batch --charges 2000
+    python -m benchmarks.payment_batch --database-uri postgresql://localhost/payments_bench
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from app.services.backtest import stream_database
+from app.services.feature_store import FeatureStore
+from app.services.fraud_model import global_fraud_model, train_global_model
+from app.services.fraud_model_cache import fraud_model_cache
+from app.services.fraud_scoring_pool import fraud_scoring_pool
+from app.services.payment_gateway import PaymentGateway
+from benchmarks.common import make_app, seed_accounts, seed_transactions, Timer
+
+
+def make_charges(count, user_ids, card_ids, seed):
+    rng = random.Random(seed)
+    charges = []
+    for _ in range(count):
+        user_id = rng.choice(user_ids)
+        charges.append({'user_id': user_id, 'card_id': card_ids[user_id],
+                        'amount': round(rng.lognormvariate(3.5, 1.0), 2), 'description': 'Bench charge'})
+    return charges
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--history', type=int, default=5000)
+    parser.add_argument('--charges', type=int, default=2000)
+    parser.add_argument('--loop-charges', type=int, default=None, help='Charges for the loop baseline (default: --charges)')
+    parser.add_argument('--per-user-models', action='store_true', help='Score with per-user models instead of a global model')
+    args = parser.parse_args()
+
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    loop_count = args.loop_charges or args.charges
+
+    # Score inline on both paths so the comparison is like for like
+    fraud_scoring_pool.pool_size = 0
+
+    app = make_app(database_uri)
+    with app.app_context():
+        user_ids, card_ids, merchant_ids = seed_accounts(args.users)
+        seed_transactions(args.history, user_ids, card_ids, merchant_ids)
+        FeatureStore.rebuild()
+        if not args.per_user_models:
+            model, manifest = train_global_model(stream_database())
+            global_fraud_model.swap(model, dict(manifest, version='benchmark'))
+
+        fraud_model_cache.clear()
+        loop_charges = make_charges(loop_count, user_ids, card_ids, seed=1)
+        with Timer() as loop_timer:
+            loop_results = [PaymentGateway.process_payment(merchant_id=merchant_ids[0], **charge) for charge in loop_charges]
+        errors = sum(1 for r in loop_results if r['status'] == 'error')
+
+        fraud_model_cache.clear()
+        batch_charges = make_charges(args.charges, user_ids, card_ids, seed=2)
+        with Timer() as batch_timer:
+            result = PaymentGateway.process_payments_batch(merchant_ids[0], batch_charges)
+
+        loop_tps = loop_count / loop_timer.elapsed
+        batch_tps = args.charges / batch_timer.elapsed
+        print(f"database:  {database_uri.split(':')[0]}")
+        print(f"loop:      {loop_tps:,.0f} charges/s ({loop_count} in {loop_timer.elapsed:.2f}s, {errors} errors)")
+        print(f"batch:     {batch_tps:,.0f} charges/s ({args.charges} in {batch_timer.elapsed:.2f}s) {result['summary']}")
+        print(f"speedup:   {batch_tps / loop_tps:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Compare payment latency with the staged (three commit) and single-commit
+modes of PaymentGateway.process_payment under concurrent load, and check
+journal recovery for a payment interrupted before its commit.
+
+    python -m benchmarks.payment_commit_modes --threads 8 --payments 200
+    python -m benchmarks.payment_commit_modes --database-uri postgresql://localhost/payments_bench
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+from datetime import datetime
+
+from app import db
+from app.models.transaction import Transaction
+from app.services.backtest import stream_database
+from app.services.feature_store import FeatureStore
+from app.services.fraud_model import global_fraud_model, train_global_model
+from app.services.fraud_scoring_pool import fraud_scoring_pool
+from app.services.payment_gateway import PaymentGateway
+from app.services.payment_journal import PaymentJournal, payment_journal
+from benchmarks.common import make_app, seed_accounts, seed_transactions, summarize, Timer
+from config.settings import Config
+
+
+def run_load(app, threads, payments, user_ids, card_ids, merchant_id):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        with app.app_context():
+            for _ in range(payments):
+                user_id = rng.choice(user_ids)
+                with Timer() as timer:
+                    result = PaymentGateway.process_payment(user_id, merchant_id, card_ids[user_id],
+                                                            round(rng.lognormvariate(3.5, 1.0), 2))
+                with lock:
+                    latencies.append(timer.elapsed * 1000)
+                    statuses[result['status']] = statuses.get(result['status'], 0) + 1
+            db.session.remove()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    with Timer() as wall:
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    return latencies, statuses, wall.elapsed
+
+
+def check_recovery(app, user_id, card_id, merchant_id):
+    # Journal a payment as if the process died between the gateway call and the commit
+    journal = PaymentJournal(directory=tempfile.mkdtemp())
+    with app.app_context():
+        transaction = Transaction(id='recovery-check', user_id=user_id, merchant_id=merchant_id, card_id=card_id,
+                                  amount=12.5, currency='USD', reference_number='TB-RECOVERYCHECK',
+                                  fraud_score=0.0, created_at=datetime.utcnow())
+        journal.begin(transaction)
+        journal._file.close()
+        os.rename(journal.path, os.path.join(journal.directory, 'payments-999999999.journal'))
+
+        recovered = PaymentJournal(directory=journal.directory).recover()
+        row = db.session.get(Transaction, 'recovery-check')
+        # Written as pending, then confirmed or voided if the acquirer answered
+        return recovered == 1 and row is not None and row.status in ('pending', 'completed', 'failed')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--history', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--payments', type=int, default=100, help='Payments per thread per mode')
+    args = parser.parse_args()
+
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    fraud_scoring_pool.pool_size = 0
+    payment_journal.directory = tempfile.mkdtemp()
+
+    app = make_app(database_uri)
+    with app.app_context():
+        user_ids, card_ids, merchant_ids = seed_accounts(args.users)
+        seed_transactions(args.history, user_ids, card_ids, merchant_ids)
+        FeatureStore.rebuild()
+        model, manifest = train_global_model(stream_database())
+        global_fraud_model.swap(model, dict(manifest, version='benchmark'))
+
+    total = args.threads * args.payments
+    for single_commit in (False, True):
+        Config.PAYMENT_SINGLE_COMMIT = single_commit
+        latencies, statuses, elapsed = run_load(app, args.threads, args.payments, user_ids, card_ids, merchant_ids[0])
+        name = 'single commit' if single_commit else 'staged       '
+        summarize(name, latencies)
+        print(f"{' ' * len(name)}  {total / elapsed:,.0f} payments/s {statuses}")
+
+    print(f"journal: {payment_journal.stats()}")
+    print(f"recovery: {'ok' if check_recovery(app, user_ids[0], card_ids[user_ids[0]], merchant_ids[0]) else 'FAILED'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Generate reference numbers from several processes sharing one database
+and check that they never collide and are monotonic within each process.
+
+    python -m benchmarks.reference_ids --processes 4 --count 1000000
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+from app.services.reference import reference_generator, parse_reference
+from benchmarks.common import make_app, Timer
+
+
+def generate(database_uri, count, output_path):
+    app = make_app(database_uri)
+    with app.app_context():
+        reference_generator.next_reference()
+
+        with Timer() as single_timer:
+            singles = [reference_generator.next_reference() for _ in range(count // 2)]
+        with Timer() as bulk_timer:
+            bulk = reference_generator.next_references(count - count // 2)
+
+    references = singles + bulk
+    monotonic = all(a < b for a, b in zip(references, references[1:]))
+    with open(output_path, 'w') as f:
+        f.write('\n'.join(references))
+
+    reference_generator.release()
+    return {
+        'pid': os.getpid(),
+        'worker_id': parse_reference(references[0])[1],
+        'single_per_second': len(singles) / single_timer.elapsed,
+        'bulk_per_second': len(bulk) / bulk_timer.elapsed,
+        'monotonic': monotonic
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--count', type=int, default=1000000, help='References per process')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    make_app(database_uri)
+
+    outputs = [os.path.join(directory, f'references-{i}.txt') for i in range(args.processes)]
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(args.processes) as pool:
+        reports = pool.starmap(generate, [(database_uri, args.count, path) for path in outputs])
+
+    seen = set()
+    total = 0
+    for path in outputs:
+        with open(path) as f:
+            for line in f:
+                seen.add(line.rstrip('\n'))
+                total += 1
+
+    for report in reports:
+        print(f"pid {report['pid']} worker {report['worker_id']}: "
+              f"{report['single_per_second']:,.0f}/s one at a time, {report['bulk_per_second']:,.0f}/s in bulk, "
+              f"monotonic={report['monotonic']}")
+    print(f"workers:    {len({r['worker_id'] for r in reports})} distinct of {len(reports)}")
+    print(f"references: {total:,} generated, {total - len(seen)} collisions")
+
+    if total != len(seen) or not all(r['monotonic'] for r in reports):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Fire concurrent partial refunds at one payment and check the ledger never
+over-refunds, then compare the eligibility check (a single-row read of the
+payment) with the old way of finding earlier refunds, a LIKE search on
+descriptions, as refund history grows.
+
+    python -m benchmarks.refund_ledger --threads 16 --refunds 20 --history 200000
+    python -m benchmarks.refund_ledger --database-uri postgresql://localhost/refunds_bench
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import uuid
+from datetime import datetime
+
+from app import db
+from app.models.transaction import Transaction
+from app.services.payment_gateway import PaymentGateway
+from benchmarks.common import make_app, seed_accounts, summarize, Timer
+
+
+def make_payment(user_id, card_id, merchant_id, amount):
+    payment = Transaction(id=str(uuid.uuid4()), user_id=user_id, merchant_id=merchant_id, card_id=card_id,
+                          amount=amount, currency='USD', status='completed', transaction_type='payment',
+                          reference_number=PaymentGateway._generate_reference(), created_at=datetime.utcnow())
+    db.session.add(payment)
+    db.session.commit()
+    return payment.id, payment.reference_number
+
+
+def seed_refund_history(count, user_id, card_id, merchant_id, chunk_size=20000):
+    """
+    Completed payments with one refund each, so LIKE searches have history to scan
+    """
+    table = Transaction.__table__
+    now = datetime.utcnow()
+    for offset in range(0, count, chunk_size):
+        rows = []
+        for i in range(offset, min(offset + chunk_size, count)):
+            payment_id = str(uuid.uuid4())
+            base = {'user_id': user_id, 'merchant_id': merchant_id, 'card_id': card_id, 'currency': 'USD',
+                    'status': 'completed', 'created_at': now, 'updated_at': now, 'is_fraudulent': False}
+            rows.append(dict(base, id=payment_id, amount=50.0, transaction_type='payment',
+                             reference_number=f'RH-P{i:016d}', refunded_total=10.0,
+                             original_transaction_id=None, description=None))
+            rows.append(dict(base, id=str(uuid.uuid4()), amount=10.0, transaction_type='refund',
+                             reference_number=f'RH-R{i:016d}', refunded_total=0.0,
+                             original_transaction_id=payment_id, description=f'Refund for transaction RH-P{i:016d}'))
+        db.session.execute(table.insert(), rows)
+        db.session.commit()
+
+
+def hammer(app, payment_id, threads, refunds):
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        with app.app_context():
+            for _ in range(refunds):
+                result = PaymentGateway.refund_transaction(payment_id, amount=rng.choice([1.0, 2.5, 5.0]))
+                key = result.get('status') or ('rejected' if 'exceeds' in result['message'] else result['message'])
+                with lock:
+                    statuses[key] = statuses.get(key, 0) + 1
+            db.session.remove()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    with Timer() as timer:
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    return statuses, timer.elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--refunds', type=int, default=20, help='Refund attempts per thread')
+    parser.add_argument('--amount', type=float, default=100.0, help='Amount of the payment being refunded')
+    parser.add_argument('--history', type=int, default=200000, help='Earlier payments with a refund each')
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'refunds.db')}"
+    app = make_app(database_uri)
+
+    with app.app_context():
+        user_ids, card_ids, merchant_ids = seed_accounts(users=1, merchants=1)
+        user_id, card_id, merchant_id = user_ids[0], card_ids[user_ids[0]], merchant_ids[0]
+        payment_id, reference = make_payment(user_id, card_id, merchant_id, args.amount)
+
+    statuses, elapsed = hammer(app, payment_id, args.threads, args.refunds)
+    attempts = args.threads * args.refunds
+    print(f"{attempts} concurrent partial refunds of a {args.amount:.2f} payment in {elapsed:.2f}s: {statuses}")
+
+    with app.app_context():
+        payment = db.session.get(Transaction, payment_id)
+        refunded = db.session.query(db.func.coalesce(db.func.sum(Transaction.amount), 0.0)).filter(
+            Transaction.original_transaction_id == payment_id,
+            Transaction.status.in_(('pending', 'completed'))).scalar()
+        print(f"refunded_total={payment.refunded_total:.2f} sum of refunds={refunded:.2f} "
+              f"within amount: {payment.refunded_total <= payment.amount + 0.005} "
+              f"ledger matches: {abs(payment.refunded_total - refunded) < 0.005}")
+
+        with Timer() as seed_timer:
+            seed_refund_history(args.history, user_id, card_id, merchant_id)
+        print(f"seeded {args.history:,} refunded payments in {seed_timer.elapsed:.1f}s")
+
+        ledger, like = [], []
+        for _ in range(args.lookups):
+            db.session.expire_all()
+            with Timer() as timer:
+                db.session.get(Transaction, payment_id).refundable_amount
+            ledger.append(timer.elapsed * 1000)
+        for _ in range(max(args.lookups // 20, 5)):
+            with Timer() as timer:
+                db.session.query(db.func.sum(Transaction.amount)).filter(
+                    Transaction.transaction_type == 'refund',
+                    Transaction.description.like(f'Refund for transaction {reference}%')).scalar()
+            like.append(timer.elapsed * 1000)
+        summarize('ledger read', ledger)
+        summarize('LIKE search', like)
+
+
+if __name__ == '__main__':
+    main()
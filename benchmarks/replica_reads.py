@@ -0,0 +1,159 @@
+"""
+Time payment writes while reporting queries (merchant totals over 30 days
+and users' latest transactions) run alongside, first with the reports on
+the primary and then routed to a replica, and check that a client reads
+its own write right after making it.
+
+Without --replica-uri the replica is a copy of the seeded SQLite primary
+taken before the run; nothing replicates into it, so a write can only be
+read back if its reads stay on the primary. With Postgres, point
+--replica-uri at a streaming replica of --database-uri.
+
+    python -m benchmarks.replica_reads --rows 200000 --writers 4 --reporters 4 --seconds 10
+    python -m benchmarks.replica_reads --database-uri postgresql://localhost/primary \\
+        --replica-uri postgresql://localhost:5433/primary
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from app import db
+from app.models.transaction import Transaction
+from app.services.transaction_stats import transaction_stats
+from benchmarks.common import make_app, seed_accounts, seed_transactions, summarize, Timer
+from config.database import SessionLocal, configure_replicas, route_reads
+
+
+def writer(app, user_ids, card_ids, merchant_ids, stop, results, seed):
+    """
+    Insert a payment and its counters per commit, then read it back as the
+    same client would on its next request
+    """
+    rng = random.Random(seed)
+    latencies, read_back, stale = [], 0, 0
+    with app.app_context():
+        while not stop.is_set():
+            user_id = rng.choice(user_ids)
+            now = datetime.utcnow()
+            transaction_id = str(uuid.uuid4())
+            with Timer() as timer:
+                db.session.add(Transaction(
+                    id=transaction_id, user_id=user_id, merchant_id=rng.choice(merchant_ids),
+                    card_id=card_ids[user_id], amount=round(rng.uniform(1, 500), 2), currency='USD',
+                    status='completed', transaction_type='payment', created_at=now,
+                    reference_number=f'RR-{uuid.uuid4().hex[:16]}'
+                ))
+                transaction_stats.record_created(now, 'completed')
+                db.session.commit()
+            latencies.append(timer.elapsed * 1000)
+            written_at = db.session.info['last_write_at']
+            db.session.remove()
+
+            # The next request carries the write's time in the read-your-writes cookie
+            session = SessionLocal()
+            route_reads(session, written_at)
+            if session.get(Transaction, transaction_id) is not None:
+                read_back += 1
+            else:
+                stale += 1
+            session.close()
+    results.append(('write', latencies, read_back, stale))
+
+
+def reporter(app, merchant_ids, user_ids, stop, results, seed):
+    rng = random.Random(seed)
+    latencies = []
+    with app.app_context():
+        while not stop.is_set():
+            route_reads(db.session())
+            with Timer() as timer:
+                since = datetime.utcnow() - timedelta(days=30)
+                db.session.query(Transaction.merchant_id, db.func.count(), db.func.sum(Transaction.amount)) \
+                    .filter(Transaction.created_at >= since).group_by(Transaction.merchant_id).all()
+                Transaction.history_query(rng.choice(user_ids)).limit(20).all()
+            latencies.append(timer.elapsed * 1000)
+            db.session.remove()
+    results.append(('report', latencies, 0, 0))
+
+
+def run(label, app, replica_uri, accounts, args):
+    configure_replicas([replica_uri] if replica_uri else [])
+    user_ids, card_ids, merchant_ids = accounts
+    stop = threading.Event()
+    results = []
+    threads = [threading.Thread(target=writer, args=(app, user_ids, card_ids, merchant_ids, stop, results, i))
+               for i in range(args.writers)]
+    threads += [threading.Thread(target=reporter, args=(app, merchant_ids, user_ids, stop, results, 100 + i))
+                for i in range(args.reporters)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    print(f"--- {label}")
+    writes = [ms for kind, samples, _, _ in results if kind == 'write' for ms in samples]
+    reports = [ms for kind, samples, _, _ in results if kind == 'report' for ms in samples]
+    read_back = sum(r[2] for r in results if r[0] == 'write')
+    stale = sum(r[3] for r in results if r[0] == 'write')
+    print(f"writes: {len(writes) / args.seconds:,.0f}/s, reports: {len(reports) / args.seconds:,.1f}/s")
+    if writes:
+        summarize('  write latency', writes)
+    if reports:
+        summarize('  report latency', reports)
+    print(f"  own write visible on the next read: {read_back} of {read_back + stale}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--replica-uri', default=None, help='Defaults to a copy of the seeded SQLite primary')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--reporters', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(directory, 'primary.db')}"
+    app = make_app(database_uri)
+    with app.app_context():
+        accounts = seed_accounts(users=200, merchants=20)
+        with Timer() as seed_timer:
+            seed_transactions(args.rows, *accounts, chunk_size=50000)
+        print(f"Seeded {args.rows:,} transactions in {seed_timer.elapsed:.1f}s")
+
+        replica_uri = args.replica_uri
+        if replica_uri is None:
+            if db.engine.dialect.name != 'sqlite':
+                parser.error('--replica-uri is required with a server database')
+            with db.engine.connect() as conn:
+                conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+            db.session.remove()
+            db.engine.dispose()
+            replica_path = os.path.join(directory, 'replica.db')
+            shutil.copyfile(db.engine.url.database, replica_path)
+            replica_uri = f'sqlite:///{replica_path}'
+
+    run('reports on the primary', app, None, accounts, args)
+    run('reports on the replica', app, replica_uri, accounts, args)
+
+    # Without the cookie a client's read goes to the replica, which a lagging replica answers stale
+    with app.app_context():
+        latest = Transaction.query.order_by(Transaction.created_at.desc()).first()
+    session = SessionLocal()
+    route_reads(session)
+    print(f"latest write read without read-your-writes: "
+          f"{'found' if session.get(Transaction, latest.id) else 'missing'} on {session.get_bind().url}")
+    session.close()
+
+
+if __name__ == '__main__':
+    main()
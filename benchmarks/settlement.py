@@ -0,0 +1,123 @@
+"""
+Settle a synthetic window of completed payments and refunds, stopping
+half way and resuming from the checkpoint, then check the batch totals
+against a plain GROUP BY over the same rows.
+
+    python -m benchmarks.settlement --rows 10000000 --merchants 200
+    python -m benchmarks.settlement --database-uri postgresql://localhost/settlement_bench
+"""
+import argparse
+import os
+import random
+import resource
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+from app import db
+from app.models.settlement import SettlementBatch
+from app.models.transaction import Transaction
+from app.services.settlement import SettlementEngine
+from benchmarks.common import make_app, seed_accounts, Timer
+
+
+def seed_window(count, user_ids, card_ids, merchant_ids, window_start, chunk_size=50000, seed=7):
+    """
+    Insert `count` transactions spread evenly through one day, in time
+    order: mostly completed payments, with some refunds, failures and a
+    second currency
+    """
+    rng = random.Random(seed)
+    table = Transaction.__table__
+    types = ['payment'] * 9 + ['refund']
+    statuses = ['completed'] * 9 + ['failed']
+
+    for offset in range(0, count, chunk_size):
+        rows = []
+        for i in range(offset, min(offset + chunk_size, count)):
+            user_id = rng.choice(user_ids)
+            created_at = window_start + timedelta(seconds=i * 24 * 3600 / count)
+            rows.append({
+                'id': str(uuid.UUID(int=rng.getrandbits(128))),
+                'user_id': user_id,
+                'merchant_id': rng.choice(merchant_ids),
+                'card_id': card_ids[user_id],
+                'amount': round(rng.lognormvariate(3.5, 1.0), 2),
+                'currency': 'USD' if rng.random() < 0.9 else 'EUR',
+                'status': rng.choice(statuses),
+                'transaction_type': rng.choice(types),
+                'created_at': created_at,
+                'updated_at': created_at,
+                'fraud_score': 0.0,
+                'is_fraudulent': False,
+                'reference_number': f'ST-{i:016d}'
+            })
+        db.session.execute(table.insert(), rows)
+        db.session.commit()
+
+
+def expected_totals(window_start, window_end):
+    t = Transaction.__table__
+    cents = db.func.sum(db.func.round(t.c.amount * 100))
+    query = (db.select(t.c.merchant_id, t.c.currency, t.c.transaction_type, db.func.count(), cents)
+             .where(t.c.status == 'completed', t.c.created_at >= window_start, t.c.created_at < window_end)
+             .group_by(t.c.merchant_id, t.c.currency, t.c.transaction_type))
+    totals = {}
+    for merchant_id, currency, transaction_type, count, total in db.session.execute(query):
+        entry = totals.setdefault((merchant_id, currency), [0, 0, 0, 0])
+        offset = 0 if transaction_type == 'payment' else 2
+        entry[offset] += count
+        entry[offset + 1] += int(total)
+    return totals
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--merchants', type=int, default=200)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a temporary SQLite file.')
+    args = parser.parse_args()
+
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'settlement.db')}"
+    app = make_app(database_uri)
+    window_start = datetime(2024, 3, 1)
+    window_end = window_start + timedelta(days=1)
+
+    with app.app_context():
+        user_ids, card_ids, merchant_ids = seed_accounts(users=args.users, merchants=args.merchants)
+        with Timer() as seed_timer:
+            seed_window(args.rows, user_ids, card_ids, merchant_ids, window_start)
+        print(f"Seeded {args.rows:,} rows in {seed_timer.elapsed:.1f}s ({database_uri})")
+
+        engine = SettlementEngine(chunk_size=args.chunk_size)
+        rss_before = max_rss_mb()
+
+        first = engine.settle(window_start, window_end, limit=args.rows // 2)
+        print(f"first pass:  {first['rows']:,} rows, status {first['status']}, "
+              f"{first['rows_per_second']:,.0f} rows/s")
+        second = engine.settle(window_start, window_end)
+        print(f"resumed:     {second['rows']:,} rows, status {second['status']}, "
+              f"{second['rows_per_second']:,.0f} rows/s")
+
+        total_rows = first['rows'] + second['rows']
+        total_seconds = first['elapsed_seconds'] + second['elapsed_seconds']
+        print(f"settled {total_rows:,} rows into {second['batches']} batches in {total_seconds:.1f}s "
+              f"({total_rows / total_seconds:,.0f} rows/s)")
+        print(f"max RSS:     {rss_before:.0f}MB before settling, {max_rss_mb():.0f}MB after")
+
+        expected = expected_totals(window_start, window_end)
+        actual = {(b.merchant_id, b.currency): [b.payment_count, b.payment_total, b.refund_count, b.refund_total]
+                  for b in SettlementBatch.query.filter_by(window_start=window_start)}
+        unsettled = db.session.query(db.func.count(Transaction.id)).filter(
+            Transaction.status == 'completed', Transaction.settlement_batch_id.is_(None)).scalar()
+        print(f"batches match GROUP BY: {actual == expected}, completed rows left unsettled: {unsettled}")
+
+
+if __name__ == '__main__':
+    main()
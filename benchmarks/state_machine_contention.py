@@ -0,0 +1,142 @@
+"""
+Hammer one transaction from many threads, each reading it and moving it
+between 'completed' and 'flagged_for_fraud' with a compare-and-set on the
+version it read, then check no update was lost: the final version must be
+one more than the number of transitions that reported success. Illegal
+transitions are also fired to check they are rejected without touching
+the row. Exits non-zero if either check fails.
+
+    python -m benchmarks.state_machine_contention --threads 32 --attempts 200
+    python -m benchmarks.state_machine_contention --database-uri postgresql://localhost/states_bench
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import uuid
+from datetime import datetime
+
+from app import db
+from app.models.transaction import Transaction
+from app.services.payment_gateway import PaymentGateway
+from app.services.state_machine import (
+    transaction_states, IllegalTransitionError, TransitionConflictError, TransitionError
+)
+from benchmarks.common import make_app, seed_accounts, summarize, Timer
+
+FLIP = {'completed': 'flagged_for_fraud', 'flagged_for_fraud': 'completed'}
+
+# Reachable from neither 'completed' nor 'flagged_for_fraud'
+ILLEGAL = ('pending', 'failed')
+
+
+def make_transaction(user_id, card_id, merchant_id):
+    transaction = Transaction(id=str(uuid.uuid4()), user_id=user_id, merchant_id=merchant_id, card_id=card_id,
+                              amount=25.0, currency='USD', status='completed', transaction_type='payment',
+                              reference_number=PaymentGateway._generate_reference(), created_at=datetime.utcnow())
+    db.session.add(transaction)
+    db.session.commit()
+    return transaction.id, transaction.version
+
+
+def hammer(app, transaction_id, threads, attempts):
+    counts = {'applied': 0, 'conflict': 0, 'illegal': 0, 'other': 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        local = {key: 0 for key in counts}
+        local_latencies = []
+        with app.app_context():
+            for _ in range(attempts):
+                with Timer() as timer:
+                    transaction = db.session.get(Transaction, transaction_id)
+                    try:
+                        transaction_states.apply(transaction, FLIP[transaction.status])
+                        db.session.commit()
+                        local['applied'] += 1
+                    except TransitionConflictError:
+                        db.session.rollback()
+                        local['conflict'] += 1
+                    except IllegalTransitionError:
+                        db.session.rollback()
+                        local['illegal'] += 1
+                    except Exception:
+                        # SQLite busy timeouts and the like
+                        db.session.rollback()
+                        local['other'] += 1
+                    db.session.expire_all()
+                local_latencies.append(timer.elapsed * 1000)
+            db.session.remove()
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+            latencies.extend(local_latencies)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    with Timer() as timer:
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    return counts, latencies, timer.elapsed
+
+
+def reject_illegal(transaction_id):
+    """
+    Fire transitions the row's status doesn't allow; returns how many were rejected
+    """
+    rejected = 0
+    for new_status in ILLEGAL:
+        try:
+            transaction_states.transition(transaction_id, new_status)
+        except IllegalTransitionError:
+            rejected += 1
+        except TransitionError:
+            pass
+    db.session.rollback()
+    db.session.expire_all()
+    return rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--attempts', type=int, default=100, help='Transition attempts per thread')
+    args = parser.parse_args()
+
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'states.db')}"
+    app = make_app(database_uri)
+
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            with db.engine.connect() as conn:
+                conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+        user_ids, card_ids, merchant_ids = seed_accounts(users=1, merchants=1)
+        transaction_id, start_version = make_transaction(user_ids[0], card_ids[user_ids[0]], merchant_ids[0])
+
+    counts, latencies, elapsed = hammer(app, transaction_id, args.threads, args.attempts)
+    attempts = args.threads * args.attempts
+    print(f"{attempts:,} transitions from {args.threads} threads in {elapsed:.2f}s "
+          f"({attempts / elapsed:,.0f}/s): {counts}")
+    summarize('read + transition', latencies)
+
+    with app.app_context():
+        transaction = db.session.get(Transaction, transaction_id)
+        no_lost_updates = transaction.version == start_version + counts['applied']
+        print(f"final status={transaction.status} version={transaction.version} "
+              f"expected version={start_version + counts['applied']} "
+              f"no lost updates: {no_lost_updates}")
+
+        rejected = reject_illegal(transaction_id)
+        unchanged = db.session.get(Transaction, transaction_id).version == transaction.version
+        print(f"illegal transitions rejected: {rejected}/{len(ILLEGAL)}, row untouched: {unchanged}")
+
+    if not (no_lost_updates and rejected == len(ILLEGAL) and unchanged):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
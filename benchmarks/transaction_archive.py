@@ -0,0 +1,145 @@
+"""
+Seed two years of transactions, archive those older than a year to
+monthly Parquet files, and report how much the hot table shrank, how
+fast archived transactions read back (by reference and in a user's
+history pages) next to hot ones, and that archived rows and the
+dashboard counters still match what was in the table.
+
+Completed payments are marked settled up front, standing in for
+settlement having run over the old windows.
+
+    python -m benchmarks.transaction_archive --rows 500000 --older-than-days 365
+"""
+import argparse
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+from app import db
+from app.models.archive import ArchivedTransaction
+from app.models.settlement import SettlementBatch, SettlementRun
+from app.models.transaction import Transaction
+from app.services.archive import transaction_archive
+from app.services.transaction_stats import transaction_stats
+from app.utils.pagination import encode_cursor
+from benchmarks.common import make_app, seed_accounts, seed_transactions, summarize, Timer
+
+
+def settle_everything(merchant_id, now):
+    run = SettlementRun(window_start=now - timedelta(days=3650), window_end=now, status='completed')
+    db.session.add(run)
+    db.session.flush()
+    batch = SettlementBatch(run_id=run.id, merchant_id=merchant_id, currency='USD',
+                            window_start=run.window_start, window_end=run.window_end, status='closed')
+    db.session.add(batch)
+    db.session.flush()
+    t = Transaction.__table__
+    db.session.execute(t.update().where(t.c.status == 'completed').values(settlement_batch_id=batch.id))
+    db.session.commit()
+
+
+def time_reads(label, archive, references, users, cutoff, repeat):
+    lookups, first_pages, old_pages = [], [], []
+    for reference in references[:repeat]:
+        with Timer() as timer:
+            found = db.session.get(Transaction, reference) \
+                or Transaction.query.filter_by(reference_number=reference).first() \
+                or archive.get(reference)
+        assert found is not None, reference
+        lookups.append(timer.elapsed * 1000)
+    # A user's newest page, and the first page older than the archive cutoff
+    old_cursor = encode_cursor(cutoff, '')
+    for user_id in users[:repeat]:
+        with Timer() as timer:
+            archive.history_page(user_id, None, 20)
+        first_pages.append(timer.elapsed * 1000)
+        with Timer() as timer:
+            archive.history_page(user_id, old_cursor, 20)
+        old_pages.append(timer.elapsed * 1000)
+        db.session.remove()
+    print(f"--- {label}")
+    summarize('  detail by reference', lookups)
+    summarize('  newest history page', first_pages)
+    summarize('  history page past the cutoff', old_pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--days', type=int, default=730, help='Days of history to seed')
+    parser.add_argument('--older-than-days', type=int, default=365)
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(directory, 'archive.db')}"
+    app = make_app(database_uri)
+    archive = transaction_archive
+    archive.directory = os.path.join(directory, 'archive')
+    now = datetime.utcnow()
+    rng = random.Random(7)
+
+    with app.app_context():
+        user_ids, card_ids, merchant_ids = seed_accounts(users=200, merchants=20)
+        with Timer() as seed_timer:
+            seed_transactions(args.rows, user_ids, card_ids, merchant_ids, start=now, chunk_size=50000,
+                              days=args.days)
+        settle_everything(merchant_ids[0], now)
+        transaction_stats.reconcile(fix=True)
+        print(f"Seeded {args.rows:,} transactions over {args.days} days in {seed_timer.elapsed:.1f}s")
+
+        # Old transactions to look up and compare after they are archived
+        cutoff = now - timedelta(days=args.older_than_days)
+        old = Transaction.query.filter(Transaction.created_at < cutoff - timedelta(days=1),
+                                       Transaction.status != 'pending').limit(5000).all()
+        sample = rng.sample(old, min(args.repeat, len(old)))
+        snapshot = {t.reference_number: t.to_dict() for t in sample}
+        references = list(snapshot)
+        db.session.remove()
+
+        time_reads('before archiving, from the table', archive, references, user_ids, cutoff, args.repeat)
+
+        report = archive.archive(older_than_days=args.older_than_days, batch_size=args.batch_size, now=now)
+        before, after = report['before'], report['after']
+        print(f"Archived {report['archived']:,} transactions into {report['files']} files "
+              f"in {report['elapsed_seconds']:.1f}s ({report['changed']} changed meanwhile)")
+        print(f"transactions rows: {before['transactions_rows']:,} -> {after['transactions_rows']:,}")
+        if before['transactions_bytes']:
+            print(f"transactions table and indexes: {before['transactions_bytes'] / 1e6:,.1f} MB -> "
+                  f"{after['transactions_bytes'] / 1e6:,.1f} MB "
+                  f"({1 - after['transactions_bytes'] / before['transactions_bytes']:.0%} smaller)")
+        if after['index_bytes'] is not None:
+            print(f"archive index: {after['index_bytes'] / 1e6:,.1f} MB for {after['index_rows']:,} rows")
+        print(f"archive files: {after['archive_bytes'] / 1e6:,.1f} MB ({archive.compression})")
+        print(f"archive reads sampled by the job: {report['read_latency_ms']}")
+        if db.engine.dialect.name == 'sqlite':
+            # Deleted rows leave part-empty pages behind until the table is rebuilt
+            db.session.remove()
+            with db.engine.connect() as conn:
+                conn.execution_options(isolation_level='AUTOCOMMIT').exec_driver_sql('VACUUM')
+            vacuumed = archive.table_sizes()['transactions_bytes']
+            print(f"transactions table and indexes after VACUUM: {vacuumed / 1e6:,.1f} MB "
+                  f"({1 - vacuumed / before['transactions_bytes']:.0%} smaller)")
+
+        time_reads('after archiving, archived rows from Parquet', archive, references, user_ids, cutoff, args.repeat)
+
+        mismatched = 0
+        for reference, expected in snapshot.items():
+            record = archive.get(reference)
+            actual = record.to_dict() if record is not None else None
+            if actual is not None:
+                actual.pop('archived')
+            mismatched += actual != expected
+        archived = db.session.query(db.func.count(ArchivedTransaction.id)).scalar()
+        print(f"{len(snapshot) - mismatched} of {len(snapshot)} sampled transactions read back unchanged; "
+              f"{archived:,} indexed")
+
+        reconciled = transaction_stats.reconcile()
+        print(f"dashboard counters after archiving: {reconciled['drifted']} of {reconciled['counters']} drifted")
+
+
+if __name__ == '__main__':
+    main()
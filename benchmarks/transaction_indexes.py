@@ -0,0 +1,139 @@
+"""
+Time the hot transaction queries and print their plans on a seeded table,
+first without the access path indexes and then after building them.
+
+    python -m benchmarks.transaction_indexes --rows 1000000
+    python -m benchmarks.transaction_indexes --database-uri postgresql://localhost/indexes_bench
+"""
+import argparse
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from app import db
+from app.models.payment import Payment
+from app.models.transaction import Transaction, Dispute
+from benchmarks.common import make_app, seed_accounts, seed_transactions, summarize, Timer
+
+# The indexes added by migrations 9b7d3f12c6a4 and 2e6f0c9a8b31
+ACCESS_PATH_INDEXES = [
+    'ix_transactions_user_id_created_at',
+    'ix_transactions_merchant_id_created_at',
+    'ix_transactions_status_created_at_id',
+    'ix_transactions_created_at',
+    'ix_payments_transaction_id',
+    'ix_disputes_transaction_id',
+]
+
+
+def access_path_indexes():
+    indexes = {index.name: index for model in (Transaction, Payment, Dispute) for index in model.__table__.indexes}
+    return [indexes[name] for name in ACCESS_PATH_INDEXES]
+
+
+def hot_queries(user_id, merchant_id, transaction_id, now):
+    """
+    The queries behind the dashboards, fraud history, admin counts, the
+    flagged queue and the payment lookup, as the app issues them
+    """
+    t = Transaction
+    one_day_ago = now - timedelta(days=1)
+    return [
+        ('user dashboard', db.select(t).where(t.user_id == user_id).order_by(t.created_at.desc()).limit(10)),
+        ('user history', db.select(t).where(t.user_id == user_id).order_by(t.created_at.desc())),
+        ('fraud history', db.select(t.amount, t.created_at).where(
+            t.user_id == user_id, t.created_at >= now - timedelta(days=30)).order_by(t.created_at)),
+        ('merchant dashboard', db.select(t).where(t.merchant_id == merchant_id)
+         .order_by(t.created_at.desc()).limit(10)),
+        ('admin today count', db.select(db.func.count()).select_from(t).where(t.created_at >= one_day_ago)),
+        ('admin flagged today', db.select(db.func.count()).select_from(t).where(
+            t.status == 'flagged_for_fraud', t.created_at >= one_day_ago)),
+        ('flagged queue', db.select(t).where(t.status == 'flagged_for_fraud')),
+        ('payment lookup', db.select(Payment.id).where(Payment.transaction_id == transaction_id).limit(1)),
+    ]
+
+
+def explain(conn, statement):
+    compiled = statement.compile(bind=conn)
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    if compiled.positiontup is not None:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    rows = conn.exec_driver_sql(prefix + str(compiled), params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def measure(label, queries, repeat):
+    print(f"--- {label}")
+    with db.engine.connect() as conn:
+        for name, statement in queries:
+            samples = []
+            for _ in range(repeat):
+                with Timer() as timer:
+                    conn.execute(statement).fetchall()
+                samples.append(timer.elapsed * 1000)
+            summarize(name, samples)
+            for line in explain(conn, statement):
+                print(f"    {line}")
+
+
+def analyze():
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
+
+
+def seed_side_tables():
+    """
+    Flag 1% of the transactions for review and give 10% a payment record
+    """
+    t = Transaction.__table__
+    p = Payment.__table__
+    with db.engine.begin() as conn:
+        conn.execute(t.update().where(t.c.reference_number.like('%00')).values(status='flagged_for_fraud'))
+        conn.execute(p.insert().from_select(
+            ['id', 'transaction_id', 'amount', 'currency', 'status', 'version', 'payment_method', 'payment_date'],
+            db.select(t.c.id, t.c.id, t.c.amount, t.c.currency, t.c.status, db.literal(1), db.literal('card'),
+                      t.c.created_at).where(t.c.reference_number.like('%0'))
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--merchants', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'indexes.db')}"
+    app = make_app(database_uri)
+    now = datetime.utcnow()
+
+    with app.app_context():
+        indexes = access_path_indexes()
+        for index in indexes:
+            index.drop(db.engine, checkfirst=True)
+
+        user_ids, card_ids, merchant_ids = seed_accounts(users=args.users, merchants=args.merchants)
+        with Timer() as seed_timer:
+            seed_transactions(args.rows, user_ids, card_ids, merchant_ids, start=now, chunk_size=50000)
+            seed_side_tables()
+            analyze()
+        print(f"Seeded {args.rows:,} transactions in {seed_timer.elapsed:.1f}s ({db.engine.dialect.name})")
+
+        transaction_id = db.session.execute(db.select(Payment.transaction_id).limit(1).offset(args.rows // 20)).scalar()
+        queries = hot_queries(user_ids[len(user_ids) // 2], merchant_ids[len(merchant_ids) // 2], transaction_id, now)
+        measure('without access path indexes', queries, args.repeat)
+
+        with Timer() as build_timer:
+            for index in indexes:
+                index.create(db.engine)
+            analyze()
+        print(f"Built {len(indexes)} indexes in {build_timer.elapsed:.1f}s")
+        measure('with access path indexes', queries, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
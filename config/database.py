@@ -1,40 +1,282 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from config.settings import DATABASE_URL
-
-# Create SQLAlchemy engine
-engine = create_engine(
-    DATABASE_URL,
-    # Enable echo for debugging
-    echo=False,
-    # Set connection pool size
-    pool_size=5,
-    max_overflow=10,
-    pool_timeout=30,
-    pool_recycle=1800,
-)
-
-# Create sessionmaker
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Base class for all models
-Base = declarative_base()
-
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
+import itertools
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+from config.settings import Config
+
+# One engine serves both the Flask app (app.db) and the FastAPI routes
+# (SessionLocal, through config.dependencies). create_app() builds it
+# through Flask-SQLAlchemy with engine_options() and registers it with
+# configure_engine(); outside an app, get_engine() builds one from the
+# same settings.
+_engine = None
+_engine_lock = threading.Lock()
+
+# Read replicas, taken in turn by sessions routed with route_reads()
+_replicas = []
+_next_replica = None
+
+
+class PoolMetrics:
+    """
+    How long checkouts waited for a pooled connection, and how many timed out
+    """
+
+    def __init__(self, samples=1000):
+        self._waits = deque(maxlen=samples)  # recent waits in ms
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.peak_in_use = 0
+
+    def observe(self, wait_ms, in_use, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self.peak_in_use = max(self.peak_in_use, in_use)
+            self._waits.append(wait_ms)
+
+    def reset(self):
+        with self._lock:
+            self._waits.clear()
+            self.checkouts = self.timeouts = self.peak_in_use = 0
+            self.total_wait_ms = self.max_wait_ms = 0.0
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_ms_mean': self.total_wait_ms / max(self.checkouts + self.timeouts, 1),
+                'wait_ms_p50': waits[len(waits) // 2] if waits else 0.0,
+                'wait_ms_p99': waits[min(len(waits) - 1, int(len(waits) * 0.99))] if waits else 0.0,
+                'wait_ms_max': self.max_wait_ms,
+                'peak_in_use': self.peak_in_use
+            }
+
+
+# Create an instance of the metrics
+pool_metrics = PoolMetrics()
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited in pool_metrics
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            pool_metrics.observe((time.perf_counter() - started) * 1000, self.checkedout(), timed_out=True)
+            raise
+        pool_metrics.observe((time.perf_counter() - started) * 1000, self.checkedout())
+        return connection
+
+
+def _is_sqlite_memory(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(database_uri=None):
+    """
+    create_engine() keyword arguments for the configured pool
+    """
+    url = make_url(database_uri or Config.SQLALCHEMY_DATABASE_URI)
+    if _is_sqlite_memory(url):
+        # One shared in-memory database; pooling does not apply
+        return {}
+    options = {
+        'poolclass': MeteredQueuePool,
+        'pool_size': Config.DB_POOL_SIZE,
+        'max_overflow': Config.DB_MAX_OVERFLOW,
+        'pool_timeout': Config.DB_POOL_TIMEOUT,
+        'pool_recycle': Config.DB_POOL_RECYCLE,
+        'pool_pre_ping': url.get_backend_name() != 'sqlite'
+    }
+    if url.get_backend_name() == 'sqlite':
+        # Let connections move between request threads; busy_timeout below handles locking
+        options['connect_args'] = {'check_same_thread': False, 'timeout': Config.SQLITE_BUSY_TIMEOUT_MS / 1000}
+    return options
+
+
+def _tune_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
     try:
-        yield db
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA synchronous={Config.SQLITE_SYNCHRONOUS}')
+        cursor.execute(f'PRAGMA mmap_size={int(Config.SQLITE_MMAP_SIZE)}')
+        cursor.execute(f'PRAGMA busy_timeout={int(Config.SQLITE_BUSY_TIMEOUT_MS)}')
     finally:
-        db.close()
+        cursor.close()
+
+
+def _tune(engine):
+    if engine.dialect.name == 'sqlite' and not _is_sqlite_memory(engine.url):
+        if not event.contains(engine, 'connect', _tune_sqlite):
+            event.listen(engine, 'connect', _tune_sqlite)
+
+
+def configure_engine(engine):
+    """
+    Apply SQLite tuning to every new connection of `engine` and make it
+    the engine behind SessionLocal. Call before the engine's first connection.
+    """
+    global _engine
+    _tune(engine)
+    with _engine_lock:
+        _engine = engine
+    SessionLocal.configure(bind=engine)
+    return engine
+
+
+def configure_replicas(uris):
+    """
+    Build an engine per replica URL, pooled and tuned like the primary.
+    An empty list sends every read to the primary.
+    """
+    global _replicas, _next_replica
+    engines = []
+    for uri in uris:
+        engine = create_engine(uri, **engine_options(uri))
+        _tune(engine)
+        engines.append(engine)
+    with _engine_lock:
+        _replicas = engines
+        _next_replica = itertools.cycle(engines) if engines else None
+    return engines
+
+
+def replica_engines():
+    return list(_replicas)
+
+
+def get_engine():
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                uri = Config.SQLALCHEMY_DATABASE_URI
+                configure_engine(create_engine(uri, **engine_options(uri)))
+    return _engine
+
+
+def pool_stats(engine=None):
+    """
+    Pool gauges (size, in use, overflow) and checkout wait metrics
+    """
+    pool = (engine or get_engine()).pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'in_use': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0)
+        })
+    stats.update(pool_metrics.stats())
+    return stats
+
+
+def route_reads(session, last_write_at=None):
+    """
+    Send `session`'s reads to the next replica, unless there is none or
+    the client's last write (`last_write_at`, seconds since the epoch) was
+    under READ_YOUR_WRITES_SECONDS ago. Writes, locking reads and anything
+    after the session's first write still go to the primary.
+    Returns the replica's engine, or None if reads stay on the primary.
+    """
+    if _next_replica is None or session.info.get('wrote'):
+        return None
+    if last_write_at is not None and time.time() - last_write_at < Config.READ_YOUR_WRITES_SECONDS:
+        return None
+    with _engine_lock:
+        replica = next(_next_replica)
+    session.info['replica'] = replica
+    return replica
+
+
+def parse_last_write(value):
+    """
+    The time in the read-your-writes cookie, or None if missing or malformed
+    """
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def set_last_write(response, written_at):
+    """
+    Set the read-your-writes cookie on a Flask or FastAPI response
+    """
+    response.set_cookie(Config.READ_YOUR_WRITES_COOKIE, f'{written_at:.3f}',
+                        max_age=Config.READ_YOUR_WRITES_SECONDS, httponly=True)
+
+
+class ReplicaRoutingMixin:
+    """
+    Session.get_bind() that sends plain reads to the replica picked by
+    route_reads(), and flushes, DML, SELECT ... FOR UPDATE and every
+    statement after the session's first write to the primary
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if (replica is not None and bind is None and not self._flushing and not self.info.get('wrote')
+                and not isinstance(clause, UpdateBase) and getattr(clause, '_for_update_arg', None) is None):
+            return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class RoutingSession(ReplicaRoutingMixin, Session):
+    pass
+
+
+@event.listens_for(Session, 'after_flush')
+def _flushed(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _executed(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _committed(session):
+    # The client reads its own writes from the primary for a while; see set_last_write()
+    if session.info.get('wrote'):
+        session.info['last_write_at'] = time.time()
+        on_write = session.info.get('on_write')
+        if on_write is not None:
+            on_write(session.info['last_write_at'])
+
+
+# Create sessionmaker; bound to the shared engine by configure_engine()
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
 
 # Function to initialize the database
 def init_database():
     """
     Initialize the database by creating all tables
     """
-    Base.metadata.create_all(bind=engine)
+    from app import db
+    db.metadata.create_all(bind=get_engine())
     print("Database tables created successfully")
 
 # Function to reset the database
@@ -42,6 +284,7 @@ def reset_database():
     """
     Reset the database by dropping and recreating all tables
     """
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
-    print("Database reset successfully")
\ No newline at end of file
+    from app import db
+    db.metadata.drop_all(bind=get_engine())
+    db.metadata.create_all(bind=get_engine())
+    print("Database reset successfully")
@@ -0,0 +1,28 @@
+from fastapi import Request, Response
+from config.database import SessionLocal, get_engine, route_reads, parse_last_write, set_last_write
+from config.settings import Config
+
+# FastAPI dependencies for database sessions. They live apart from
+# config.database so the Flask app, which imports that module, does not
+# need fastapi installed.
+
+# Dependency to get DB session
+def get_db(response: Response):
+    get_engine()
+    db = SessionLocal()
+    # Committed writes send this client's reads to the primary for a while
+    db.info['on_write'] = lambda written_at: set_last_write(response, written_at)
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Dependency to get a DB session for read-only routes
+def get_read_db(request: Request):
+    get_engine()
+    db = SessionLocal()
+    route_reads(db, parse_last_write(request.cookies.get(Config.READ_YOUR_WRITES_COOKIE)))
+    try:
+        yield db
+    finally:
+        db.close()
@@ -9,6 +9,23 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///credit_card_system.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool of the shared engine (see config.database)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))  # seconds to wait for a connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # seconds
+    
+    # SQLite tuning applied to every connection (WAL is always on for file databases)
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    
+    # Read replicas for read-only views and APIs (comma separated URLs; none reads from the primary)
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    # A client that wrote within this many seconds reads from the primary, to see its own writes
+    READ_YOUR_WRITES_SECONDS = int(os.environ.get('READ_YOUR_WRITES_SECONDS', 10))
+    READ_YOUR_WRITES_COOKIE = 'last_write_at'
+    
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(days=1)
     
@@ -22,4 +39,113 @@ class Config:
     ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY', 'default_encryption_key_32bytes_lng')
     
     # Fraud detection threshold (0-100, higher is more strict)
-    FRAUD_DETECTION_THRESHOLD = 75
\ No newline at end of file
+    FRAUD_DETECTION_THRESHOLD = 75
+    
+    # Per-user anomaly model cache
+    FRAUD_MODEL_CACHE_MAX_BYTES = int(os.environ.get('FRAUD_MODEL_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    FRAUD_MODEL_REFIT_AFTER = int(os.environ.get('FRAUD_MODEL_REFIT_AFTER', 10))  # new transactions
+    FRAUD_MODEL_TTL_SECONDS = int(os.environ.get('FRAUD_MODEL_TTL_SECONDS', 3600))
+    FRAUD_MODEL_REFIT_BACKOFF_SECONDS = int(os.environ.get('FRAUD_MODEL_REFIT_BACKOFF_SECONDS', 300))  # after a failed refit
+    
+    # Seconds between checks for fraud rule changes made by other processes
+    FRAUD_RULES_REFRESH_SECONDS = int(os.environ.get('FRAUD_RULES_REFRESH_SECONDS', 5))
+    
+    # Out-of-request fraud scoring, opt-in (pool size 0 scores inline on the request thread).
+    # Not used for single-commit payments, whose rows don't exist yet for a late score to land on.
+    FRAUD_SCORING_POOL_SIZE = int(os.environ.get('FRAUD_SCORING_POOL_SIZE', 0))
+    FRAUD_SCORING_QUEUE_DEPTH = int(os.environ.get('FRAUD_SCORING_QUEUE_DEPTH', 64))
+    FRAUD_SCORING_TIMEOUT_MS = int(os.environ.get('FRAUD_SCORING_TIMEOUT_MS', 50))
+    
+    # Velocity counters per card, user and merchant
+    VELOCITY_MAX_KEYS = int(os.environ.get('VELOCITY_MAX_KEYS', 100000))  # per counter
+    VELOCITY_CARD_LIMIT_1M = int(os.environ.get('VELOCITY_CARD_LIMIT_1M', 3))
+    VELOCITY_USER_LIMIT_1H = int(os.environ.get('VELOCITY_USER_LIMIT_1H', 10))
+    VELOCITY_MERCHANT_SPIKE_MIN = int(os.environ.get('VELOCITY_MERCHANT_SPIKE_MIN', 20))
+    VELOCITY_MERCHANT_SPIKE_FACTOR = float(os.environ.get('VELOCITY_MERCHANT_SPIKE_FACTOR', 3))
+    VELOCITY_SNAPSHOT_PATH = os.environ.get('VELOCITY_SNAPSHOT_PATH', 'velocity_snapshot.json')
+    
+    # Weight of the anomaly score when blending with the rule score (rules get the rest)
+    FRAUD_ANOMALY_WEIGHT = float(os.environ.get('FRAUD_ANOMALY_WEIGHT', 0.6))
+    
+    # Global fraud model trained offline over all transactions
+    FRAUD_MODEL_DIR = os.environ.get('FRAUD_MODEL_DIR', 'models/fraud')
+    FRAUD_MODEL_MAX_TRAINING_SAMPLES = int(os.environ.get('FRAUD_MODEL_MAX_TRAINING_SAMPLES', 500000))
+    FRAUD_MODEL_CONTAMINATION = float(os.environ.get('FRAUD_MODEL_CONTAMINATION', 0.05))
+    FRAUD_MODEL_RETRAIN_SECONDS = int(os.environ.get('FRAUD_MODEL_RETRAIN_SECONDS', 24 * 3600))  # 0 disables
+    FRAUD_MODEL_LEASE_SECONDS = int(os.environ.get('FRAUD_MODEL_LEASE_SECONDS', 600))  # the retraining process's lease
+    
+    # Batch payment ingestion
+    PAYMENT_BATCH_MAX_ITEMS = int(os.environ.get('PAYMENT_BATCH_MAX_ITEMS', 10000))
+    PAYMENT_BATCH_CHUNK_SIZE = int(os.environ.get('PAYMENT_BATCH_CHUNK_SIZE', 1000))  # rows per commit
+    
+    # Single-commit payments: score and decide before writing the row once
+    PAYMENT_SINGLE_COMMIT = os.environ.get('PAYMENT_SINGLE_COMMIT', 'false').lower() in ('1', 'true', 'yes')
+    PAYMENT_JOURNAL_DIR = os.environ.get('PAYMENT_JOURNAL_DIR', 'journal')
+    PAYMENT_JOURNAL_FSYNC = os.environ.get('PAYMENT_JOURNAL_FSYNC', 'true').lower() in ('1', 'true', 'yes')
+    PAYMENT_JOURNAL_COMPACT_BYTES = int(os.environ.get('PAYMENT_JOURNAL_COMPACT_BYTES', 1024 * 1024))
+    
+    # Reference numbers: worker ids are leased from the database and renewed in the background
+    REFERENCE_LEASE_TTL_SECONDS = int(os.environ.get('REFERENCE_LEASE_TTL_SECONDS', 30))
+    
+    # Idempotency keys for payment and refund requests
+    IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 24 * 3600))
+    IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 100000))  # keys kept in memory
+    IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 30))  # then reported as stale, never rerun
+    IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 10))
+    
+    # Card acquirer: 'simulated' in process, or 'http' to call ACQUIRER_URL
+    ACQUIRER_BACKEND = os.environ.get('ACQUIRER_BACKEND', 'simulated')
+    ACQUIRER_URL = os.environ.get('ACQUIRER_URL', 'http://127.0.0.1:8099')
+    ACQUIRER_MAX_CONNECTIONS = int(os.environ.get('ACQUIRER_MAX_CONNECTIONS', 100))  # also the in-flight limit
+    ACQUIRER_TIMEOUT_MS = int(os.environ.get('ACQUIRER_TIMEOUT_MS', 2000))
+    ACQUIRER_CONNECT_TIMEOUT_MS = int(os.environ.get('ACQUIRER_CONNECT_TIMEOUT_MS', 500))
+    
+    # Circuit breaker per acquirer: opens on a high failure or slow-call rate and fails fast while open
+    ACQUIRER_BREAKER_ENABLED = os.environ.get('ACQUIRER_BREAKER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    ACQUIRER_BREAKER_WINDOW_SECONDS = int(os.environ.get('ACQUIRER_BREAKER_WINDOW_SECONDS', 5))
+    ACQUIRER_BREAKER_MIN_CALLS = int(os.environ.get('ACQUIRER_BREAKER_MIN_CALLS', 20))
+    ACQUIRER_BREAKER_FAILURE_RATE = float(os.environ.get('ACQUIRER_BREAKER_FAILURE_RATE', 0.5))
+    ACQUIRER_BREAKER_SLOW_CALL_MS = int(os.environ.get('ACQUIRER_BREAKER_SLOW_CALL_MS', 1000))
+    ACQUIRER_BREAKER_SLOW_CALL_RATE = float(os.environ.get('ACQUIRER_BREAKER_SLOW_CALL_RATE', 0.5))
+    ACQUIRER_BREAKER_OPEN_SECONDS = float(os.environ.get('ACQUIRER_BREAKER_OPEN_SECONDS', 5))
+    ACQUIRER_BREAKER_HALF_OPEN_CALLS = int(os.environ.get('ACQUIRER_BREAKER_HALF_OPEN_CALLS', 5))
+    
+    # Hedged authorizations: send a second attempt once the first passes this latency percentile.
+    # Only allowed when the acquirer is known to deduplicate requests on their reference.
+    ACQUIRER_HEDGE_ENABLED = os.environ.get('ACQUIRER_HEDGE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    ACQUIRER_DEDUPES_REFERENCE = os.environ.get('ACQUIRER_DEDUPES_REFERENCE', 'false').lower() in ('1', 'true', 'yes')
+    ACQUIRER_HEDGE_PERCENTILE = float(os.environ.get('ACQUIRER_HEDGE_PERCENTILE', 95))
+    ACQUIRER_HEDGE_MIN_MS = int(os.environ.get('ACQUIRER_HEDGE_MIN_MS', 10))
+    ACQUIRER_HEDGE_MAX_RATIO = float(os.environ.get('ACQUIRER_HEDGE_MAX_RATIO', 0.1))  # hedges as a share of calls
+    
+    # Refunds whose acquirer outcome is unknown (timeout, error) stay pending until reconciled after this long
+    REFUND_RECONCILE_AFTER_SECONDS = int(os.environ.get('REFUND_RECONCILE_AFTER_SECONDS', 300))
+    
+    # Payments whose acquirer outcome is unknown stay pending, and are confirmed or voided after this long
+    PAYMENT_RECONCILE_AFTER_SECONDS = int(os.environ.get('PAYMENT_RECONCILE_AFTER_SECONDS', 300))
+    
+    # Settlement: completed payments and refunds are paid out per merchant per window
+    SETTLEMENT_WINDOW_HOURS = int(os.environ.get('SETTLEMENT_WINDOW_HOURS', 24))
+    SETTLEMENT_CHUNK_SIZE = int(os.environ.get('SETTLEMENT_CHUNK_SIZE', 5000))  # rows per commit
+    
+    # Archival: final transactions older than this move from the transactions table to monthly Parquet files
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive/transactions')
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 50000))  # rows per file and commit
+    ARCHIVE_COMPRESSION = os.environ.get('ARCHIVE_COMPRESSION', 'zstd')
+    
+    # Exports: CSV/NDJSON streamed from a server-side cursor this many rows at a time
+    EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 5000))
+    EXPORT_GZIP_LEVEL = int(os.environ.get('EXPORT_GZIP_LEVEL', 1))  # 1 (fastest) to 9 (smallest)
+    
+    # Merchant summaries cached per process; dropped when a merchant is updated here, or after the TTL
+    MERCHANT_CACHE_SIZE = int(os.environ.get('MERCHANT_CACHE_SIZE', 10000))
+    MERCHANT_CACHE_TTL_SECONDS = int(os.environ.get('MERCHANT_CACHE_TTL_SECONDS', 300))
+    
+    # Transaction listings: keyset pages of (created_at, id); NDJSON streams fetch this many rows per query
+    TRANSACTION_PAGE_SIZE = int(os.environ.get('TRANSACTION_PAGE_SIZE', 50))
+    TRANSACTION_PAGE_MAX = int(os.environ.get('TRANSACTION_PAGE_MAX', 500))  # largest ?limit accepted by the APIs
+    TRANSACTION_STREAM_BATCH_SIZE = int(os.environ.get('TRANSACTION_STREAM_BATCH_SIZE', 1000))
+    
+    # Admin dashboard counters: each is split over this many rows to spread concurrent updates
+    STATS_COUNTER_SHARDS = int(os.environ.get('STATS_COUNTER_SHARDS', 8))
@@ -1,10 +1,10 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, abort, Response, stream_with_context
 from flask_login import LoginManager, login_required, current_user, login_user, logout_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 
-from app import create_app
+from app import create_app, db
 from app.models.user import User
 from app.models.merchant import Merchant
 from app.models.transaction import Transaction
@@ -14,8 +14,13 @@ from app.controllers.payment_controller import payment_bp
 from app.controllers.fraud_controller import fraud_bp
 from app.controllers.admin_controller import admin_bp
 from app.services.authentication import init_login_manager
+from app.services.archive import transaction_archive
+from app.services.export import export_service
+from app.services.merchant_cache import merchant_cache
+from app.utils.pagination import ndjson_lines
 from app.utils.init_data import initialize_demo_data
-from config.database import db
+from app.utils.replicas import reads_from_replica
+from config.settings import Config
 
 # Create the Flask application
 app = create_app()
@@ -37,12 +42,11 @@ def index():
 
 @app.route('/dashboard')
 @login_required
+@reads_from_replica
 def dashboard():
     # Get recent transactions
-    if current_user.role == 'admin':
-        transactions = Transaction.query.order_by(Transaction.created_at.desc()).limit(10).all()
-    else:
-        transactions = Transaction.query.filter_by(user_id=current_user.id).order_by(Transaction.created_at.desc()).limit(10).all()
+    user_id = None if current_user.role == 'admin' else current_user.id
+    transactions = Transaction.history_query(user_id).limit(10).all()
     
     # Calculate statistics
     total_transactions = len(transactions)
@@ -57,39 +61,79 @@ def dashboard():
         'success_rate': round(success_rate, 2)
     }
     
-    # Convert transaction objects to dictionaries with merchant name
+    # Convert transaction objects to dictionaries with merchant name (loaded with the transactions)
     transaction_dicts = []
     for t in transactions:
-        merchant = Merchant.query.get(t.merchant_id)
         transaction_dict = t.to_dict()
-        transaction_dict['merchant_name'] = merchant.name if merchant else 'Unknown'
+        transaction_dict['merchant_name'] = t.merchant_name
         transaction_dicts.append(transaction_dict)
     
     return render_template('dashboard.html', user=current_user, transactions=transaction_dicts, stats=stats)
 
 @app.route('/transactions')
 @login_required
+@reads_from_replica
 def transactions():
-    # Get all transactions
-    if current_user.role == 'admin':
-        transactions = Transaction.query.order_by(Transaction.created_at.desc()).all()
-    else:
-        transactions = Transaction.query.filter_by(user_id=current_user.id).order_by(Transaction.created_at.desc()).all()
+    # Newest first, one page per request; ?cursor= continues after the previous page,
+    # and on into archived transactions once the table runs out
+    user_id = None if current_user.role == 'admin' else current_user.id
     
-    # Convert transaction objects to dictionaries with merchant name
+    try:
+        # ?format=ndjson streams every transaction instead of rendering a page
+        if request.args.get('format') == 'ndjson':
+            pages = transaction_archive.history_pages(user_id, request.args.get('cursor'),
+                                                      Config.TRANSACTION_STREAM_BATCH_SIZE)
+            return Response(stream_with_context(ndjson_lines(pages)), mimetype='application/x-ndjson')
+        
+        transactions, next_cursor = transaction_archive.history_page(user_id, request.args.get('cursor'),
+                                                                     Config.TRANSACTION_PAGE_SIZE)
+    except ValueError:
+        abort(400)
+    
+    # Convert transaction objects to dictionaries with merchant name (loaded with the transactions)
     transaction_dicts = []
     for t in transactions:
-        merchant = Merchant.query.get(t.merchant_id)
         transaction_dict = t.to_dict()
-        transaction_dict['merchant_name'] = merchant.name if merchant else 'Unknown'
+        transaction_dict['merchant_name'] = t.merchant_name
         transaction_dicts.append(transaction_dict)
     
-    return render_template('transactions.html', user=current_user, transactions=transaction_dicts)
+    return render_template('transactions.html', user=current_user, transactions=transaction_dicts,
+                           next_cursor=next_cursor)
+
+@app.route('/transactions/export')
+@login_required
+@reads_from_replica
+def export_transactions():
+    # Every matching transaction (archived ones first) as ?format=csv or ndjson, ?gzip=1 to compress,
+    # filtered by ?merchant_id=, ?status= and ?start=/?end= (ISO dates); streamed, never held in memory
+    user_id = None if current_user.role == 'admin' else current_user.id
+    fmt = request.args.get('format', 'csv')
+    compress = request.args.get('gzip') == '1'
+    
+    try:
+        start, end = (datetime.fromisoformat(request.args[name]) if request.args.get(name) else None
+                      for name in ('start', 'end'))
+        chunks = export_service.export('transactions', fmt, compress, user_id=user_id,
+                                       merchant_id=request.args.get('merchant_id'), start=start, end=end,
+                                       status=request.args.get('status'), bind=db.session.get_bind())
+    except ValueError:
+        abort(400)
+    
+    response = Response(stream_with_context(chunks), mimetype=export_service.media_type(fmt, compress))
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename="{export_service.filename("transactions", fmt, compress)}"'
+    return response
 
 @app.route('/transactions/<transaction_id>')
 @login_required
+@reads_from_replica
 def transaction_detail(transaction_id):
-    transaction = Transaction.query.get_or_404(transaction_id)
+    # By id or reference number, from the table or else the archive
+    transaction = db.session.get(Transaction, transaction_id) \
+        or Transaction.query.filter_by(reference_number=transaction_id).first() \
+        or transaction_archive.get(transaction_id)
+    if transaction is None:
+        abort(404)
     
     # Check if user has permission to view this transaction
     if current_user.role != 'admin' and transaction.user_id != current_user.id:
@@ -97,12 +141,12 @@ def transaction_detail(transaction_id):
         return redirect(url_for('dashboard'))
     
     # Get associated data
-    merchant = Merchant.query.get(transaction.merchant_id)
-    payment = Payment.query.filter_by(transaction_id=transaction_id).first()
+    merchant = merchant_cache.get(transaction.merchant_id)
+    payment = Payment.query.filter_by(transaction_id=transaction.id).first()
     
     # Convert to dictionary
     transaction_dict = transaction.to_dict()
-    transaction_dict['merchant_name'] = merchant.name if merchant else 'Unknown'
+    transaction_dict['merchant_name'] = merchant['name'] if merchant else 'Unknown'
     
     return render_template('transaction_detail.html', 
                           transaction=transaction_dict,
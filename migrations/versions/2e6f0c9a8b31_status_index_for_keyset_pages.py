@@ -0,0 +1,43 @@
+"""status index for keyset pages
+
+Extends the status index with id, so status-filtered listings paged by
+(created_at, id) seek straight to the next page.
+
+Revision ID: 2e6f0c9a8b31
+Revises: 9b7d3f12c6a4
+Create Date: 2026-10-17 21:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e6f0c9a8b31'
+down_revision = '9b7d3f12c6a4'
+branch_labels = None
+depends_on = None
+
+
+def _existing():
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('transactions')}
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        if 'ix_transactions_status_created_at_id' not in _existing():
+            op.create_index('ix_transactions_status_created_at_id', 'transactions', ['status', 'created_at', 'id'],
+                            postgresql_concurrently=True)
+        if 'ix_transactions_status_created_at' in _existing():
+            op.drop_index('ix_transactions_status_created_at', table_name='transactions',
+                          postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        if 'ix_transactions_status_created_at' not in _existing():
+            op.create_index('ix_transactions_status_created_at', 'transactions', ['status', 'created_at'],
+                            postgresql_concurrently=True)
+        if 'ix_transactions_status_created_at_id' in _existing():
+            op.drop_index('ix_transactions_status_created_at_id', table_name='transactions',
+                          postgresql_concurrently=True)
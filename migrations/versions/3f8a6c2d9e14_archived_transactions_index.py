@@ -0,0 +1,55 @@
+"""archived transactions index
+
+The Parquet files archived transactions moved to, and which file each
+one is in. `flask archive-transactions` moves rows out of the
+transactions table and fills them.
+
+Revision ID: 3f8a6c2d9e14
+Revises: 7a4d1e5b9c20
+Create Date: 2026-10-18 01:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a6c2d9e14'
+down_revision = '7a4d1e5b9c20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('archive_files'):
+        op.create_table(
+            'archive_files',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('path', sa.String(length=100), nullable=False),
+            sa.Column('month', sa.String(length=7), nullable=False),
+            sa.Column('row_count', sa.Integer(), nullable=False),
+            sa.Column('min_created_at', sa.DateTime(), nullable=False),
+            sa.Column('max_created_at', sa.DateTime(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('path')
+        )
+        op.create_index('ix_archive_files_max_created_at', 'archive_files', ['max_created_at'])
+    if not inspector.has_table('archived_transactions'):
+        op.create_table(
+            'archived_transactions',
+            sa.Column('id', sa.String(length=36), nullable=False),
+            sa.Column('reference_number', sa.String(length=20), nullable=False),
+            sa.Column('file_id', sa.Integer(), nullable=False),
+            sa.Column('row_group', sa.SmallInteger(), nullable=False),
+            sa.ForeignKeyConstraint(['file_id'], ['archive_files.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('reference_number')
+        )
+
+
+def downgrade():
+    op.drop_table('archived_transactions')
+    op.drop_index('ix_archive_files_max_created_at', table_name='archive_files')
+    op.drop_table('archive_files')
@@ -0,0 +1,69 @@
+"""transaction ledger columns
+
+Brings databases whose tables were created by db.create_all() before the
+settlement, refund ledger and state machine columns existed up to date.
+Columns that are already there are left alone, so this also applies
+cleanly to databases created from the current models.
+
+Revision ID: 5c2e8a41d7f0
+Revises:
+Create Date: 2026-10-17 19:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2e8a41d7f0'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # Batch mode, as SQLite can only add the foreign keys by rebuilding the table
+    transactions = _columns('transactions')
+    with op.batch_alter_table('transactions') as batch_op:
+        if 'settlement_batch_id' not in transactions:
+            batch_op.add_column(sa.Column('settlement_batch_id', sa.String(length=36), nullable=True))
+            batch_op.create_foreign_key('fk_transactions_settlement_batch_id', 'settlement_batches',
+                                        ['settlement_batch_id'], ['id'])
+        if 'original_transaction_id' not in transactions:
+            batch_op.add_column(sa.Column('original_transaction_id', sa.String(length=36), nullable=True))
+            batch_op.create_foreign_key('fk_transactions_original_transaction_id', 'transactions',
+                                        ['original_transaction_id'], ['id'])
+        if 'refunded_total' not in transactions:
+            batch_op.add_column(sa.Column('refunded_total', sa.Float(), nullable=False, server_default='0'))
+        if 'version' not in transactions:
+            batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+    indexes = _indexes('transactions')
+    if 'ix_transactions_settlement_batch_id' not in indexes:
+        op.create_index('ix_transactions_settlement_batch_id', 'transactions', ['settlement_batch_id'])
+    if 'ix_transactions_original_transaction_id' not in indexes:
+        op.create_index('ix_transactions_original_transaction_id', 'transactions', ['original_transaction_id'])
+
+    if 'version' not in _columns('payments'):
+        op.add_column('payments', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('payments', 'version')
+    op.drop_index('ix_transactions_original_transaction_id', table_name='transactions')
+    op.drop_index('ix_transactions_settlement_batch_id', table_name='transactions')
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.drop_constraint('fk_transactions_original_transaction_id', type_='foreignkey')
+        batch_op.drop_constraint('fk_transactions_settlement_batch_id', type_='foreignkey')
+        batch_op.drop_column('version')
+        batch_op.drop_column('refunded_total')
+        batch_op.drop_column('original_transaction_id')
+        batch_op.drop_column('settlement_batch_id')
@@ -0,0 +1,37 @@
+"""transaction counters
+
+Counters behind the admin dashboard. Run `flask reconcile-stats --fix`
+once after upgrading to fill them from the existing transactions.
+
+Revision ID: 7a4d1e5b9c20
+Revises: 2e6f0c9a8b31
+Create Date: 2026-10-17 22:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4d1e5b9c20'
+down_revision = '2e6f0c9a8b31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('transaction_counters'):
+        return
+    op.create_table(
+        'transaction_counters',
+        sa.Column('granularity', sa.String(length=5), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('shard', sa.Integer(), nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('granularity', 'bucket_start', 'status', 'shard')
+    )
+
+
+def downgrade():
+    op.drop_table('transaction_counters')
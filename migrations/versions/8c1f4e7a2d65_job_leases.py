@@ -0,0 +1,38 @@
+"""job leases
+
+Leases that elect the one process running a background job, such as
+retraining the global fraud model.
+
+Revision ID: 8c1f4e7a2d65
+Revises: 3f8a6c2d9e14
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1f4e7a2d65'
+down_revision = '3f8a6c2d9e14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('job_leases'):
+        return
+    op.create_table(
+        'job_leases',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('owner', sa.String(length=32), nullable=False),
+        sa.Column('hostname', sa.String(length=255), nullable=True),
+        sa.Column('pid', sa.Integer(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('acquired_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('job_leases')
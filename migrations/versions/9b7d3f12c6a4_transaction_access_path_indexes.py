@@ -0,0 +1,53 @@
+"""transaction access path indexes
+
+Composite indexes for the queries that hit the transaction tables on
+every request: a user's or merchant's history newest first, status queues
+and counts, time range counts, and the payment and dispute lookups by
+transaction. See benchmarks/transaction_indexes.py for the plans and
+latencies before and after.
+
+On PostgreSQL the indexes are built CONCURRENTLY, outside the migration's
+transaction, so payments keep being written while they build.
+
+Revision ID: 9b7d3f12c6a4
+Revises: 5c2e8a41d7f0
+Create Date: 2026-10-17 19:45:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b7d3f12c6a4'
+down_revision = '5c2e8a41d7f0'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_transactions_user_id_created_at', 'transactions', ['user_id', 'created_at', 'id']),
+    ('ix_transactions_merchant_id_created_at', 'transactions', ['merchant_id', 'created_at']),
+    ('ix_transactions_status_created_at', 'transactions', ['status', 'created_at']),
+    ('ix_transactions_created_at', 'transactions', ['created_at', 'id']),
+    ('ix_payments_transaction_id', 'payments', ['transaction_id']),
+    ('ix_disputes_transaction_id', 'disputes', ['transaction_id']),
+]
+
+
+def _existing(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            if name not in _existing(table):
+                op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            if name in _existing(table):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,15 @@
+import pytest
+
+from app import db
+from benchmarks.common import make_app
+
+
+@pytest.fixture
+def app():
+    """
+    A bare app on a fresh in-memory SQLite database, inside its app context
+    """
+    app = make_app('sqlite://')
+    with app.app_context():
+        yield app
+        db.session.remove()
@@ -0,0 +1,31 @@
+import random
+from datetime import datetime
+
+from app.models.transaction import Transaction
+from app.services.feature_store import FeatureStore
+from app.services.fraud_detection import FraudDetectionService
+from app.services.fraud_model_cache import fraud_model_cache
+from benchmarks.common import seed_accounts, seed_transactions
+
+
+def test_analyze_batch_matches_row_by_row_scoring(app):
+    user_ids, card_ids, merchant_ids = seed_accounts(users=20)
+    seed_transactions(2000, user_ids, card_ids, merchant_ids, start=datetime(2024, 6, 1), seed=3)
+    FeatureStore.rebuild()
+
+    rng = random.Random(7)
+    batch = []
+    for _ in range(300):
+        user_id = rng.choice(user_ids)
+        batch.append(Transaction(user_id=user_id, merchant_id=merchant_ids[0], card_id=card_ids[user_id],
+                                 amount=rng.choice([round(rng.lognormvariate(3.5, 1.5), 2),
+                                                    float(rng.randint(1, 3000))])))
+    now = datetime(2024, 6, 1, 14, 30)
+
+    fraud_model_cache.clear()
+    row_scores = [FraudDetectionService.analyze_transaction(t, t.user_id, now) for t in batch]
+    fraud_model_cache.clear()
+    batch_scores = FraudDetectionService.analyze_batch(batch, now)
+
+    assert len(set(row_scores)) > 1  # the fixed data exercises more than one outcome
+    assert batch_scores == row_scores
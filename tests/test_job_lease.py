@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.models.job_lease import JobLease
+from app.services.job_lease import JobLeases
+
+
+def test_one_process_holds_a_job_lease_until_it_expires(app):
+    first, second = JobLeases(), JobLeases()
+
+    assert first.hold('retrain', 60)
+    assert not second.hold('retrain', 60)
+    # The holder renews its own lease
+    assert first.hold('retrain', 60)
+    # Other jobs are leased independently
+    assert second.hold('export', 60)
+
+    db.session.query(JobLease).filter_by(name='retrain').update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    assert second.hold('retrain', 60)
+    assert not first.hold('retrain', 60)
+
+    second.release('retrain')
+    assert first.hold('retrain', 60)
@@ -0,0 +1,39 @@
+import pytest
+
+from app import db
+from app.models.merchant import Merchant
+from app.services.merchant_cache import merchant_cache
+from benchmarks.common import seed_accounts, seed_transactions
+from benchmarks.merchant_queries import StatementCounter, joined_page
+
+
+@pytest.fixture
+def accounts(app):
+    user_ids, card_ids, merchant_ids = seed_accounts(users=20, merchants=50)
+    seed_transactions(500, user_ids, card_ids, merchant_ids)
+    db.session.remove()
+    return merchant_ids
+
+
+@pytest.mark.parametrize('size', [1, 10, 100, 500])
+def test_history_page_is_one_statement(accounts, size):
+    with StatementCounter(db.engine) as counter:
+        rows = joined_page(size)
+    assert len(rows) == size
+    assert all(name != 'Unknown' for _, name in rows)
+    assert counter.count == 1
+
+
+def test_cached_merchant_lookup_is_no_statement_and_dropped_on_update(accounts):
+    # Updates invalidate the module's cache, so use it rather than a fresh one
+    merchant_cache.clear()
+    merchant_id = accounts[0]
+    merchant_cache.get(merchant_id)
+    with StatementCounter(db.engine) as counter:
+        merchant_cache.get(merchant_id)
+    assert counter.count == 0
+
+    db.session.get(Merchant, merchant_id).business_name = 'Renamed Merchant'
+    db.session.commit()
+    assert merchant_cache.get(merchant_id)['name'] == 'Renamed Merchant'
+    merchant_cache.clear()
@@ -0,0 +1,92 @@
+import pytest
+
+from app import db
+from app.models.archive import ArchiveFile  # noqa: F401 (reads of transactions check the archive)
+from app.models.transaction import Transaction
+from app.services.acquirer import AcquirerClient, acquirer
+from app.services.payment_gateway import PaymentGateway
+from benchmarks.common import seed_accounts
+from config.settings import Config
+
+
+class ScriptedAcquirer(AcquirerClient):
+    """Answers authorizations with the given statuses in turn and approves every void"""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.voided = []
+
+    async def authorize(self, request):
+        status = self.statuses.pop(0)
+        return {'approved': status == 'approved', 'status': status}
+
+    async def void(self, request):
+        self.voided.append(request['reference'])
+        return {'approved': True, 'status': 'approved'}
+
+
+@pytest.fixture
+def scripted(monkeypatch):
+    def install(*statuses):
+        client = ScriptedAcquirer(statuses)
+        acquirer.set_client(client)
+        return client
+
+    monkeypatch.setattr(Config, 'FRAUD_DETECTION_THRESHOLD', 101)
+    yield install
+    acquirer.set_client(None)
+
+
+def test_unknown_batch_outcomes_stay_pending_until_voided(app, scripted, monkeypatch):
+    user_ids, card_ids, merchant_ids = seed_accounts(users=3, merchants=1)
+    client = scripted('approved', 'declined', 'timeout')
+    charges = [{'user_id': user_id, 'card_id': card_ids[user_id], 'amount': 10} for user_id in user_ids]
+
+    result = PaymentGateway.process_payments_batch(merchant_ids[0], charges)
+
+    assert [r['status'] for r in result['results']] == ['completed', 'failed', 'pending']
+    pending_id = result['results'][2]['transaction_id']
+    assert db.session.get(Transaction, pending_id).status == 'pending'
+
+    # Not old enough yet
+    assert PaymentGateway.reconcile_pending_payments()['checked'] == 0
+
+    monkeypatch.setattr(Config, 'ACQUIRER_DEDUPES_REFERENCE', False)
+    report = PaymentGateway.reconcile_pending_payments(older_than_seconds=0)
+    assert report == {'checked': 1, 'completed': 0, 'failed': 1, 'pending': 0}
+    assert client.voided == [result['results'][2]['reference']]
+    assert db.session.get(Transaction, pending_id).status == 'failed'
+
+
+def test_reconcile_confirms_pending_payments_with_a_deduplicating_acquirer(app, scripted, monkeypatch):
+    user_ids, card_ids, merchant_ids = seed_accounts(users=1, merchants=1)
+    scripted('error', 'unavailable', 'approved')
+    monkeypatch.setattr(Config, 'ACQUIRER_DEDUPES_REFERENCE', True)
+
+    result = PaymentGateway.process_payment(user_ids[0], merchant_ids[0], card_ids[user_ids[0]], 25)
+    assert result['status'] == 'pending'
+
+    # An open circuit says nothing about the first attempt, so the payment stays pending
+    assert PaymentGateway.reconcile_pending_payments(older_than_seconds=0)['pending'] == 1
+    assert PaymentGateway.reconcile_pending_payments(older_than_seconds=0)['completed'] == 1
+    assert Transaction.query.filter_by(reference_number=result['reference']).one().status == 'completed'
+
+
+def test_a_failure_after_authorizing_keeps_the_idempotency_key(app, scripted, monkeypatch):
+    from app.services.state_machine import transaction_states
+
+    user_ids, card_ids, merchant_ids = seed_accounts(users=1, merchants=1)
+    client = scripted('approved', 'approved')
+
+    def lost_commit(entity, status, **values):
+        raise RuntimeError('database went away')
+
+    monkeypatch.setattr(transaction_states, 'apply', lost_commit)
+    args = (user_ids[0], merchant_ids[0], card_ids[user_ids[0]], 30)
+    first = PaymentGateway.process_payment(*args, idempotency_key='once')
+    assert first['status'] == 'pending'
+
+    # The retry replays the stored result instead of authorizing again
+    replay = PaymentGateway.process_payment(*args, idempotency_key='once')
+    assert replay['idempotent_replay'] and replay['reference'] == first['reference']
+    assert client.statuses == ['approved']
@@ -0,0 +1,47 @@
+from app import db
+from app.models.transaction import Transaction
+from benchmarks.common import make_app, seed_accounts
+from benchmarks.state_machine_contention import ILLEGAL, hammer, make_transaction, reject_illegal
+
+
+def test_concurrent_transitions_lose_no_updates(tmp_path):
+    app = make_app(f"sqlite:///{tmp_path / 'states.db'}")
+    with app.app_context():
+        user_ids, card_ids, merchant_ids = seed_accounts(users=1, merchants=1)
+        transaction_id, start_version = make_transaction(user_ids[0], card_ids[user_ids[0]], merchant_ids[0])
+        db.session.remove()
+
+    counts, _, _ = hammer(app, transaction_id, threads=8, attempts=25)
+
+    with app.app_context():
+        transaction = db.session.get(Transaction, transaction_id)
+        assert counts['applied'] > 0
+        assert counts['illegal'] == 0
+        # Every transition that reported success bumped the version exactly once
+        assert transaction.version == start_version + counts['applied']
+
+        assert reject_illegal(transaction_id) == len(ILLEGAL)
+        assert db.session.get(Transaction, transaction_id).version == transaction.version
+        db.session.remove()
+
+
+def test_transition_reads_created_at_from_the_update(app):
+    from app.services.state_machine import transaction_states
+
+    user_ids, card_ids, merchant_ids = seed_accounts(users=1, merchants=1)
+    transaction_id, version = make_transaction(user_ids[0], card_ids[user_ids[0]], merchant_ids[0])
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    db.event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        assert transaction_states.transition(transaction_id, 'flagged_for_fraud', expected_status='completed',
+                                             expected_version=version) == version + 1
+    finally:
+        db.event.remove(db.engine, 'before_cursor_execute', count)
+    # The UPDATE, then the counters; no SELECT of the row in between
+    assert statements[0].lstrip().upper().startswith('UPDATE TRANSACTIONS')
+    assert not any(s.lstrip().upper().startswith('SELECT') for s in statements)
+    db.session.commit()